@@ -1,24 +1,64 @@
-from fastapi import APIRouter, HTTPException
-from app.services import yolo_service
-from app.models.schemas import DetectionRequest, DetectionResponse, SegmentResult
+from fastapi import APIRouter, BackgroundTasks, File, Form, HTTPException, Query, Request, UploadFile
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import StreamingResponse
+from pydantic import ValidationError
+from app.config import UPLOAD_DIR, INFERENCE_BATCH_MAX_SIZE
+from app.services import yolo_service, file_service
+from app.services.inference_executor import (
+    InferenceQueueFullError, run_inference, get_inference_executor
+)
+from app.services.worker_pool import get_worker_pool, worker_pool_enabled
+from app.services.image_cache import get_image_cache
+from app.services.result_encoding import (
+    ResultFormatError, negotiate_format, result_to_columns, encode_response
+)
+from app.models.schemas import DetectionRequest, DetectionResponse, SegmentResult, BatchDetectionRequest
 from pathlib import Path
+from typing import Any, AsyncIterator, Callable, List, Optional, Tuple
+import asyncio
+import json
+import time
 
 router = APIRouter(tags=["瑕疵检测"])
 
+def _queue_full(e: InferenceQueueFullError) -> HTTPException:
+    """推理队列已满时快速返回503，让客户端稍后重试"""
+    return HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+
+def _response_format(http_request: Optional[Request], requested: Optional[str]) -> str:
+    """协商结果格式（json / compact / msgpack），不支持时返回406"""
+    try:
+        accept = http_request.headers.get("accept") if http_request is not None else None
+        return negotiate_format(accept, requested)
+    except ResultFormatError as e:
+        raise HTTPException(status_code=406, detail=str(e))
+
 @router.post("/detect", response_model=DetectionResponse)
-async def detect_defects(request: DetectionRequest):
-    """检测图片中的瑕疵"""
+async def detect_defects(request: DetectionRequest, http_request: Request = None,
+                         response_format: Optional[str] = Query(None, alias="format")):
+    """检测图片中的瑕疵
+    
+    默认返回JSON；format=compact/msgpack（或对应的Accept头）返回列式紧凑格式
+    """
+    fmt = _response_format(http_request, response_format)
     try:
         image_path = Path(request.image_path)
         if not image_path.exists():
             raise HTTPException(status_code=404, detail="图片文件不存在")
         
-        result = yolo_service.YoloService.detect(str(image_path))
+        result = await run_inference(
+            yolo_service.YoloService.detect, str(image_path),
+            model_id=request.model_id, tiled=request.tiled, raw=fmt != "json"
+        )
         
+        if fmt != "json":
+            return encode_response({"success": True, "result": result_to_columns(result, fmt)}, fmt)
         return DetectionResponse(
             success=True,
             result=result
         )
+    except InferenceQueueFullError as e:
+        raise _queue_full(e)
     except Exception as e:
         return DetectionResponse(
             success=False,
@@ -26,7 +66,8 @@ async def detect_defects(request: DetectionRequest):
         )
 
 @router.get("/detect/{filename}")
-async def detect_by_filename(filename: str):
+async def detect_by_filename(http_request: Request, filename: str, model_id: Optional[str] = None,
+                             tiled: bool = False, response_format: Optional[str] = Query(None, alias="format")):
     """根据文件名检测瑕疵"""
     from app.config import UPLOAD_DIR
     
@@ -34,22 +75,34 @@ async def detect_by_filename(filename: str):
     if not file_path.exists():
         raise HTTPException(status_code=404, detail="文件不存在")
     
-    request = DetectionRequest(image_path=str(file_path))
-    return await detect_defects(request)
+    request = DetectionRequest(image_path=str(file_path), model_id=model_id, tiled=tiled)
+    return await detect_defects(request, http_request, response_format)
 
 @router.post("/segment")
-async def segment_image(request: DetectionRequest):
-    """分割图片中的瑕疵"""
+async def segment_image(request: DetectionRequest, http_request: Request = None,
+                        response_format: Optional[str] = Query(None, alias="format")):
+    """分割图片中的瑕疵
+    
+    默认返回JSON；format=compact/msgpack（或对应的Accept头）返回列式紧凑格式，多边形为展平的数组
+    """
+    fmt = _response_format(http_request, response_format)
     try:
         image_path = Path(request.image_path)
         if not image_path.exists():
             raise HTTPException(status_code=404, detail="图片文件不存在")
         
-        result = yolo_service.YoloService.segment(str(image_path))
+        result = await run_inference(
+            yolo_service.YoloService.segment, str(image_path),
+            model_id=request.model_id, tiled=request.tiled, raw=fmt != "json"
+        )
+        if fmt != "json":
+            return encode_response({"success": True, "result": result_to_columns(result, fmt)}, fmt)
         return {
             "success": True,
             "result": result
         }
+    except InferenceQueueFullError as e:
+        raise _queue_full(e)
     except Exception as e:
         return {
             "success": False,
@@ -57,7 +110,8 @@ async def segment_image(request: DetectionRequest):
         }
 
 @router.get("/segment/{filename}")
-async def segment_by_filename(filename: str):
+async def segment_by_filename(http_request: Request, filename: str, model_id: Optional[str] = None,
+                              tiled: bool = False, response_format: Optional[str] = Query(None, alias="format")):
     """根据文件名分割瑕疵"""
     from app.config import UPLOAD_DIR
     
@@ -65,6 +119,282 @@ async def segment_by_filename(filename: str):
     if not file_path.exists():
         raise HTTPException(status_code=404, detail="文件不存在")
     
-    request = DetectionRequest(image_path=str(file_path))
-    return await segment_image(request)
+    request = DetectionRequest(image_path=str(file_path), model_id=model_id, tiled=tiled)
+    return await segment_image(request, http_request, response_format)
+
+
+# ---- 内存推理（上传的图片直接推理，不先写入磁盘） ----
+
+async def _read_upload(file: UploadFile, save: bool, background_tasks: BackgroundTasks) -> Tuple[bytes, str]:
+    """读取上传的图片字节（超出 MAX_IMAGE_UPLOAD_MB 时返回413）；需要保存时在响应返回后异步写入上传目录，
+    返回 (图片字节, 结果中的image_path)"""
+    try:
+        file_path = file_service.make_upload_path(file.filename)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    try:
+        content = await file_service.read_image_upload(file)
+    except file_service.UploadTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    if not content:
+        raise HTTPException(status_code=400, detail="上传的文件为空")
+    if save:
+        background_tasks.add_task(file_service.save_file_bytes, file_path, content)
+        return content, str(file_path)
+    return content, file.filename
+
+@router.post("/detect/upload", response_model=DetectionResponse)
+async def detect_upload(
+    http_request: Request,
+    background_tasks: BackgroundTasks,
+    file: UploadFile = File(...),
+    model_id: Optional[str] = Form(None),
+    tiled: bool = Form(False),
+    save: bool = Form(False),
+    response_format: Optional[str] = Query(None, alias="format")
+):
+    """上传图片并直接检测（图片在推理线程中解码，不经过磁盘）；save=true 时在响应后异步保存图片"""
+    fmt = _response_format(http_request, response_format)
+    content, image_name = await _read_upload(file, save, background_tasks)
+    try:
+        result = await run_inference(
+            yolo_service.YoloService.detect_image, content,
+            name=image_name, model_id=model_id, tiled=tiled, raw=fmt != "json"
+        )
+        if fmt != "json":
+            return encode_response({"success": True, "result": result_to_columns(result, fmt)}, fmt)
+        return DetectionResponse(success=True, result=result)
+    except InferenceQueueFullError as e:
+        raise _queue_full(e)
+    except Exception as e:
+        return DetectionResponse(success=False, error=str(e))
+
+@router.post("/segment/upload")
+async def segment_upload(
+    http_request: Request,
+    background_tasks: BackgroundTasks,
+    file: UploadFile = File(...),
+    model_id: Optional[str] = Form(None),
+    conf_threshold: float = Form(0.25),
+    tiled: bool = Form(False),
+    save: bool = Form(False),
+    response_format: Optional[str] = Query(None, alias="format")
+):
+    """上传图片并直接分割（图片在推理线程中解码，不经过磁盘）；save=true 时在响应后异步保存图片"""
+    fmt = _response_format(http_request, response_format)
+    content, image_name = await _read_upload(file, save, background_tasks)
+    try:
+        result = await run_inference(
+            yolo_service.YoloService.segment_image, content, name=image_name,
+            conf_threshold=conf_threshold, model_id=model_id, tiled=tiled, raw=fmt != "json"
+        )
+        if fmt != "json":
+            return encode_response({"success": True, "result": result_to_columns(result, fmt)}, fmt)
+        return {"success": True, "result": result}
+    except InferenceQueueFullError as e:
+        raise _queue_full(e)
+    except Exception as e:
+        return {"success": False, "error": str(e)}
+
+
+# ---- 批量检测/分割（NDJSON流式返回） ----
+
+async def _parse_batch_request(request: Request) -> Tuple[BatchDetectionRequest, List[Tuple[str, Optional[Path], Optional[str]]]]:
+    """解析批量请求：JSON文件名列表，或multipart上传的多张图片（files字段）
+    
+    返回 (请求参数, [(文件名, 图片路径, 错误信息)])
+    """
+    content_type = request.headers.get("content-type", "")
+    if content_type.startswith("multipart/form-data"):
+        form = await request.form()
+        uploads = [f for f in form.getlist("files") if hasattr(f, "filename")]
+        if not uploads:
+            raise HTTPException(status_code=400, detail="请在files字段上传图片")
+        try:
+            params = BatchDetectionRequest(
+                filenames=[f.filename for f in uploads],
+                model_id=form.get("model_id") or None,
+                conf_threshold=form.get("conf_threshold") or 0.25,
+                tiled=form.get("tiled") or False,
+            )
+        except ValidationError as e:
+            raise HTTPException(status_code=422, detail=e.errors())
+        items = []
+        for upload in uploads:
+            try:
+                items.append((upload.filename, await file_service.save_uploaded_file(upload), None))
+            except ValueError as e:
+                items.append((upload.filename, None, str(e)))
+        return params, items
+    
+    try:
+        params = BatchDetectionRequest.model_validate_json(await request.body())
+    except ValidationError as e:
+        raise HTTPException(status_code=422, detail=e.errors())
+    if not params.filenames:
+        raise HTTPException(status_code=400, detail="文件名列表不能为空")
+    items = []
+    for filename in params.filenames:
+        # 只允许访问上传目录中的文件
+        file_path = UPLOAD_DIR / filename
+        if Path(filename).name != filename or not file_path.exists():
+            items.append((filename, None, "文件不存在"))
+        else:
+            items.append((filename, file_path, None))
+    return params, items
+
+
+# 批量接口中一块图片等待推理队列空位的最长时间（秒），超过后该块及之后未开始的块报告失败
+BATCH_QUEUE_WAIT_SECONDS = 30.0
+
+
+async def _run_chunk(fn: Callable[..., Any], paths: List[str], **kwargs) -> List[Any]:
+    """在推理执行器中运行一块图片；队列满时退避重试（最多等待 BATCH_QUEUE_WAIT_SECONDS），而不是让整批失败"""
+    delay = 0.05
+    deadline = time.monotonic() + BATCH_QUEUE_WAIT_SECONDS
+    while True:
+        try:
+            return await run_inference(fn, paths, **kwargs)
+        except InferenceQueueFullError:
+            if time.monotonic() + delay > deadline:
+                raise
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 1.0)
+
+
+async def _run_chunk_or_each(fn: Callable[..., Any], paths: List[str], **kwargs) -> List[Tuple[Any, Optional[str]]]:
+    """运行一块图片，返回每张图片的 (结果, 错误)；整块失败时逐张重试，只有出错的图片报告失败"""
+    try:
+        return [(result, None) for result in await _run_chunk(fn, paths, **kwargs)]
+    except InferenceQueueFullError:
+        raise
+    except Exception as e:
+        if len(paths) == 1:
+            return [(None, str(e))]
+    outcomes = []
+    for path in paths:
+        try:
+            outcomes.append(((await _run_chunk(fn, [path], **kwargs))[0], None))
+        except InferenceQueueFullError:
+            raise
+        except Exception as e:
+            outcomes.append((None, str(e)))
+    return outcomes
+
+
+def _ndjson_line(payload: dict) -> bytes:
+    return (json.dumps(jsonable_encoder(payload), ensure_ascii=False) + "\n").encode("utf-8")
+
+
+def _batch_format(request: Request) -> str:
+    """批量接口的结果格式（format查询参数），NDJSON只支持json和compact"""
+    fmt = _response_format(None, request.query_params.get("format"))
+    if fmt == "msgpack":
+        raise HTTPException(status_code=406, detail="批量接口只支持json和compact格式")
+    return fmt
+
+
+async def _stream_batch(items: List[Tuple[str, Optional[Path], Optional[str]]],
+                        fn: Callable[..., Any], fmt: str = "json", **kwargs) -> AsyncIterator[bytes]:
+    """按块批量推理，每块完成后立即输出该块的结果（完成顺序），最后输出汇总行"""
+    started = time.perf_counter()
+    succeeded = failed = 0
+    
+    # 找不到的文件直接返回错误
+    valid = []
+    for index, (filename, path, error) in enumerate(items):
+        if error is not None:
+            failed += 1
+            yield _ndjson_line({"index": index, "filename": filename, "success": False, "error": error})
+        else:
+            valid.append((index, filename, str(path)))
+    
+    # 每块走一次批量推理；并发块数不超过推理执行器的工作线程数，避免占满推理队列
+    chunk_size = max(1, INFERENCE_BATCH_MAX_SIZE)
+    chunks = [valid[i:i + chunk_size] for i in range(0, len(valid), chunk_size)]
+    semaphore = asyncio.Semaphore(get_inference_executor().max_workers)
+    # 某块等待推理队列超时后，还没开始的块直接报告失败，不再占用推理资源
+    overloaded: List[str] = []
+    
+    async def _process(chunk):
+        async with semaphore:
+            if overloaded:
+                return chunk, [(None, overloaded[0])] * len(chunk)
+            try:
+                return chunk, await _run_chunk_or_each(fn, [p for _, _, p in chunk], **kwargs)
+            except InferenceQueueFullError as e:
+                overloaded.append(str(e))
+                return chunk, [(None, str(e))] * len(chunk)
+    
+    tasks = [asyncio.ensure_future(_process(chunk)) for chunk in chunks]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            chunk, outcomes = await next_done
+            for (index, filename, _), (result, error) in zip(chunk, outcomes):
+                if error is None:
+                    succeeded += 1
+                    yield _ndjson_line({
+                        "index": index, "filename": filename, "success": True,
+                        "result": result_to_columns(result, fmt)
+                    })
+                else:
+                    failed += 1
+                    yield _ndjson_line({"index": index, "filename": filename, "success": False, "error": error})
+    finally:
+        # 客户端断开时取消还没开始的块
+        for task in tasks:
+            task.cancel()
+    
+    yield _ndjson_line({
+        "done": True,
+        "total": len(items),
+        "succeeded": succeeded,
+        "failed": failed,
+        "seconds": round(time.perf_counter() - started, 3),
+    })
+
+
+@router.post("/detect/batch")
+async def detect_batch(request: Request):
+    """批量检测：JSON {"filenames": [...], "model_id": ...} 或 multipart 上传多张图片（files字段）
+    
+    结果以NDJSON流式返回，每行一张图片（按完成顺序，index为输入中的位置），最后一行为汇总；
+    format=compact 时每行的结果为列式紧凑格式
+    """
+    fmt = _batch_format(request)
+    params, items = await _parse_batch_request(request)
+    return StreamingResponse(
+        _stream_batch(
+            items, yolo_service.YoloService.detect_batch, fmt=fmt,
+            model_id=params.model_id, tiled=params.tiled, raw=fmt != "json"
+        ),
+        media_type="application/x-ndjson"
+    )
+
+@router.post("/segment/batch")
+async def segment_batch(request: Request):
+    """批量分割：参数同 /detect/batch，另外支持 conf_threshold"""
+    fmt = _batch_format(request)
+    params, items = await _parse_batch_request(request)
+    return StreamingResponse(
+        _stream_batch(
+            items, yolo_service.YoloService.segment_batch, fmt=fmt,
+            conf_threshold=params.conf_threshold, model_id=params.model_id, tiled=params.tiled,
+            raw=fmt != "json"
+        ),
+        media_type="application/x-ndjson"
+    )
+
 
+@router.get("/inference/stats")
+async def inference_stats():
+    """获取推理统计（执行器排队情况、微批处理批大小分布与排队延迟、结果缓存和图片下载缓存命中率）"""
+    image_cache = get_image_cache()
+    return {
+        "success": True,
+        "executor": get_inference_executor().get_stats(),
+        "batching": yolo_service.YoloService.get_batch_stats(),
+        "result_cache": yolo_service.YoloService.get_cache_stats(),
+        "image_cache": image_cache.get_stats() if image_cache is not None else {"enabled": False},
+        "worker_pool": get_worker_pool().get_stats() if worker_pool_enabled() else {"enabled": False}
+    }
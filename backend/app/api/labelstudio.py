@@ -1,24 +1,39 @@
-from fastapi import APIRouter, HTTPException
-from typing import List
+import asyncio
+import logging
+import os
+import re
+import anyio
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import StreamingResponse
+from typing import List, Optional, Tuple
+from app.config import EXPORT_STREAM_CHUNK_KB
+from app.services.export_cache import get_export_cache
 from app.services.labelstudio_service import LabelStudioService
+from app.services.preannotation_service import get_preannotation_service
+from app.services.task_import_service import get_task_import_service
 from app.models.schemas import (
     LabelStudioTask, 
     LabelStudioTaskCreate, 
-    LabelStudioTaskResponse
+    LabelStudioTaskResponse,
+    PreannotationJobCreate,
+    PreannotationJobResponse,
+    TaskImportJobCreate,
+    TaskImportJobResponse,
 )
 
 router = APIRouter(tags=["标注管理"])
 service = LabelStudioService()
+logger = logging.getLogger(__name__)
+
+_EXPORT_TYPE_PATTERN = re.compile(r"^[A-Za-z0-9_]+$")
+_RANGE_PATTERN = re.compile(r"bytes=(\d*)-(\d*)")
 
 @router.get("/projects", response_model=LabelStudioTaskResponse)
 async def list_projects():
     """获取所有标注项目"""
     try:
         projects_data = await service.get_projects()
-        tasks = []
-        for project in projects_data:
-            task = await service.convert_to_labelstudio_tasks(project)
-            tasks.append(task)
+        tasks = [service.project_to_task(project) for project in projects_data]
         
         return LabelStudioTaskResponse(
             success=True,
@@ -68,20 +83,135 @@ async def delete_project(project_id: int):
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.get("/projects/{project_id}/export")
-async def export_project(project_id: int, export_type: str = "YOLO"):
-    """导出标注数据"""
+async def export_project(project_id: int, request: Request, export_type: str = "YOLO", refresh: bool = False):
+    """导出标注数据
+    
+    从LabelStudio流式转发（不在内存中缓存整个压缩包），完整下载的导出按 项目+格式+变更标记 缓存在磁盘上；
+    再次下载时直接从磁盘发送并支持Range（断点续传）。refresh=true时忽略缓存重新导出
+    """
+    if not _EXPORT_TYPE_PATTERN.match(export_type):
+        raise HTTPException(status_code=400, detail=f"无效的导出格式: {export_type}")
+    filename = f"project_{project_id}_{export_type}.zip"
+    
+    cache = get_export_cache()
+    marker = None
+    if cache is not None:
+        try:
+            marker = service.project_change_marker(await service.get_project(project_id))
+        except Exception as e:
+            logger.warning(f"获取项目 {project_id} 的变更标记失败，不使用导出缓存: {e}")
+        if marker is not None and not refresh:
+            # 缓存的查找、打开文件都是磁盘操作，放到线程中执行
+            path = await asyncio.to_thread(cache.lookup, project_id, export_type, marker)
+            if path is not None:
+                try:
+                    return await asyncio.to_thread(_file_response, path, filename, request.headers)
+                except FileNotFoundError:
+                    pass
+    
     try:
-        data = await service.export_project(project_id, export_type)
-        from fastapi.responses import Response
-        return Response(
-            content=data,
-            media_type="application/zip",
-            headers={
-                "Content-Disposition": f"attachment; filename=project_{project_id}_{export_type}.zip"
-            }
-        )
+        response = await service.open_export_stream(project_id, export_type)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+    
+    headers = {"Content-Disposition": f"attachment; filename={filename}"}
+    expected_size = None
+    # 响应体经过解压时长度与Content-Length不一致，不转发
+    if response.headers.get("content-length") and not response.headers.get("content-encoding"):
+        headers["Content-Length"] = response.headers["content-length"]
+        expected_size = int(response.headers["content-length"])
+    writer = None
+    if marker is not None:
+        writer = await asyncio.to_thread(cache.open_writer, project_id, export_type, marker)
+    return StreamingResponse(
+        _relay_export(response, writer, expected_size),
+        media_type=response.headers.get("content-type", "application/zip"),
+        headers=headers
+    )
+
+async def _relay_export(response, writer, expected_size: Optional[int]):
+    """把LabelStudio的导出分块转发给客户端，同时写入缓存；客户端断开或下载出错时丢弃临时文件
+
+    缓存文件的写入、提交（替换旧导出、淘汰）都在线程中执行，不阻塞事件循环
+    """
+    completed = False
+    try:
+        async for chunk in response.aiter_bytes(EXPORT_STREAM_CHUNK_KB * 1024):
+            if writer is not None:
+                await asyncio.to_thread(writer.write, chunk)
+            yield chunk
+        completed = True
+    finally:
+        # 客户端断开时所在的取消域已被取消，清理需要屏蔽取消才能执行完
+        with anyio.CancelScope(shield=True):
+            await response.aclose()
+            if writer is not None:
+                if completed:
+                    await asyncio.to_thread(writer.commit, expected_size)
+                else:
+                    await asyncio.to_thread(writer.abort)
+
+def _parse_range(range_header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """解析单个 bytes=start-end 区间，返回闭区间；没有或无法解析（含多区间）时返回None，发送整个文件"""
+    match = _RANGE_PATTERN.fullmatch((range_header or "").strip())
+    if not match or not (match.group(1) or match.group(2)):
+        return None
+    if match.group(1):
+        start = int(match.group(1))
+        end = min(int(match.group(2)), size - 1) if match.group(2) else size - 1
+    else:
+        # bytes=-N 表示最后N个字节
+        start, end = max(0, size - int(match.group(2))), size - 1
+    if start >= size or start > end:
+        raise HTTPException(
+            status_code=416, detail="请求的范围无效", headers={"Content-Range": f"bytes */{size}"}
+        )
+    return start, end
+
+def _file_response(path, filename: str, request_headers) -> StreamingResponse:
+    """从磁盘发送缓存的导出，支持Range和If-Range"""
+    # 先打开文件：之后即使被淘汰删除也能读完
+    f = open(path, "rb")
+    try:
+        size = os.fstat(f.fileno()).st_size
+        etag = f'"{path.stem}-{size}"'
+        headers = {
+            "Content-Disposition": f"attachment; filename={filename}",
+            "Accept-Ranges": "bytes",
+            "ETag": etag,
+        }
+        byte_range = None
+        if_range = request_headers.get("if-range")
+        if if_range is None or if_range == etag:
+            byte_range = _parse_range(request_headers.get("range"), size)
+    except BaseException:
+        f.close()
+        raise
+    
+    status_code = 200
+    start, end = 0, size - 1
+    if byte_range is not None:
+        start, end = byte_range
+        status_code = 206
+        headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+    headers["Content-Length"] = str(end - start + 1)
+    return StreamingResponse(
+        _iter_file(f, start, end - start + 1), status_code=status_code,
+        media_type="application/zip", headers=headers
+    )
+
+def _iter_file(f, start: int, length: int):
+    chunk_size = EXPORT_STREAM_CHUNK_KB * 1024
+    try:
+        f.seek(start)
+        while length > 0:
+            chunk = f.read(min(chunk_size, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+    finally:
+        f.close()
 
 @router.get("/projects/{project_id}/url")
 async def get_project_url(project_id: int):
@@ -92,3 +222,86 @@ async def get_project_url(project_id: int):
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.post("/projects/{project_id}/preannotate", response_model=PreannotationJobResponse)
+async def start_preannotation(project_id: int, job_create: Optional[PreannotationJobCreate] = None):
+    """启动后台批量预标注：对项目中的所有任务分割并批量导入预测结果"""
+    try:
+        job = await get_preannotation_service().create_job(project_id, job_create)
+        return PreannotationJobResponse(success=True, job=job)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/preannotate/jobs", response_model=PreannotationJobResponse)
+async def list_preannotation_jobs():
+    """获取所有批量预标注任务"""
+    return PreannotationJobResponse(success=True, jobs=get_preannotation_service().list_jobs())
+
+@router.get("/preannotate/jobs/{job_id}", response_model=PreannotationJobResponse)
+async def get_preannotation_job(job_id: str):
+    """获取批量预标注任务进度（已处理数量、吞吐量、预计剩余时间）"""
+    job = get_preannotation_service().get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="预标注任务不存在")
+    return PreannotationJobResponse(success=True, job=job)
+
+@router.post("/preannotate/jobs/{job_id}/cancel")
+async def cancel_preannotation_job(job_id: str):
+    """取消批量预标注任务（已导入的预测保留）"""
+    if not await get_preannotation_service().cancel_job(job_id):
+        raise HTTPException(status_code=404, detail="预标注任务不存在或未在运行")
+    return {"success": True, "message": "预标注任务已取消"}
+
+@router.post("/preannotate/jobs/{job_id}/resume", response_model=PreannotationJobResponse)
+async def resume_preannotation_job(job_id: str):
+    """从检查点恢复批量预标注任务"""
+    try:
+        job = await get_preannotation_service().resume_job(job_id)
+        return PreannotationJobResponse(success=True, job=job)
+    except KeyError:
+        raise HTTPException(status_code=404, detail="预标注任务不存在")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@router.post("/projects/{project_id}/import", response_model=TaskImportJobResponse)
+async def start_task_import(project_id: int, job_create: TaskImportJobCreate):
+    """后台批量导入任务：分块并发发送，失败后可恢复（已导入的分块不会重复发送）"""
+    try:
+        job = await get_task_import_service().create_job(project_id, job_create)
+        return TaskImportJobResponse(success=True, job=job)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/imports/jobs", response_model=TaskImportJobResponse)
+async def list_task_import_jobs():
+    """获取所有批量导入任务"""
+    return TaskImportJobResponse(success=True, jobs=get_task_import_service().list_jobs())
+
+@router.get("/imports/jobs/{job_id}", response_model=TaskImportJobResponse)
+async def get_task_import_job(job_id: str):
+    """获取批量导入任务进度（已导入任务数、已完成分块、吞吐量、预计剩余时间）"""
+    job = get_task_import_service().get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="导入任务不存在")
+    return TaskImportJobResponse(success=True, job=job)
+
+@router.post("/imports/jobs/{job_id}/cancel")
+async def cancel_task_import_job(job_id: str):
+    """取消批量导入任务（已导入的分块保留）"""
+    if not await get_task_import_service().cancel_job(job_id):
+        raise HTTPException(status_code=404, detail="导入任务不存在或未在运行")
+    return {"success": True, "message": "导入任务已取消"}
+
+@router.post("/imports/jobs/{job_id}/resume", response_model=TaskImportJobResponse)
+async def resume_task_import_job(job_id: str):
+    """恢复批量导入任务，只发送未完成的分块"""
+    try:
+        job = await get_task_import_service().resume_job(job_id)
+        return TaskImportJobResponse(success=True, job=job)
+    except KeyError:
+        raise HTTPException(status_code=404, detail="导入任务不存在")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
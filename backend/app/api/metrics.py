@@ -0,0 +1,141 @@
+"""
+Prometheus指标接口
+/metrics 输出各阶段耗时直方图、HTTP请求耗时，以及推理队列深度、批大小、缓存命中率、模型加载耗时等运行状态
+"""
+import asyncio
+import time
+from typing import List
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+from app.services.metrics import REGISTRY, Counter, Gauge, Histogram, end_request_spans, server_timing, start_request_spans
+
+router = APIRouter(tags=["监控"])
+
+HTTP_REQUEST_SECONDS = REGISTRY.histogram(
+    "defect_http_request_duration_seconds", "HTTP请求耗时（秒）", ("method", "route", "status")
+)
+
+
+class MetricsMiddleware:
+    """记录每个请求的耗时（按路由模板区分），并把各阶段耗时写入 Server-Timing 响应头"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        spans, token = start_request_spans()
+        status = {"code": 500}
+
+        async def _send(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+                if spans:
+                    headers = list(message.get("headers", []))
+                    headers.append((b"server-timing", server_timing(spans).encode("latin-1")))
+                    message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, _send)
+        finally:
+            end_request_spans(token)
+            route = scope.get("route")
+            # 未匹配的路由统一记为unmatched，避免任意路径产生大量标签
+            route_path = getattr(route, "path", None) or "unmatched"
+            HTTP_REQUEST_SECONDS.observe(
+                time.perf_counter() - started,
+                method=scope["method"], route=route_path, status=str(status["code"])
+            )
+
+
+def _cache_metrics(metrics: List, cache: str, stats: dict):
+    hits = Counter("defect_cache_hits", "缓存命中次数", ("cache",))
+    hits.inc(stats.get("hits", 0), cache=cache)
+    misses = Counter("defect_cache_misses", "缓存未命中次数", ("cache",))
+    misses.inc(stats.get("misses", 0), cache=cache)
+    hit_rate = Gauge("defect_cache_hit_ratio", "缓存命中率", ("cache",))
+    hit_rate.set(stats.get("hit_rate", 0.0), cache=cache)
+    size = Gauge("defect_cache_bytes", "缓存占用字节数", ("cache",))
+    size.set(stats.get("bytes", 0), cache=cache)
+    entries = Gauge("defect_cache_entries", "缓存条目数", ("cache",))
+    entries.set(stats.get("entries", 0), cache=cache)
+    metrics.extend([hits, misses, hit_rate, size, entries])
+
+
+def collect_runtime_metrics() -> List:
+    """从各组件现有的统计信息生成指标"""
+    from app.services.export_cache import get_export_cache
+    from app.services.image_cache import get_image_cache
+    from app.services.inference_executor import get_inference_executor
+    from app.services.project_cache import get_project_list_cache
+    from app.services.worker_pool import get_worker_pool, worker_pool_enabled
+    from app.services.yolo_service import YoloService
+
+    metrics = []
+
+    executor = get_inference_executor().get_stats()
+    in_flight = Gauge("defect_inference_in_flight", "推理执行器中执行和排队的任务数")
+    in_flight.set(executor["in_flight"])
+    queued = Gauge("defect_inference_queue_depth", "推理执行器中排队等待的任务数")
+    queued.set(executor["queued"])
+    completed = Counter("defect_inference_completed", "推理执行器完成的任务数")
+    completed.inc(executor["completed"])
+    rejected = Counter("defect_inference_rejected", "队列已满被拒绝的推理任务数")
+    rejected.inc(executor["rejected"])
+    metrics.extend([in_flight, queued, completed, rejected])
+
+    batching = YoloService.get_batch_stats()
+    batcher_depth = Gauge("defect_batcher_queue_depth", "微批处理队列中等待的请求数", ("batcher",))
+    batcher_sizes = Histogram("defect_batcher_batch_size", "微批处理合并的批大小", ("batcher",),
+                              buckets=(1, 2, 4, 8, 16, 32, 64))
+    for name in ("detect", "segment"):
+        stats = batching.get(name)
+        if not stats:
+            continue
+        batcher_depth.set(stats["queue_depth"], batcher=name)
+        for batch_size, count in stats["batch_size_histogram"].items():
+            batcher_sizes.observe(float(batch_size), count, batcher=name)
+    metrics.extend([batcher_depth, batcher_sizes])
+
+    _cache_metrics(metrics, "result", YoloService.get_cache_stats())
+    image_cache = get_image_cache()
+    if image_cache is not None:
+        _cache_metrics(metrics, "image", image_cache.get_stats())
+    _cache_metrics(metrics, "labelstudio_projects", get_project_list_cache().get_stats())
+    export_cache = get_export_cache()
+    if export_cache is not None:
+        _cache_metrics(metrics, "export", export_cache.get_stats())
+
+    registry = YoloService.get_registry_status()
+    loaded_seconds = Gauge("defect_model_loaded_seconds", "已加载模型的加载耗时（秒）", ("task", "model"))
+    loaded_bytes = Gauge("defect_model_loaded_bytes", "已加载模型占用的内存（字节）", ("task", "model"))
+    for model in registry.get("loaded", []):
+        loaded_seconds.set(model["load_seconds"], task=model["task"], model=model["model_path"])
+        loaded_bytes.set(model["size_mb"] * 1024 * 1024, task=model["task"], model=model["model_path"])
+    metrics.extend([loaded_seconds, loaded_bytes])
+
+    if worker_pool_enabled():
+        pool = get_worker_pool().get_stats()
+        alive = Gauge("defect_worker_pool_alive_workers", "存活的推理工作进程数")
+        alive.set(pool["alive_workers"])
+        pending = Gauge("defect_worker_pool_pending_tasks", "工作进程池中未完成的任务数")
+        pending.set(pool["pending_tasks"])
+        restarts = Counter("defect_worker_pool_restarts", "推理工作进程重启次数")
+        restarts.inc(pool["restarts"])
+        metrics.extend([alive, pending, restarts])
+    return metrics
+
+
+REGISTRY.add_collector(collect_runtime_metrics)
+
+
+@router.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Prometheus文本格式指标（收集时会扫描导出缓存目录，在线程中生成）"""
+    content = await asyncio.to_thread(REGISTRY.render)
+    return PlainTextResponse(content, media_type="text/plain; version=0.0.4; charset=utf-8")
@@ -3,11 +3,15 @@ from fastapi.responses import FileResponse
 from typing import Optional
 from pathlib import Path
 from app.services.model_service import ModelService
-from app.models.schemas import ModelResponse, ModelUpload, ModelMetadata, ModelType
+from app.services.file_service import UploadTooLargeError
+from app.models.schemas import ModelResponse, ModelUpload, ModelMetadata, ModelType, QuantizationRequest
 from app.services.yolo_service import YoloService
+from app.services.quantization_service import QuantizationService
+import asyncio
 
 router = APIRouter(tags=["模型管理"])
 service = ModelService()
+quantization_service = QuantizationService()
 
 @router.get("/models", response_model=ModelResponse)
 async def list_models():
@@ -44,6 +48,11 @@ async def get_active_model():
             error=str(e)
         )
 
+@router.get("/models/registry")
+async def get_model_registry_status():
+    """获取已加载模型（LRU注册表）和后台激活进度"""
+    return {"success": True, "registry": YoloService.get_registry_status()}
+
 @router.get("/models/{model_id}", response_model=ModelResponse)
 async def get_model(model_id: str):
     """获取模型详情"""
@@ -67,9 +76,10 @@ async def upload_model(
     name: str = None,
     description: Optional[str] = None,
     training_task_id: Optional[str] = None,
-    model_type: str = "detection"
+    model_type: str = "detection",
+    sha256: Optional[str] = None
 ):
-    """上传模型文件"""
+    """上传模型文件（流式写入磁盘；提供sha256时校验，超出 MAX_MODEL_UPLOAD_MB 返回413）"""
     try:
         if not name:
             # 如果没有提供名称，使用文件名（去掉扩展名）
@@ -85,13 +95,16 @@ async def upload_model(
             name=name,
             description=description,
             training_task_id=training_task_id,
-            model_type=model_type_enum
+            model_type=model_type_enum,
+            sha256=sha256
         )
         
         return ModelResponse(
             success=True,
             model=model
         )
+    except UploadTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
@@ -103,14 +116,39 @@ async def activate_model(model_id: str):
     try:
         success = await service.set_active_model(model_id)
         if success:
-            # 清除YoloService的缓存，强制重新加载模型
-            YoloService._model = None
-            return {"success": True, "message": "模型已激活"}
+            # 新模型在后台加载并预热，完成后原子切换（同时清空结果缓存），切换前的请求继续使用旧模型
+            activation = YoloService.activate_models()
+            return {"success": True, "message": "模型已激活，正在后台加载", "activation": activation}
         else:
             raise HTTPException(status_code=404, detail="模型不存在或文件不存在")
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.post("/models/{model_id}/quantize", response_model=ModelResponse)
+async def quantize_model(model_id: str, request: Optional[QuantizationRequest] = None):
+    """生成模型的INT8量化版本（OpenVINO），并记录相对FP32模型的精度变化"""
+    request = request or QuantizationRequest()
+    try:
+        # 量化和精度评估耗时较长，在线程池中执行避免阻塞事件循环
+        model = await asyncio.to_thread(
+            quantization_service.quantize_model,
+            model_id,
+            calibration_data=request.calibration_data,
+            num_samples=request.num_samples,
+            name=request.name,
+            description=request.description
+        )
+        return ModelResponse(
+            success=True,
+            model=model
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"量化失败: {str(e)}")
+
 @router.delete("/models/{model_id}")
 async def delete_model(model_id: str):
     """删除模型"""
@@ -134,6 +172,8 @@ async def download_model(model_id: str):
             raise HTTPException(status_code=404, detail="模型文件不存在")
         
         model = service.get_model(model_id)
+        if file_path.is_dir():
+            raise HTTPException(status_code=400, detail="导出的模型目录不支持直接下载")
         return FileResponse(
             path=str(file_path),
             filename=model.filename,
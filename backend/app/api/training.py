@@ -1,15 +1,21 @@
-from fastapi import APIRouter, HTTPException, UploadFile, File
-from typing import List
+from fastapi import APIRouter, HTTPException, UploadFile, File, Request, Query
+from typing import List, Optional
 from pathlib import Path
 from app.services.training_service import TrainingService
+from app.services.dataset_sync_service import get_dataset_sync_service
+from app.services.chunked_upload_service import UploadOffsetError, get_chunked_upload_service
+from app.services.file_service import MB, UploadTooLargeError, stream_upload_to_file
 from app.models.schemas import (
     TrainingTask,
     TrainingTaskCreate,
     TrainingTaskResponse,
-    TrainingConfig
+    TrainingConfig,
+    DatasetSyncRequest,
+    DatasetSyncResponse,
+    ChunkedUploadCreate,
+    ChunkedUploadResponse,
 )
-from app.config import TRAINING_DATA_DIR
-import aiofiles
+from app.config import TRAINING_DATA_DIR, MAX_DATASET_UPLOAD_MB
 from datetime import datetime
 
 router = APIRouter(tags=["训练管理"])
@@ -98,8 +104,11 @@ async def delete_task(task_id: str):
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.post("/datasets/upload")
-async def upload_dataset(file: UploadFile = File(...)):
-    """上传训练数据集（ZIP格式）"""
+async def upload_dataset(file: UploadFile = File(...), sha256: Optional[str] = None):
+    """上传训练数据集（ZIP格式），流式写入磁盘；提供sha256时校验
+    
+    大文件建议使用分块上传（/datasets/uploads），连接中断后可以断点续传
+    """
     try:
         # 检查文件类型
         if not file.filename.endswith('.zip'):
@@ -107,21 +116,88 @@ async def upload_dataset(file: UploadFile = File(...)):
         
         # 保存文件
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        safe_filename = f"{timestamp}_{file.filename}"
+        safe_filename = f"{timestamp}_{Path(file.filename).name}"
         file_path = TRAINING_DATA_DIR / safe_filename
         
-        async with aiofiles.open(file_path, 'wb') as f:
-            content = await file.read()
-            await f.write(content)
+        saved = await stream_upload_to_file(file, file_path, int(MAX_DATASET_UPLOAD_MB * MB), sha256)
         
         return {
             "success": True,
             "message": "数据集上传成功",
             "filename": safe_filename,
-            "path": str(file_path)
+            "path": str(file_path),
+            "size": saved.size,
+            "sha256": saved.sha256
         }
     except HTTPException:
         raise
+    except UploadTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"上传失败: {str(e)}")
 
+@router.post("/datasets/uploads", response_model=ChunkedUploadResponse)
+async def create_chunked_upload(upload_create: ChunkedUploadCreate):
+    """开始数据集分块上传（声明文件名、总大小和可选的sha256），返回上传ID"""
+    try:
+        upload = get_chunked_upload_service().create(upload_create)
+        return ChunkedUploadResponse(success=True, upload=upload)
+    except UploadTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@router.get("/datasets/uploads/{upload_id}", response_model=ChunkedUploadResponse)
+async def get_chunked_upload(upload_id: str):
+    """查询分块上传状态，offset为已接收的字节数（断点续传时从此处继续发送）"""
+    upload = get_chunked_upload_service().get(upload_id)
+    if upload is None:
+        raise HTTPException(status_code=404, detail="上传不存在或已过期")
+    return ChunkedUploadResponse(success=True, upload=upload)
+
+@router.put("/datasets/uploads/{upload_id}", response_model=ChunkedUploadResponse)
+async def upload_chunk(upload_id: str, request: Request, offset: int = Query(..., ge=0)):
+    """发送一个分块（请求体为原始字节），offset必须等于已接收的字节数；最后一个分块接收后自动校验并完成"""
+    try:
+        upload = await get_chunked_upload_service().append(upload_id, offset, request.stream())
+        return ChunkedUploadResponse(success=True, upload=upload)
+    except KeyError:
+        raise HTTPException(status_code=404, detail="上传不存在或已过期")
+    except UploadOffsetError as e:
+        raise HTTPException(status_code=409, detail={"message": str(e), "offset": e.current_offset})
+    except UploadTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@router.delete("/datasets/uploads/{upload_id}")
+async def delete_chunked_upload(upload_id: str):
+    """取消分块上传（删除已接收的内容）"""
+    if not get_chunked_upload_service().delete(upload_id):
+        raise HTTPException(status_code=404, detail="上传不存在或已过期")
+    return {"success": True, "message": "上传已取消"}
+
+@router.post("/datasets/labelstudio/{project_id}/sync", response_model=DatasetSyncResponse)
+async def sync_labelstudio_dataset(project_id: int, request: Optional[DatasetSyncRequest] = None):
+    """把LabelStudio项目的标注增量同步为YOLO数据集（只下载和写入新增或变化的任务）
+    
+    返回的 dataset_path（data.yaml）可直接用于创建训练任务
+    """
+    request = request or DatasetSyncRequest()
+    if request.val_ratio is not None and not 0 <= request.val_ratio <= 1:
+        raise HTTPException(status_code=400, detail="val_ratio 必须在0~1之间")
+    try:
+        result = await get_dataset_sync_service().sync(project_id, request.val_ratio, request.full)
+        return DatasetSyncResponse(success=True, result=result)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"同步数据集失败: {str(e)}")
+
+@router.get("/datasets/labelstudio/{project_id}", response_model=DatasetSyncResponse)
+async def get_labelstudio_dataset(project_id: int):
+    """获取LabelStudio项目数据集上次同步的结果"""
+    result = get_dataset_sync_service().get_status(project_id)
+    if result is None:
+        raise HTTPException(status_code=404, detail="该项目的数据集尚未同步")
+    return DatasetSyncResponse(success=True, result=result)
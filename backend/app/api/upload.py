@@ -8,14 +8,18 @@ router = APIRouter(tags=["文件上传"])
 async def upload_image(file: UploadFile = File(...)):
     """上传图片文件"""
     try:
-        file_path = await file_service.save_uploaded_file(file)
-        file_url = file_service.get_file_url(file_path)
+        saved = await file_service.save_image_upload(file)
+        file_url = file_service.get_file_url(saved.path)
         
         return UploadResponse(
             filename=file.filename,
-            file_path=str(file_path),
-            message="上传成功"
+            file_path=str(saved.path),
+            message="上传成功",
+            size=saved.size,
+            sha256=saved.sha256
         )
+    except file_service.UploadTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
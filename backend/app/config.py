@@ -15,6 +15,13 @@ UPLOAD_DIR.mkdir(exist_ok=True)
 MODEL_DIR = BASE_DIR / "models"
 MODEL_DIR.mkdir(exist_ok=True)
 
+# CPU推理后端配置：pytorch / onnx / openvino / torchscript
+# 非pytorch后端会把模型导出一次并缓存到 MODEL_EXPORT_DIR（按模型文件内容哈希区分）
+INFERENCE_BACKEND = os.getenv("INFERENCE_BACKEND", "pytorch").lower()
+MODEL_EXPORT_DIR = Path(os.getenv("MODEL_EXPORT_DIR", str(BASE_DIR / "model_exports")))
+MODEL_EXPORT_DIR.mkdir(exist_ok=True)
+EXPORT_IMGSZ = int(os.getenv("EXPORT_IMGSZ", "640"))
+
 # 数据存储配置
 DATA_DIR = BASE_DIR / "data"
 DATA_DIR.mkdir(exist_ok=True)
@@ -28,14 +35,128 @@ TRAINING_DATA_DIR.mkdir(exist_ok=True)
 # LabelStudio配置
 LABEL_STUDIO_URL = os.getenv("LABEL_STUDIO_URL", "http://localhost:8080")
 LABEL_STUDIO_API_KEY = os.getenv("LABEL_STUDIO_API_KEY", "")
+# 项目列表：分页大小（各页并发获取）、缓存TTL（0为不缓存）、过期后仍可返回旧列表并后台刷新的时间（秒）
+LABEL_STUDIO_PROJECTS_PAGE_SIZE = int(os.getenv("LABEL_STUDIO_PROJECTS_PAGE_SIZE", "100"))
+LABEL_STUDIO_PROJECTS_CACHE_TTL = float(os.getenv("LABEL_STUDIO_PROJECTS_CACHE_TTL", "10"))
+LABEL_STUDIO_PROJECTS_STALE_SECONDS = float(os.getenv("LABEL_STUDIO_PROJECTS_STALE_SECONDS", "60"))
+# 导出：流式转发（读取超时需覆盖LabelStudio生成导出的时间）；完整的导出缓存在磁盘上
+LABEL_STUDIO_EXPORT_TIMEOUT = float(os.getenv("LABEL_STUDIO_EXPORT_TIMEOUT", "600"))
+EXPORT_STREAM_CHUNK_KB = int(os.getenv("EXPORT_STREAM_CHUNK_KB", "256"))
+EXPORT_CACHE_ENABLED = os.getenv("EXPORT_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+EXPORT_CACHE_DIR = Path(os.getenv("EXPORT_CACHE_DIR", str(DATA_DIR / "export_cache")))
+EXPORT_CACHE_MAX_MB = int(os.getenv("EXPORT_CACHE_MAX_MB", "2048"))
+# 缓存的导出最长使用时间（秒，0为不限）：修改已有标注不会改变项目的变更标记
+EXPORT_CACHE_MAX_AGE = float(os.getenv("EXPORT_CACHE_MAX_AGE", "3600"))
+
+# LabelStudio → YOLO数据集增量同步（写入 TRAINING_DATA_DIR/labelstudio_<项目ID>，只处理新增/变化的任务）
+DATASET_SYNC_PAGE_SIZE = int(os.getenv("DATASET_SYNC_PAGE_SIZE", "500"))  # 获取任务的分页大小（各页并发获取）
+DATASET_SYNC_CONCURRENCY = int(os.getenv("DATASET_SYNC_CONCURRENCY", "16"))  # 并发请求数（分页和图片下载）
+DATASET_SYNC_VAL_RATIO = float(os.getenv("DATASET_SYNC_VAL_RATIO", "0.1"))  # 验证集比例（按图片内容哈希划分，结果稳定）
 
 # Yolo模型路径（如果已有训练好的模型）
 YOLO_MODEL_PATH = os.getenv("YOLO_MODEL_PATH", "yolov8n.pt")
 YOLO_SEG_MODEL_PATH = os.getenv("YOLO_SEG_MODEL_PATH", "yolov8n-seg.pt")  # 分割模型路径
 
+# 推理微批处理配置（合并并发请求为一次批量前向推理）
+INFERENCE_BATCH_ENABLED = os.getenv("INFERENCE_BATCH_ENABLED", "false").lower() in ("1", "true", "yes")
+INFERENCE_BATCH_MAX_SIZE = int(os.getenv("INFERENCE_BATCH_MAX_SIZE", "8"))
+INFERENCE_BATCH_WINDOW_MS = float(os.getenv("INFERENCE_BATCH_WINDOW_MS", "10"))
+
+# 推理执行器配置（阻塞推理在独立线程池/进程池中执行，超出排队上限时返回503）
+INFERENCE_EXECUTOR_TYPE = os.getenv("INFERENCE_EXECUTOR_TYPE", "thread")  # thread 或 process
+INFERENCE_EXECUTOR_WORKERS = int(os.getenv("INFERENCE_EXECUTOR_WORKERS", "4"))
+INFERENCE_QUEUE_SIZE = int(os.getenv("INFERENCE_QUEUE_SIZE", "16"))
+
+# 多进程推理工作池（0表示不启用，在API进程内推理）
+INFERENCE_PROCESS_WORKERS = int(os.getenv("INFERENCE_PROCESS_WORKERS", "0"))
+INFERENCE_WORKER_THREADS = int(os.getenv("INFERENCE_WORKER_THREADS", "0"))  # 每个工作进程的torch线程数，0为自动
+INFERENCE_WORKER_TIMEOUT = float(os.getenv("INFERENCE_WORKER_TIMEOUT", "120"))
+
+# 模型注册表：内存中最多保留的已加载模型数量和内存预算，激活新模型时的预热次数
+MODEL_REGISTRY_MAX_MODELS = int(os.getenv("MODEL_REGISTRY_MAX_MODELS", "4"))
+MODEL_REGISTRY_MAX_MB = int(os.getenv("MODEL_REGISTRY_MAX_MB", "1024"))
+MODEL_WARMUP_RUNS = int(os.getenv("MODEL_WARMUP_RUNS", "2"))
+MODEL_WARMUP_IMGSZ = int(os.getenv("MODEL_WARMUP_IMGSZ", str(EXPORT_IMGSZ)))  # 预热用合成图片的边长
+
+# 启动时预加载并预热当前的检测/分割模型，完成后 /ready 才返回就绪
+MODEL_PRELOAD_ON_STARTUP = os.getenv("MODEL_PRELOAD_ON_STARTUP", "true").lower() in ("1", "true", "yes")
+
+# 分割多边形提取：mask数量达到阈值时用线程池并行提取轮廓（POLYGON_WORKERS<=1 表示不并行）
+POLYGON_WORKERS = int(os.getenv("POLYGON_WORKERS", str(min(4, os.cpu_count() or 1))))
+POLYGON_PARALLEL_MIN_MASKS = int(os.getenv("POLYGON_PARALLEL_MIN_MASKS", "8"))
+
+# 切片推理（高分辨率图片切成重叠小块分别推理后合并），请求中 tiled=true 时使用
+TILE_SIZE = int(os.getenv("TILE_SIZE", "640"))
+TILE_OVERLAP = float(os.getenv("TILE_OVERLAP", "0.2"))  # 相邻切片的重叠比例
+TILE_NMS_THRESHOLD = float(os.getenv("TILE_NMS_THRESHOLD", "0.5"))  # 合并时的重叠阈值（交集/较小框面积）
+TILE_BATCH_SIZE = int(os.getenv("TILE_BATCH_SIZE", "16"))  # 一次前向推理的最大切片数
+TILE_INCLUDE_FULL_IMAGE = os.getenv("TILE_INCLUDE_FULL_IMAGE", "true").lower() in ("1", "true", "yes")  # 同时推理整图，保留跨切片的大瑕疵
+
+# 推理结果缓存（按图片内容哈希+模型+推理参数缓存，切换模型时失效）
+RESULT_CACHE_ENABLED = os.getenv("RESULT_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+RESULT_CACHE_MAX_ENTRIES = int(os.getenv("RESULT_CACHE_MAX_ENTRIES", "512"))
+RESULT_CACHE_MAX_MB = int(os.getenv("RESULT_CACHE_MAX_MB", "64"))
+RESULT_CACHE_DISK_ENABLED = os.getenv("RESULT_CACHE_DISK_ENABLED", "false").lower() in ("1", "true", "yes")
+RESULT_CACHE_DIR = DATA_DIR / "result_cache"
+
+# LabelStudio ML后端：predict时并发获取任务图片的最大数量
+ML_BACKEND_FETCH_CONCURRENCY = int(os.getenv("ML_BACKEND_FETCH_CONCURRENCY", "8"))
+# 预标注结果类型：polygonlabels（多边形）或 brushlabels（画笔RLE，不提取轮廓）
+ML_BACKEND_RESULT_TYPE = os.getenv("ML_BACKEND_RESULT_TYPE", "polygonlabels")
+
+# ML后端图片下载缓存（按内容哈希存储，ETag重新验证，超出预算按LRU淘汰）
+IMAGE_CACHE_ENABLED = os.getenv("IMAGE_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+IMAGE_CACHE_DIR = Path(os.getenv("IMAGE_CACHE_DIR", str(DATA_DIR / "image_cache")))
+IMAGE_CACHE_MAX_MB = int(os.getenv("IMAGE_CACHE_MAX_MB", "512"))
+IMAGE_CACHE_REVALIDATE_SECONDS = float(os.getenv("IMAGE_CACHE_REVALIDATE_SECONDS", "60"))  # 在此时间内再次使用不重新验证
+IMAGE_CACHE_INDEX_FLUSH_SECONDS = float(os.getenv("IMAGE_CACHE_INDEX_FLUSH_SECONDS", "5"))  # 索引最多每隔此时间写入一次
+
+# LabelStudio批量预标注任务（后台遍历项目所有任务，分批推理并批量导入预测结果）
+PREANNOTATION_JOBS_FILE = DATA_DIR / "preannotation_jobs.json"
+PREANNOTATION_PAGE_SIZE = int(os.getenv("PREANNOTATION_PAGE_SIZE", "100"))  # 每页任务数，每页完成后保存检查点
+PREANNOTATION_IMPORT_CHUNK = int(os.getenv("PREANNOTATION_IMPORT_CHUNK", "100"))  # 每次批量导入的预测数
+PREANNOTATION_INFERENCE_CONCURRENCY = int(os.getenv("PREANNOTATION_INFERENCE_CONCURRENCY", "1"))  # 每个任务同时提交到推理执行器的批数，其余名额留给在线请求
+PREANNOTATION_MODEL_VERSION = os.getenv("PREANNOTATION_MODEL_VERSION", "yolo-seg")
+PREANNOTATION_RESUME_ON_STARTUP = os.getenv("PREANNOTATION_RESUME_ON_STARTUP", "true").lower() in ("1", "true", "yes")  # 启动时恢复中断的任务
+
+# LabelStudio批量导入任务（按数量和大小分块，并发发送，可重试的错误自动退避重试，失败后从未完成的分块恢复）
+TASK_IMPORT_JOBS_FILE = DATA_DIR / "task_import_jobs.json"
+TASK_IMPORT_DIR = DATA_DIR / "task_imports"  # 待导入的任务内容（恢复时读取，完成后删除）
+TASK_IMPORT_CHUNK_SIZE = int(os.getenv("TASK_IMPORT_CHUNK_SIZE", "500"))  # 每块最多任务数
+TASK_IMPORT_CHUNK_MAX_MB = float(os.getenv("TASK_IMPORT_CHUNK_MAX_MB", "8"))  # 每块最大请求体（JSON）大小
+TASK_IMPORT_CONCURRENCY = int(os.getenv("TASK_IMPORT_CONCURRENCY", "4"))  # 同时发送的分块数
+TASK_IMPORT_MAX_RETRIES = int(os.getenv("TASK_IMPORT_MAX_RETRIES", "5"))
+TASK_IMPORT_RETRY_BACKOFF = float(os.getenv("TASK_IMPORT_RETRY_BACKOFF", "1.0"))  # 首次重试等待秒数，之后指数增长
+TASK_IMPORT_TIMEOUT = float(os.getenv("TASK_IMPORT_TIMEOUT", "120"))  # 单个分块的请求超时
+TASK_IMPORT_RESUME_ON_STARTUP = os.getenv("TASK_IMPORT_RESUME_ON_STARTUP", "true").lower() in ("1", "true", "yes")
+
+# 请求/响应内容日志：按比例抽样，长字符串（如base64图片）截断，整条日志限制长度
+PAYLOAD_LOG_SAMPLE_RATE = float(os.getenv("PAYLOAD_LOG_SAMPLE_RATE", "0.01"))
+PAYLOAD_LOG_MAX_CHARS = int(os.getenv("PAYLOAD_LOG_MAX_CHARS", "2000"))
+
+# 共享HTTP客户端（LabelStudio API和图片下载共用连接池）
+HTTP_TIMEOUT = float(os.getenv("HTTP_TIMEOUT", "30"))
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "5"))
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "100"))
+HTTP_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("HTTP_MAX_KEEPALIVE_CONNECTIONS", "20"))
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "30"))
+HTTP_MAX_PER_HOST = int(os.getenv("HTTP_MAX_PER_HOST", "16"))  # 每个主机的最大并发请求数，0为不限制
+HTTP_RETRIES = int(os.getenv("HTTP_RETRIES", "3"))  # 幂等请求的最大重试次数
+HTTP_RETRY_BACKOFF = float(os.getenv("HTTP_RETRY_BACKOFF", "0.2"))  # 首次重试等待秒数，之后指数增长
+HTTP2_ENABLED = os.getenv("HTTP2_ENABLED", "true").lower() in ("1", "true", "yes")  # 需要安装h2
+
 # 允许的文件类型
 ALLOWED_EXTENSIONS = {".jpg", ".jpeg", ".png", ".bmp"}
 
+# 上传：按固定大小的块流式写入磁盘（同时计算SHA-256），超出大小上限时中止（413）
+UPLOAD_CHUNK_SIZE_KB = int(os.getenv("UPLOAD_CHUNK_SIZE_KB", "1024"))
+MAX_IMAGE_UPLOAD_MB = float(os.getenv("MAX_IMAGE_UPLOAD_MB", "50"))
+MAX_MODEL_UPLOAD_MB = float(os.getenv("MAX_MODEL_UPLOAD_MB", "2048"))
+MAX_DATASET_UPLOAD_MB = float(os.getenv("MAX_DATASET_UPLOAD_MB", "20480"))
+# 数据集分块上传（可断点续传）：未完成的上传保存在此目录，超过过期时间未更新的被清理
+CHUNKED_UPLOAD_DIR = Path(os.getenv("CHUNKED_UPLOAD_DIR", str(DATA_DIR / "chunked_uploads")))
+CHUNKED_UPLOAD_EXPIRE_HOURS = float(os.getenv("CHUNKED_UPLOAD_EXPIRE_HOURS", "24"))
+
 # FastAPI配置
 API_PREFIX = "/api/v1"
 
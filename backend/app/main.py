@@ -1,9 +1,24 @@
+import asyncio
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
+from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 from pathlib import Path
-from app.config import UPLOAD_DIR
-from app.api import detection, upload, labelstudio, training, model
+from app.config import (
+    UPLOAD_DIR,
+    MODEL_PRELOAD_ON_STARTUP,
+    PREANNOTATION_RESUME_ON_STARTUP,
+    TASK_IMPORT_RESUME_ON_STARTUP,
+)
+from app.api import detection, upload, labelstudio, training, model, metrics
+from app.services.http_client import start_http_client, close_http_client
+from app.services.image_cache import flush_image_cache, get_image_cache
+from app.services.inference_executor import get_inference_executor
+from app.services.preannotation_service import get_preannotation_service
+from app.services.task_import_service import get_task_import_service
+from app.services.worker_pool import get_worker_pool, shutdown_worker_pool, worker_pool_enabled
+from app.services.warmup_service import get_warmup_state
 try:
     from app.api import ml_backend
     print("✅ ML后端模块导入成功")
@@ -18,10 +33,38 @@ except Exception as e:
     traceback.print_exc()
     ml_backend = None
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """应用生命周期：启动时初始化资源，关闭时释放"""
+    # 共享HTTP客户端（LabelStudio API和图片下载复用连接池）
+    await start_http_client()
+    # 图片下载缓存的索引在线程中加载，避免第一个请求在事件循环中读取索引文件
+    await asyncio.to_thread(get_image_cache)
+    # 多进程推理模式下预先启动工作进程
+    if worker_pool_enabled():
+        get_worker_pool().start()
+    # 后台预加载并预热模型，不阻塞服务启动；完成前 /ready 返回503
+    get_warmup_state().start(enabled=MODEL_PRELOAD_ON_STARTUP)
+    # 从检查点恢复上次中断的批量预标注任务
+    if PREANNOTATION_RESUME_ON_STARTUP:
+        await get_preannotation_service().resume_interrupted()
+    # 恢复上次中断的批量导入任务（只发送未完成的分块）
+    if TASK_IMPORT_RESUME_ON_STARTUP:
+        await get_task_import_service().resume_interrupted()
+    yield
+    await get_task_import_service().shutdown()
+    await get_preannotation_service().shutdown()
+    await close_http_client()
+    flush_image_cache()
+    shutdown_worker_pool()
+    # 关闭推理执行器
+    get_inference_executor().shutdown(wait=False)
+
 app = FastAPI(
     title="乐器瑕疵检测API",
     description="基于YoloV8的乐器瑕疵检测服务 - 一体化标注训练模型管理平台",
-    version="2.0.0"
+    version="2.0.0",
+    lifespan=lifespan
 )
 
 # 配置CORS，允许前端访问
@@ -33,6 +76,9 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# 请求耗时和阶段耗时统计（/metrics、Server-Timing响应头）
+app.add_middleware(metrics.MetricsMiddleware)
+
 # 静态文件服务（用于访问上传的图片）
 app.mount("/static", StaticFiles(directory=str(UPLOAD_DIR)), name="static")
 
@@ -42,6 +88,8 @@ app.include_router(detection.router, prefix="/api/v1")
 app.include_router(labelstudio.router, prefix="/api/v1")
 app.include_router(training.router, prefix="/api/v1")
 app.include_router(model.router, prefix="/api/v1")
+# Prometheus指标（不加前缀，/metrics）
+app.include_router(metrics.router)
 # LabelStudio ML后端路由
 if ml_backend is not None:
     app.include_router(ml_backend.router, prefix="/api/v1/ml")
@@ -57,3 +105,9 @@ async def root():
 async def health():
     return {"status": "healthy"}
 
+@app.get("/ready")
+async def ready():
+    """就绪探针：模型预加载和预热完成后才返回200"""
+    state = get_warmup_state()
+    return JSONResponse(status_code=200 if state.ready else 503, content=state.to_dict())
+
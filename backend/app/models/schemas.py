@@ -4,7 +4,20 @@ from datetime import datetime
 from enum import Enum
 
 class DetectionRequest(BaseModel):
+    model_config = ConfigDict(protected_namespaces=())
+    
     image_path: str
+    model_id: Optional[str] = None  # 指定使用的模型（用于A/B对比），为空时使用当前激活的模型
+    tiled: bool = False  # 切片推理（高分辨率图片）
+    
+class BatchDetectionRequest(BaseModel):
+    """批量检测/分割请求：上传目录中的文件名列表"""
+    model_config = ConfigDict(protected_namespaces=())
+    
+    filenames: List[str]
+    model_id: Optional[str] = None
+    conf_threshold: float = 0.25  # 仅分割使用
+    tiled: bool = False
     
 class BoundingBox(BaseModel):
     x1: float
@@ -25,12 +38,15 @@ class SegmentMask(BaseModel):
     bbox: BoundingBox  # 边界框
     confidence: float
     class_name: str
+    rle: Optional[List[int]] = None  # LabelStudio画笔RLE（mask_format为rle时，此时polygon为空）
 
 class SegmentResult(BaseModel):
     """分割结果"""
     image_path: str
     masks: List[SegmentMask]
     timestamp: datetime
+    image_width: Optional[int] = None  # 原图尺寸（转换为LabelStudio百分比坐标时使用）
+    image_height: Optional[int] = None
 
 class DetectionResult(BaseModel):
     image_path: str
@@ -41,6 +57,8 @@ class UploadResponse(BaseModel):
     filename: str
     file_path: str
     message: str
+    size: Optional[int] = None  # bytes
+    sha256: Optional[str] = None
 
 class DetectionResponse(BaseModel):
     success: bool
@@ -65,6 +83,125 @@ class LabelStudioTaskResponse(BaseModel):
     tasks: Optional[List[LabelStudioTask]] = None
     error: Optional[str] = None
 
+# 批量预标注相关模型
+class PreannotationStatus(str, Enum):
+    PENDING = "pending"
+    RUNNING = "running"
+    COMPLETED = "completed"
+    FAILED = "failed"
+    CANCELLED = "cancelled"
+
+class PreannotationJobCreate(BaseModel):
+    model_config = ConfigDict(protected_namespaces=())
+    
+    model_id: Optional[str] = None  # 为空时使用当前激活的分割模型
+    conf_threshold: float = 0.25
+    skip_labeled: bool = True  # 跳过已有标注或预测的任务（恢复任务时不会重复导入）
+    page_size: Optional[int] = None
+    result_type: Optional[str] = None  # polygonlabels 或 brushlabels，为空时使用 ML_BACKEND_RESULT_TYPE
+
+class PreannotationJob(BaseModel):
+    """批量预标注任务，next_page为检查点：之前的页都已完成并导入"""
+    model_config = ConfigDict(protected_namespaces=())
+    
+    id: str
+    project_id: int
+    status: PreannotationStatus
+    model_id: Optional[str] = None
+    model_version: str
+    conf_threshold: float = 0.25
+    skip_labeled: bool = True
+    page_size: int = 100
+    result_type: str = "polygonlabels"
+    next_page: int = 1
+    total_tasks: Optional[int] = None
+    processed_tasks: int = 0  # 已处理（含跳过和失败）
+    skipped_tasks: int = 0
+    failed_tasks: int = 0
+    predictions_imported: int = 0
+    throughput: float = 0.0  # 任务/秒（本次运行）
+    eta_seconds: Optional[float] = None
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    completed_at: Optional[datetime] = None
+    error: Optional[str] = None
+
+class PreannotationJobResponse(BaseModel):
+    success: bool
+    job: Optional[PreannotationJob] = None
+    jobs: Optional[List[PreannotationJob]] = None
+    error: Optional[str] = None
+
+# LabelStudio批量导入任务相关模型
+class TaskImportStatus(str, Enum):
+    PENDING = "pending"
+    RUNNING = "running"
+    COMPLETED = "completed"
+    FAILED = "failed"
+    CANCELLED = "cancelled"
+
+class TaskImportJobCreate(BaseModel):
+    tasks: List[Dict[str, Any]]  # LabelStudio任务，如 {"data": {"image": "..."}}
+    chunk_size: Optional[int] = None  # 每块最多任务数，为空时使用 TASK_IMPORT_CHUNK_SIZE
+    concurrency: Optional[int] = None  # 同时发送的分块数，为空时使用 TASK_IMPORT_CONCURRENCY
+
+class TaskImportJob(BaseModel):
+    """批量导入任务，chunks为各分块在任务列表中的 [起始, 结束) 位置，completed_chunks为检查点"""
+    id: str
+    project_id: int
+    status: TaskImportStatus
+    total_tasks: int
+    chunks: List[List[int]] = []
+    concurrency: int = 4
+    completed_chunks: List[int] = []
+    failed_chunks: List[int] = []  # 上次运行中重试后仍失败的分块，恢复时重新发送
+    imported_tasks: int = 0
+    retries: int = 0
+    throughput: float = 0.0  # 任务/秒（本次运行）
+    eta_seconds: Optional[float] = None
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    completed_at: Optional[datetime] = None
+    error: Optional[str] = None
+
+class TaskImportJobResponse(BaseModel):
+    success: bool
+    job: Optional[TaskImportJob] = None
+    jobs: Optional[List[TaskImportJob]] = None
+    error: Optional[str] = None
+
+# LabelStudio → YOLO数据集同步相关模型
+class DatasetSyncRequest(BaseModel):
+    val_ratio: Optional[float] = None  # 为空时使用上次同步的比例（首次为 DATASET_SYNC_VAL_RATIO）
+    full: bool = False  # 忽略清单，重新下载并检查所有任务（内容相同的图片文件不会重复写入）
+
+class DatasetSyncResult(BaseModel):
+    """一次同步的结果，dataset_path 为data.yaml路径，可直接作为训练任务的 dataset_path"""
+    project_id: int
+    dataset_dir: str
+    dataset_path: str
+    names: List[str] = []
+    total_tasks: int = 0  # 已标注的任务数
+    images: int = 0  # 去重后的图片数
+    train_images: int = 0
+    val_images: int = 0
+    added: int = 0
+    updated: int = 0
+    removed: int = 0
+    unchanged: int = 0
+    failed: int = 0
+    duplicates: int = 0  # 图片内容与其他任务相同的任务数（只保留一份）
+    skipped_regions: int = 0  # 无法转换为YOLO格式的标注区域（如画笔）
+    images_downloaded: int = 0
+    bytes_downloaded: int = 0
+    duration_seconds: float = 0.0
+    synced_at: datetime
+
+class DatasetSyncResponse(BaseModel):
+    success: bool
+    result: Optional[DatasetSyncResult] = None
+    error: Optional[str] = None
+
 # 训练相关模型
 class TrainingStatus(str, Enum):
     PENDING = "pending"
@@ -109,6 +246,28 @@ class TrainingTaskResponse(BaseModel):
     tasks: Optional[List[TrainingTask]] = None
     error: Optional[str] = None
 
+class ChunkedUploadCreate(BaseModel):
+    filename: str  # 数据集ZIP文件名
+    size: int  # 文件总大小（bytes）
+    sha256: Optional[str] = None  # 完成时校验
+
+class ChunkedUpload(BaseModel):
+    """数据集分块上传，offset为已接收的字节数（断点续传时从此处继续发送）"""
+    id: str
+    filename: str
+    size: int
+    offset: int = 0
+    sha256: Optional[str] = None  # 完成后为实际的SHA-256
+    completed: bool = False
+    path: Optional[str] = None  # 完成后数据集文件的路径
+    created_at: datetime
+    updated_at: datetime
+
+class ChunkedUploadResponse(BaseModel):
+    success: bool
+    upload: Optional[ChunkedUpload] = None
+    error: Optional[str] = None
+
 # 模型管理相关模型
 class ModelType(str, Enum):
     DETECTION = "detection"  # 检测模型
@@ -131,6 +290,11 @@ class ModelMetadata(BaseModel):
     trained_at: Optional[datetime] = None
     training_task_id: Optional[str] = None
     description: Optional[str] = None
+    quantization: Optional[str] = None  # 量化方式（如 int8），None表示原始FP32模型
+    base_model_id: Optional[str] = None  # 量化模型对应的原始模型ID
+    accuracy_delta: Optional[float] = None  # 量化后相对原始模型的精度变化
+    accuracy_delta_metric: Optional[str] = None  # 精度变化使用的指标（mAP50-95 或 agreement_f1）
+    sha256: Optional[str] = None  # 上传的模型文件的SHA-256
     is_active: bool = False
     created_at: datetime
 
@@ -139,6 +303,13 @@ class ModelUpload(BaseModel):
     description: Optional[str] = None
     training_task_id: Optional[str] = None
 
+class QuantizationRequest(BaseModel):
+    """INT8量化请求"""
+    calibration_data: Optional[str] = None  # 数据集yaml或图片目录，默认从上传目录采样
+    num_samples: int = 100  # 校准图片数量
+    name: Optional[str] = None
+    description: Optional[str] = None
+
 class ModelResponse(BaseModel):
     success: bool
     model: Optional[ModelMetadata] = None
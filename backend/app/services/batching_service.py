@@ -0,0 +1,186 @@
+"""
+推理微批处理服务
+在一个短时间窗口内收集并发的推理请求，合并成一次批量前向推理，再把结果分发回各个调用方
+"""
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from typing import Any, Callable, Deque, Dict, Hashable, List, Optional
+
+
+class _PendingItem:
+    """等待批处理的单个请求"""
+
+    __slots__ = ("key", "payload", "future", "enqueued_at")
+
+    def __init__(self, key: Hashable, payload: Any):
+        self.key = key
+        self.payload = payload
+        self.future: Future = Future()
+        self.enqueued_at = time.perf_counter()
+
+
+class MicroBatcher:
+    """微批处理器
+
+    调用方通过 submit() 提交单个请求并阻塞等待结果；后台线程在
+    max_wait_ms 窗口内或凑满 max_batch_size 后调用 batch_fn 执行一次批量推理。
+    只有 key 相同的请求才会被合并（例如分割请求的置信度阈值不同则不能合并）。
+
+    batch_fn(key, payloads) 必须返回与 payloads 等长、顺序一致的结果列表；
+    某一项为异常对象时只有该请求失败（例如无法解码的图片），同批的其他请求照常返回结果。
+    """
+
+    def __init__(self, name: str, batch_fn: Callable[[Hashable, List[Any]], List[Any]],
+                 max_batch_size: int = 8, max_wait_ms: float = 10.0):
+        self.name = name
+        self.batch_fn = batch_fn
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000.0
+
+        self._queue: Deque[_PendingItem] = deque()
+        self._cond = threading.Condition()
+        self._closed = False
+
+        # 统计信息
+        self._stats_lock = threading.Lock()
+        self._total_batches = 0
+        self._total_items = 0
+        self._batch_size_hist: Dict[int, int] = {}
+        self._queue_delays: Deque[float] = deque(maxlen=1000)
+        self._batch_durations: Deque[float] = deque(maxlen=1000)
+
+        self._worker = threading.Thread(target=self._run, name=f"batcher-{name}", daemon=True)
+        self._worker.start()
+
+    def submit(self, payload: Any, key: Hashable = None, timeout: Optional[float] = None) -> Any:
+        """提交一个请求并等待其结果"""
+        return self.submit_async(payload, key).result(timeout=timeout)
+
+    def submit_async(self, payload: Any, key: Hashable = None) -> Future:
+        """提交一个请求，返回 concurrent.futures.Future"""
+        item = _PendingItem(key, payload)
+        with self._cond:
+            if self._closed:
+                raise RuntimeError(f"批处理器 {self.name} 已关闭")
+            self._queue.append(item)
+            self._cond.notify()
+        return item.future
+
+    def close(self):
+        """关闭批处理器，未处理的请求会被取消"""
+        with self._cond:
+            self._closed = True
+            pending = list(self._queue)
+            self._queue.clear()
+            self._cond.notify_all()
+        for item in pending:
+            item.future.cancel()
+
+    @property
+    def queue_depth(self) -> int:
+        return len(self._queue)
+
+    def _collect_batch(self) -> List[_PendingItem]:
+        """等待第一个请求，然后在时间窗口内尽量凑满同一个key的批次"""
+        with self._cond:
+            while not self._queue and not self._closed:
+                self._cond.wait()
+            if self._closed:
+                return []
+
+            first = self._queue.popleft()
+            batch = [first]
+            deadline = first.enqueued_at + self.max_wait
+
+            while len(batch) < self.max_batch_size:
+                # 取出队列中所有同key的请求，其他key留在队列里下一批处理
+                skipped: List[_PendingItem] = []
+                while self._queue and len(batch) < self.max_batch_size:
+                    item = self._queue.popleft()
+                    if item.key == first.key:
+                        batch.append(item)
+                    else:
+                        skipped.append(item)
+                self._queue.extendleft(reversed(skipped))
+
+                remaining = deadline - time.perf_counter()
+                if len(batch) >= self.max_batch_size or remaining <= 0 or self._closed:
+                    break
+                self._cond.wait(timeout=remaining)
+
+            return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect_batch()
+            if not batch:
+                if self._closed:
+                    return
+                continue
+
+            started = time.perf_counter()
+            payloads = [item.payload for item in batch]
+            try:
+                results = self.batch_fn(batch[0].key, payloads)
+                if len(results) != len(batch):
+                    raise RuntimeError(
+                        f"批处理结果数量不匹配: 期望 {len(batch)}, 实际 {len(results)}"
+                    )
+                for item, result in zip(batch, results):
+                    if isinstance(result, BaseException):
+                        item.future.set_exception(result)
+                    else:
+                        item.future.set_result(result)
+            except BaseException as e:
+                for item in batch:
+                    if not item.future.done():
+                        item.future.set_exception(e)
+            finally:
+                self._record(batch, started)
+
+    def _record(self, batch: List[_PendingItem], started: float):
+        finished = time.perf_counter()
+        with self._stats_lock:
+            size = len(batch)
+            self._total_batches += 1
+            self._total_items += size
+            self._batch_size_hist[size] = self._batch_size_hist.get(size, 0) + 1
+            for item in batch:
+                self._queue_delays.append(started - item.enqueued_at)
+            self._batch_durations.append(finished - started)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取批处理统计信息（批大小分布、排队延迟），用于调优吞吐与延迟"""
+        with self._stats_lock:
+            delays = sorted(self._queue_delays)
+            durations = list(self._batch_durations)
+            total_batches = self._total_batches
+            total_items = self._total_items
+            hist = dict(sorted(self._batch_size_hist.items()))
+
+        def _pct(values: List[float], q: float) -> float:
+            if not values:
+                return 0.0
+            idx = min(len(values) - 1, int(round(q * (len(values) - 1))))
+            return values[idx] * 1000.0
+
+        return {
+            "name": self.name,
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000.0,
+            "queue_depth": self.queue_depth,
+            "total_batches": total_batches,
+            "total_items": total_items,
+            "avg_batch_size": (total_items / total_batches) if total_batches else 0.0,
+            "batch_size_histogram": hist,
+            "queue_delay_ms": {
+                "avg": (sum(delays) / len(delays) * 1000.0) if delays else 0.0,
+                "p50": _pct(delays, 0.5),
+                "p95": _pct(delays, 0.95),
+                "max": (delays[-1] * 1000.0) if delays else 0.0,
+            },
+            "avg_batch_duration_ms": (sum(durations) / len(durations) * 1000.0) if durations else 0.0,
+        }
+
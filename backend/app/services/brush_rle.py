@@ -0,0 +1,97 @@
+"""
+LabelStudio画笔标注（brushlabels）的RLE编码
+格式与LabelStudio前端（@thi.ng/rle-pack）和 label-studio-converter 的 decode_rle 一致：
+- 头部：32位数值个数、5位(字长-1)、4个4位(游程长度位数-1)
+- 记录：1位标志（1为重复值）、2位长度位数的下标、该位数的(游程长度-1)、字长位的值
+图片按RGBA展平（每个像素4个值），mask内的像素为255。
+直接由游程生成比特流（不逐个像素处理），全部用numpy向量化完成
+"""
+from typing import List
+import numpy as np
+
+WORD_SIZE = 8
+RLE_SIZES = (3, 4, 8, 16)
+CHANNELS = 4
+MASK_VALUE = 255
+
+_SIZE_BITS = np.array(RLE_SIZES, dtype=np.int64)
+_SIZE_LIMITS = np.left_shift(1, _SIZE_BITS)
+_MAX_RUN = int(_SIZE_LIMITS[-1])
+
+
+def _pack_codes(codes: np.ndarray, widths: np.ndarray) -> List[int]:
+    """把一组变长编码（每个编码占 widths[i] 位，高位在前）拼接为字节列表，末尾补0"""
+    total = int(widths.sum())
+    starts = np.cumsum(widths) - widths
+    owner = np.repeat(np.arange(len(codes)), widths)
+    shift = widths[owner] - 1 - (np.arange(total) - starts[owner])
+    bits = ((codes[owner] >> shift) & 1).astype(np.uint8)
+    return np.packbits(bits).tolist()
+
+
+def encode_runs(lengths: np.ndarray, values: np.ndarray) -> List[int]:
+    """由游程 (长度, 值) 编码为LabelStudio RLE字节列表（只使用重复值记录）"""
+    lengths = np.asarray(lengths, dtype=np.int64)
+    values = np.asarray(values, dtype=np.int64)
+    num = int(lengths.sum())
+
+    # 超过最大长度的游程拆成多条记录
+    pieces = (lengths + _MAX_RUN - 1) // _MAX_RUN
+    record_values = np.repeat(values, pieces)
+    record_lengths = np.full(len(record_values), _MAX_RUN, dtype=np.int64)
+    if len(record_lengths):
+        record_lengths[np.cumsum(pieces) - 1] = lengths - (pieces - 1) * _MAX_RUN
+
+    counts = record_lengths - 1
+    size_index = np.searchsorted(_SIZE_LIMITS, counts, side="right")
+    size_bits = _SIZE_BITS[size_index]
+    record_codes = (
+        np.left_shift(1, 2 + size_bits + WORD_SIZE)
+        | np.left_shift(size_index, size_bits + WORD_SIZE)
+        | np.left_shift(counts, WORD_SIZE)
+        | record_values
+    )
+
+    header_codes = np.array([num, WORD_SIZE - 1] + [size - 1 for size in RLE_SIZES], dtype=np.int64)
+    header_widths = np.array([32, 5] + [4] * len(RLE_SIZES), dtype=np.int64)
+    codes = np.concatenate([header_codes, record_codes])
+    widths = np.concatenate([header_widths, 3 + size_bits + WORD_SIZE])
+    return _pack_codes(codes, widths)
+
+
+def mask_to_rle(mask: np.ndarray) -> List[int]:
+    """整幅二值mask (H, W) 编码为RLE"""
+    height, width = np.asarray(mask).shape[:2]
+    return roi_mask_to_rle(mask, 0, 0, width, height)
+
+
+def roi_mask_to_rle(roi: np.ndarray, x0: int, y0: int, width: int, height: int) -> List[int]:
+    """只给出 (x0, y0) 处的局部mask，编码为 width*height 整幅图片的RLE（局部以外为0）
+
+    不需要构造整幅图片：直接由局部mask每一行的前景区间计算整幅图片展平后的游程
+    """
+    roi = np.asarray(roi) > 0
+    rows, cols = roi.shape
+    padded = np.zeros((rows, cols + 2), dtype=bool)
+    padded[:, 1:-1] = roi
+    # 一次找出所有边沿：每行两端都补了0，按行优先顺序起点和终点交替出现
+    positions = np.flatnonzero(padded[:, 1:] != padded[:, :-1])
+    edge_rows, edge_cols = np.divmod(positions, cols + 1)
+    flat = (y0 + edge_rows) * width + x0 + edge_cols
+    starts, ends = flat[0::2], flat[1::2]
+
+    # 局部区域横跨整行时，相邻两行的前景区间首尾相接，合并为一个游程
+    if len(starts) > 1:
+        separate = starts[1:] != ends[:-1]
+        starts = starts[np.concatenate([[True], separate])]
+        ends = ends[np.concatenate([separate, [True]])]
+
+    total = int(width) * int(height)
+    bounds = np.empty(2 * len(starts) + 2, dtype=np.int64)
+    bounds[0], bounds[-1] = 0, total
+    bounds[1:-1:2], bounds[2:-1:2] = starts, ends
+    lengths = np.diff(bounds)
+    values = np.zeros(len(lengths), dtype=np.int64)
+    values[1::2] = MASK_VALUE
+    keep = lengths > 0
+    return encode_runs(lengths[keep] * CHANNELS, values[keep])
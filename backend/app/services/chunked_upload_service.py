@@ -0,0 +1,223 @@
+"""
+数据集分块上传（断点续传）
+客户端先声明文件名、总大小和可选的SHA-256，得到上传ID；之后按顺序发送任意大小的分块（PUT，带offset），
+请求体直接流式追加到磁盘上的 .part 文件。连接中断后查询已接收的字节数（offset），从该位置继续发送，
+已接收的部分不需要重传。全部接收后计算SHA-256、检查ZIP格式，再移动到 TRAINING_DATA_DIR
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import shutil
+import time
+import uuid
+import zipfile
+from datetime import datetime
+from pathlib import Path
+from typing import AsyncIterator, Dict, Optional
+import aiofiles
+from app.config import (
+    CHUNKED_UPLOAD_DIR,
+    CHUNKED_UPLOAD_EXPIRE_HOURS,
+    MAX_DATASET_UPLOAD_MB,
+    TRAINING_DATA_DIR,
+    UPLOAD_CHUNK_SIZE_KB,
+)
+from app.models.schemas import ChunkedUpload, ChunkedUploadCreate
+from app.services.file_service import MB, UploadTooLargeError, check_upload_size, normalize_sha256
+
+logger = logging.getLogger(__name__)
+
+
+class UploadOffsetError(ValueError):
+    """分块的起始位置与已接收的字节数不一致（接口返回409，客户端从 current_offset 继续）"""
+
+    def __init__(self, message: str, current_offset: int):
+        super().__init__(message)
+        self.current_offset = current_offset
+
+
+def _normalize_upload_id(upload_id: str) -> Optional[str]:
+    """上传ID只能是uuid（防止路径穿越），不是时返回None"""
+    try:
+        return str(uuid.UUID(upload_id))
+    except ValueError:
+        return None
+
+
+def _file_sha256(path: Path, chunk_size: int) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                return digest.hexdigest()
+            digest.update(chunk)
+
+
+class ChunkedUploadService:
+    """分块上传管理：<ID>.json 保存上传信息，<ID>.part 为已接收的内容（其大小即offset）"""
+
+    def __init__(self, upload_dir: Path = CHUNKED_UPLOAD_DIR, target_dir: Path = TRAINING_DATA_DIR,
+                 max_bytes: int = int(MAX_DATASET_UPLOAD_MB * MB),
+                 expire_seconds: float = CHUNKED_UPLOAD_EXPIRE_HOURS * 3600):
+        self.upload_dir = Path(upload_dir)
+        self.target_dir = Path(target_dir)
+        self.max_bytes = max_bytes
+        self.expire_seconds = expire_seconds
+        self.chunk_size = max(1, UPLOAD_CHUNK_SIZE_KB) * 1024
+        # 同一上传的分块串行写入
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self.upload_dir.mkdir(parents=True, exist_ok=True)
+
+    def _meta_path(self, upload_id: str) -> Path:
+        return self.upload_dir / f"{upload_id}.json"
+
+    def _part_path(self, upload_id: str) -> Path:
+        return self.upload_dir / f"{upload_id}.part"
+
+    def _save(self, upload: ChunkedUpload):
+        path = self._meta_path(upload.id)
+        tmp_path = path.with_suffix(".tmp")
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(upload.model_dump(mode="json"), f, ensure_ascii=False, indent=2)
+        tmp_path.replace(path)
+
+    def get(self, upload_id: str) -> Optional[ChunkedUpload]:
+        """获取上传状态；未完成的上传以 .part 文件的实际大小为offset（写入中断时也准确）"""
+        upload_id = _normalize_upload_id(upload_id)
+        if upload_id is None:
+            return None
+        try:
+            with open(self._meta_path(upload_id), 'r', encoding='utf-8') as f:
+                upload = ChunkedUpload(**json.load(f))
+        except (OSError, ValueError):
+            return None
+        if not upload.completed:
+            try:
+                upload.offset = self._part_path(upload_id).stat().st_size
+            except OSError:
+                upload.offset = 0
+        return upload
+
+    def create(self, upload_create: ChunkedUploadCreate) -> ChunkedUpload:
+        """开始一个分块上传"""
+        self.cleanup_expired()
+        filename = Path(upload_create.filename).name
+        if not filename.endswith('.zip'):
+            raise ValueError("只支持ZIP格式的数据集")
+        if upload_create.size <= 0:
+            raise ValueError("文件大小必须大于0")
+        check_upload_size(upload_create.size, self.max_bytes)
+        now = datetime.now()
+        upload = ChunkedUpload(
+            id=str(uuid.uuid4()),
+            filename=filename,
+            size=upload_create.size,
+            sha256=normalize_sha256(upload_create.sha256),
+            created_at=now,
+            updated_at=now,
+        )
+        self._part_path(upload.id).touch()
+        self._save(upload)
+        return upload
+
+    async def append(self, upload_id: str, offset: int, stream: AsyncIterator[bytes]) -> ChunkedUpload:
+        """从offset处追加一个分块（流式写入），接收完整后完成上传
+
+        连接在分块中途断开时，已写入的部分保留，offset为实际接收的字节数
+        """
+        # 先校验ID和上传是否存在，无效的ID不会在 _locks 中留下记录
+        upload_id = _normalize_upload_id(upload_id)
+        if upload_id is None or not self._meta_path(upload_id).exists():
+            raise KeyError(upload_id)
+        lock = self._locks.setdefault(upload_id, asyncio.Lock())
+        async with lock:
+            upload = self.get(upload_id)
+            if upload is None:
+                raise KeyError(upload_id)
+            if upload.completed:
+                raise UploadOffsetError("上传已完成", upload.offset)
+            if offset != upload.offset:
+                raise UploadOffsetError(f"分块起始位置 {offset} 与已接收的 {upload.offset} 字节不一致", upload.offset)
+
+            remaining = upload.size - upload.offset
+            try:
+                async with aiofiles.open(self._part_path(upload.id), 'ab') as f:
+                    async for chunk in stream:
+                        if len(chunk) > remaining:
+                            # 超出声明大小的部分不写入
+                            raise UploadTooLargeError(f"分块超出声明的文件大小 {upload.size} 字节")
+                        await f.write(chunk)
+                        remaining -= len(chunk)
+                        upload.offset += len(chunk)
+            finally:
+                upload.updated_at = datetime.now()
+                self._save(upload)
+
+            if upload.offset == upload.size:
+                await self._complete(upload)
+            return upload
+
+    async def _complete(self, upload: ChunkedUpload):
+        """校验并移动到训练数据目录；校验失败时删除已上传的内容"""
+        part_path = self._part_path(upload.id)
+        sha256 = await asyncio.to_thread(_file_sha256, part_path, self.chunk_size)
+        error = None
+        if upload.sha256 and sha256 != upload.sha256:
+            error = f"SHA-256校验失败: 期望 {upload.sha256}，实际 {sha256}"
+        elif not await asyncio.to_thread(zipfile.is_zipfile, part_path):
+            error = "上传的文件不是有效的ZIP"
+        if error:
+            self.delete(upload.id)
+            raise ValueError(error)
+
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        target_path = self.target_dir / f"{timestamp}_{upload.filename}"
+        await asyncio.to_thread(shutil.move, str(part_path), str(target_path))
+        upload.sha256 = sha256
+        upload.completed = True
+        upload.path = str(target_path)
+        upload.updated_at = datetime.now()
+        self._save(upload)
+        logger.info(f"数据集分块上传完成: {target_path} ({upload.size} 字节)")
+
+    def delete(self, upload_id: str) -> bool:
+        """取消上传（删除已接收的内容），已完成的上传只删除记录"""
+        upload = self.get(upload_id)
+        if upload is None:
+            return False
+        self._part_path(upload.id).unlink(missing_ok=True)
+        self._meta_path(upload.id).unlink(missing_ok=True)
+        self._locks.pop(upload.id, None)
+        return True
+
+    def cleanup_expired(self) -> int:
+        """删除超过过期时间未更新的上传"""
+        if self.expire_seconds <= 0:
+            return 0
+        removed = 0
+        deadline = time.time() - self.expire_seconds
+        for meta_path in self.upload_dir.glob("*.json"):
+            try:
+                if meta_path.stat().st_mtime >= deadline:
+                    continue
+            except OSError:
+                continue
+            lock = self._locks.get(meta_path.stem)
+            if lock is not None and lock.locked():
+                continue
+            if self.delete(meta_path.stem):
+                removed += 1
+        return removed
+
+
+_service: Optional[ChunkedUploadService] = None
+
+
+def get_chunked_upload_service() -> ChunkedUploadService:
+    """获取全局分块上传服务（单例）"""
+    global _service
+    if _service is None:
+        _service = ChunkedUploadService()
+    return _service
@@ -0,0 +1,456 @@
+"""
+LabelStudio → YOLO数据集增量同步
+把项目中已标注的任务写入 TRAINING_DATA_DIR/labelstudio_<项目ID>/（images/、labels/ 下的 train/val 和 data.yaml），
+清单 manifest.json 记录每个任务的图片URL、标注指纹和图片内容哈希：
+再次同步时图片URL未变的任务不重新下载，标注未变的不重写标签，已删除或不再有标注的任务被移除，
+因此下载和磁盘写入量与变化量成正比。图片按内容哈希命名，内容相同的图片只保存一份
+"""
+import asyncio
+import base64
+import hashlib
+import html
+import json
+import logging
+import math
+import os
+import re
+import time
+import uuid
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+import httpx
+import yaml
+from app.config import (
+    TRAINING_DATA_DIR,
+    DATASET_SYNC_PAGE_SIZE,
+    DATASET_SYNC_CONCURRENCY,
+    DATASET_SYNC_VAL_RATIO,
+)
+from app.models.schemas import DatasetSyncResult
+from app.services.http_client import get_http_client
+from app.services.labelstudio_service import LabelStudioService
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_VERSION = 1
+# 图片文件名使用内容哈希（sha256）的前缀
+HASH_PREFIX = 20
+LABEL_TYPES = ("rectanglelabels", "polygonlabels")
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp", ".gif", ".tif", ".tiff", ".webp")
+_MAGIC = (
+    (b"\xff\xd8\xff", ".jpg"),
+    (b"\x89PNG\r\n\x1a\n", ".png"),
+    (b"GIF8", ".gif"),
+    (b"BM", ".bmp"),
+    (b"II*\x00", ".tif"),
+    (b"MM\x00*", ".tif"),
+)
+_LABEL_VALUE = re.compile(r"<Label\b[^>]*?\bvalue\s*=\s*([\"'])(.*?)\1", re.IGNORECASE | re.DOTALL)
+
+
+def image_extension(data: bytes, url: str) -> str:
+    """按文件头判断图片格式，无法判断时使用URL的扩展名"""
+    for magic, ext in _MAGIC:
+        if data.startswith(magic):
+            return ext
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return ".webp"
+    suffix = Path(urlsplit(url).path).suffix.lower()
+    return suffix if suffix in IMAGE_EXTENSIONS else ".jpg"
+
+
+def label_names_from_config(label_config: str) -> List[str]:
+    """从标注配置中按顺序提取类别名（<Label value="...">）"""
+    names: List[str] = []
+    for match in _LABEL_VALUE.finditer(label_config or ""):
+        name = html.unescape(match.group(2))
+        if name not in names:
+            names.append(name)
+    return names
+
+
+def latest_annotation(task: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """任务最新的有效标注（跳过被取消的标注），没有时返回None"""
+    annotations = [a for a in task.get("annotations") or [] if not a.get("was_cancelled")]
+    if not annotations:
+        return None
+    return max(annotations, key=lambda a: (a.get("updated_at") or a.get("created_at") or "", a.get("id") or 0))
+
+
+def fingerprint(value: Any) -> str:
+    """JSON内容的指纹，用于判断标注是否变化"""
+    data = json.dumps(value, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha1(data.encode("utf-8")).hexdigest()
+
+
+def split_for(image_key: str, val_ratio: float) -> str:
+    """按图片内容哈希划分训练/验证集：同一图片每次同步都落在同一侧"""
+    return "val" if int(image_key[:8], 16) / 2 ** 32 < val_ratio else "train"
+
+
+def _clip(value: float) -> float:
+    return min(max(value, 0.0), 1.0)
+
+
+def _rectangle_corners(item: Dict[str, Any], value: Dict[str, Any]) -> List[Tuple[float, float]]:
+    """矩形框的4个角（归一化坐标）；有旋转时按原图像素尺寸绕左上角旋转"""
+    width = item.get("original_width") or 100
+    height = item.get("original_height") or 100
+    x, y = value.get("x", 0) / 100 * width, value.get("y", 0) / 100 * height
+    w, h = value.get("width", 0) / 100 * width, value.get("height", 0) / 100 * height
+    corners = [(0.0, 0.0), (w, 0.0), (w, h), (0.0, h)]
+    rotation = value.get("rotation") or 0
+    if rotation:
+        cos, sin = math.cos(math.radians(rotation)), math.sin(math.radians(rotation))
+        corners = [(cx * cos - cy * sin, cx * sin + cy * cos) for cx, cy in corners]
+    return [((x + cx) / width, (y + cy) / height) for cx, cy in corners]
+
+
+def annotation_to_yolo(result: List[Dict[str, Any]], names: List[str]) -> Tuple[str, int]:
+    """LabelStudio标注结果转换为YOLO标签文本，返回 (标签文本, 跳过的区域数)
+
+    矩形框输出 "类别 cx cy w h"，多边形输出 "类别 x1 y1 x2 y2 ..."（归一化坐标）；
+    同一图片中有多边形时矩形框也输出为4点多边形，保证一个标签文件内格式一致。
+    新出现的类别追加到names末尾（已有类别的下标不变）
+    """
+    regions = []
+    skipped = 0
+    for item in result or []:
+        item_type = item.get("type", "")
+        value = item.get("value") or {}
+        labels = value.get(item_type) if item_type in LABEL_TYPES else None
+        if not labels:
+            # 画笔等无法转换的标注区域；choices、textarea等不是区域，不计数
+            if item_type.endswith("labels"):
+                skipped += 1
+            continue
+        if labels[0] not in names:
+            names.append(labels[0])
+        class_id = names.index(labels[0])
+        if item_type == "rectanglelabels":
+            regions.append((class_id, False, _rectangle_corners(item, value)))
+        else:
+            points = [(x / 100, y / 100) for x, y in value.get("points") or []]
+            if len(points) < 3:
+                skipped += 1
+                continue
+            regions.append((class_id, True, points))
+
+    as_polygons = any(is_polygon for _, is_polygon, _ in regions)
+    lines = []
+    for class_id, is_polygon, points in regions:
+        if as_polygons:
+            coords = " ".join(f"{_clip(x):.6f} {_clip(y):.6f}" for x, y in points)
+            lines.append(f"{class_id} {coords}")
+        else:
+            xs = [_clip(x) for x, _ in points]
+            ys = [_clip(y) for _, y in points]
+            x1, x2, y1, y2 = min(xs), max(xs), min(ys), max(ys)
+            if x2 <= x1 or y2 <= y1:
+                skipped += 1
+                continue
+            lines.append(
+                f"{class_id} {(x1 + x2) / 2:.6f} {(y1 + y2) / 2:.6f} {x2 - x1:.6f} {y2 - y1:.6f}"
+            )
+    return "".join(f"{line}\n" for line in lines), skipped
+
+
+def _write_atomic(path: Path, data: bytes):
+    tmp_path = path.with_name(f"{path.name}.{uuid.uuid4().hex}.tmp")
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+def _unlink(path: Path):
+    try:
+        path.unlink()
+    except OSError:
+        pass
+
+
+class DatasetSyncService:
+    """LabelStudio项目到YOLO数据集的增量同步"""
+
+    def __init__(self, labelstudio: Optional[LabelStudioService] = None, root: Path = TRAINING_DATA_DIR):
+        self.labelstudio = labelstudio or LabelStudioService()
+        self.root = Path(root)
+        # 同一项目的同步串行执行
+        self._locks: Dict[int, asyncio.Lock] = {}
+
+    def dataset_dir(self, project_id: int) -> Path:
+        return self.root / f"labelstudio_{project_id}"
+
+    def load_manifest(self, project_id: int) -> Optional[Dict[str, Any]]:
+        path = self.dataset_dir(project_id) / "manifest.json"
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                manifest = json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logger.warning(f"读取数据集清单失败，将重新同步: {e}")
+            return None
+        return manifest if manifest.get("version") == MANIFEST_VERSION else None
+
+    def get_status(self, project_id: int) -> Optional[DatasetSyncResult]:
+        """上次同步的结果，未同步过时返回None"""
+        manifest = self.load_manifest(project_id)
+        if not manifest or not manifest.get("last_sync"):
+            return None
+        return DatasetSyncResult(**manifest["last_sync"])
+
+    async def sync(self, project_id: int, val_ratio: Optional[float] = None, full: bool = False) -> DatasetSyncResult:
+        """同步项目；full=True时忽略清单中的任务记录，重新下载并检查所有任务"""
+        lock = self._locks.setdefault(project_id, asyncio.Lock())
+        async with lock:
+            return await self._sync(project_id, val_ratio, full)
+
+    async def _sync(self, project_id: int, val_ratio: Optional[float], full: bool) -> DatasetSyncResult:
+        started = time.monotonic()
+        dataset_dir = self.dataset_dir(project_id)
+        manifest = self.load_manifest(project_id) or {}
+        previous: Dict[str, Dict[str, Any]] = manifest.get("tasks", {})
+        old_images: Dict[str, Dict[str, Any]] = manifest.get("images", {})
+        reusable = {} if full else previous
+        if val_ratio is None:
+            val_ratio = manifest.get("val_ratio", DATASET_SYNC_VAL_RATIO)
+        val_ratio = min(max(float(val_ratio), 0.0), 1.0)
+
+        project = await self.labelstudio.get_project(project_id)
+        names: List[str] = list(manifest.get("names", []))
+        for name in label_names_from_config(project.get("label_config", "")):
+            if name not in names:
+                names.append(name)
+
+        for split in ("train", "val"):
+            (dataset_dir / "images" / split).mkdir(parents=True, exist_ok=True)
+            (dataset_dir / "labels" / split).mkdir(parents=True, exist_ok=True)
+
+        tasks = await self._fetch_tasks(project_id)
+
+        # 1. 找出需要下载图片的任务：新任务或图片URL变化的任务
+        tasks_now: Dict[str, Dict[str, Any]] = {}
+        results: Dict[str, List[Dict[str, Any]]] = {}
+        downloads: List[Tuple[str, str]] = []
+        for task in tasks:
+            task_id = str(task.get("id"))
+            image_url = (task.get("data") or {}).get("image")
+            annotation = latest_annotation(task)
+            # 没有图片或还没有标注的任务不属于数据集
+            if not image_url or annotation is None:
+                continue
+            result = annotation.get("result") or []
+            results[task_id] = result
+            old = reusable.get(task_id)
+            if old and old["url"] == image_url:
+                tasks_now[task_id] = {**old, "annotation": fingerprint(result)}
+            else:
+                downloads.append((task_id, image_url))
+
+        stats = {"failed": 0, "images_downloaded": 0, "bytes_downloaded": 0}
+        semaphore = asyncio.Semaphore(max(1, DATASET_SYNC_CONCURRENCY))
+        client = get_http_client()
+
+        async def _download(task_id: str, image_url: str):
+            async with semaphore:
+                try:
+                    data = await self._fetch_image(client, image_url)
+                    key, ext = await asyncio.to_thread(self._store_image, dataset_dir, data, image_url, val_ratio)
+                except Exception as e:
+                    logger.error(f"Task {task_id} 下载图片失败: {e}")
+                    stats["failed"] += 1
+                    old = previous.get(task_id)
+                    # 下载失败时保留上次同步的图片，下次同步重试
+                    if old:
+                        tasks_now[task_id] = {**old, "annotation": fingerprint(results[task_id])}
+                    return
+            stats["images_downloaded"] += 1
+            stats["bytes_downloaded"] += len(data)
+            tasks_now[task_id] = {
+                "url": image_url, "image": key, "ext": ext, "annotation": fingerprint(results[task_id]),
+            }
+
+        await asyncio.gather(*(_download(task_id, image_url) for task_id, image_url in downloads))
+
+        # 2. 同一图片被多个任务引用时，标签取自任务ID最小的任务
+        owners: Dict[str, str] = {}
+        for task_id in sorted(tasks_now, key=int):
+            owners.setdefault(tasks_now[task_id]["image"], task_id)
+
+        images: Dict[str, Dict[str, Any]] = {}
+        moves: List[Tuple[Path, Path]] = []
+        label_writes: List[Tuple[Path, bytes]] = []
+        for key, owner in owners.items():
+            entry = tasks_now[owner]
+            split = split_for(key, val_ratio)
+            label_key = f"{owner}:{entry['annotation']}"
+            old = old_images.get(key)
+            image_path = dataset_dir / "images" / split / f"{key}{entry['ext']}"
+            label_path = dataset_dir / "labels" / split / f"{key}.txt"
+            if old and old["split"] != split:
+                # 验证集比例变化，移动到另一侧
+                moves.append((dataset_dir / "images" / old["split"] / f"{key}{old['ext']}", image_path))
+                moves.append((dataset_dir / "labels" / old["split"] / f"{key}.txt", label_path))
+            skipped = old.get("skipped", 0) if old else 0
+            if full or not old or old.get("label") != label_key:
+                text, skipped = annotation_to_yolo(results[owner], names)
+                label_writes.append((label_path, text.encode("utf-8")))
+            images[key] = {"ext": entry["ext"], "split": split, "label": label_key, "skipped": skipped}
+
+        # 3. 不再被任何任务引用的图片和标签
+        deletions: List[Path] = []
+        for key, old in old_images.items():
+            if key not in images:
+                deletions.append(dataset_dir / "images" / old["split"] / f"{key}{old['ext']}")
+                deletions.append(dataset_dir / "labels" / old["split"] / f"{key}.txt")
+
+        await asyncio.to_thread(self._apply_changes, moves, label_writes, deletions)
+
+        train_images = sum(1 for image in images.values() if image["split"] == "train")
+        val_images = len(images) - train_images
+        await asyncio.to_thread(self._write_data_yaml, dataset_dir, names, val_images > 0)
+
+        added = sum(1 for task_id in tasks_now if task_id not in previous)
+        updated = sum(
+            1 for task_id, entry in tasks_now.items()
+            if task_id in previous and (
+                entry["image"] != previous[task_id]["image"]
+                or entry["annotation"] != previous[task_id]["annotation"]
+            )
+        )
+        result = DatasetSyncResult(
+            project_id=project_id,
+            dataset_dir=str(dataset_dir),
+            dataset_path=str(dataset_dir / "data.yaml"),
+            names=names,
+            total_tasks=len(tasks_now),
+            images=len(images),
+            train_images=train_images,
+            val_images=val_images,
+            added=added,
+            updated=updated,
+            removed=sum(1 for task_id in previous if task_id not in tasks_now),
+            unchanged=len(tasks_now) - added - updated,
+            failed=stats["failed"],
+            duplicates=len(tasks_now) - len(owners),
+            skipped_regions=sum(image["skipped"] for image in images.values()),
+            images_downloaded=stats["images_downloaded"],
+            bytes_downloaded=stats["bytes_downloaded"],
+            duration_seconds=round(time.monotonic() - started, 3),
+            synced_at=datetime.now(),
+        )
+        manifest = {
+            "version": MANIFEST_VERSION,
+            "project_id": project_id,
+            "val_ratio": val_ratio,
+            "names": names,
+            "tasks": tasks_now,
+            "images": images,
+            "last_sync": result.model_dump(mode="json"),
+        }
+        data = json.dumps(manifest, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        await asyncio.to_thread(_write_atomic, dataset_dir / "manifest.json", data)
+        logger.info(
+            f"项目 {project_id} 数据集同步完成: 新增{result.added} 更新{result.updated} 移除{result.removed} "
+            f"未变{result.unchanged} 失败{result.failed}，下载{result.images_downloaded}张图片"
+        )
+        return result
+
+    async def _fetch_tasks(self, project_id: int) -> List[Dict[str, Any]]:
+        """获取项目的所有任务（含标注）：第一页得到总数后，其余分页并发获取"""
+        page_size = max(1, DATASET_SYNC_PAGE_SIZE)
+        tasks, total = await self.labelstudio.get_tasks_page(project_id, 1, page_size, fields="all")
+        tasks = list(tasks)
+        if total is not None:
+            semaphore = asyncio.Semaphore(max(1, DATASET_SYNC_CONCURRENCY))
+
+            async def _page(page: int) -> List[Dict[str, Any]]:
+                async with semaphore:
+                    page_tasks, _ = await self.labelstudio.get_tasks_page(project_id, page, page_size, fields="all")
+                    return page_tasks
+
+            pages = await asyncio.gather(*(_page(page) for page in range(2, math.ceil(total / page_size) + 1)))
+            for page_tasks in pages:
+                tasks.extend(page_tasks)
+        else:
+            # 没有总数时逐页获取，直到不满一页
+            page, page_tasks = 1, tasks
+            while len(page_tasks) >= page_size:
+                page += 1
+                page_tasks, _ = await self.labelstudio.get_tasks_page(project_id, page, page_size, fields="all")
+                tasks.extend(page_tasks)
+
+        # 获取期间有任务增删时分页可能错位，按ID去重
+        unique: Dict[Any, Dict[str, Any]] = {}
+        for task in tasks:
+            unique.setdefault(task.get("id"), task)
+        return list(unique.values())
+
+    async def _fetch_image(self, client: httpx.AsyncClient, image_url: str) -> bytes:
+        """下载任务图片：LabelStudio的相对路径（上传文件、本地存储）加上地址和认证头，支持base64"""
+        if image_url.startswith("data:"):
+            return base64.b64decode(image_url.split(",", 1)[1])
+        headers = None
+        if image_url.startswith("/"):
+            image_url = f"{self.labelstudio.base_url}{image_url}"
+        if image_url.startswith(self.labelstudio.base_url):
+            headers = {k: v for k, v in self.labelstudio.headers.items() if k == "Authorization"}
+        elif not image_url.startswith("http"):
+            raise ValueError(f"无法处理图片URL: {image_url}")
+        response = await client.get(image_url, headers=headers)
+        response.raise_for_status()
+        return response.content
+
+    @staticmethod
+    def _store_image(dataset_dir: Path, data: bytes, image_url: str, val_ratio: float) -> Tuple[str, str]:
+        """按内容哈希保存图片（已存在时不重复写入），返回 (哈希, 扩展名)"""
+        key = hashlib.sha256(data).hexdigest()[:HASH_PREFIX]
+        ext = image_extension(data, image_url)
+        path = dataset_dir / "images" / split_for(key, val_ratio) / f"{key}{ext}"
+        if not path.exists():
+            _write_atomic(path, data)
+        return key, ext
+
+    @staticmethod
+    def _apply_changes(moves: List[Tuple[Path, Path]], label_writes: List[Tuple[Path, bytes]], deletions: List[Path]):
+        for source, target in moves:
+            try:
+                os.replace(source, target)
+            except FileNotFoundError:
+                pass
+        for path, data in label_writes:
+            _write_atomic(path, data)
+        for path in deletions:
+            _unlink(path)
+
+    @staticmethod
+    def _write_data_yaml(dataset_dir: Path, names: List[str], has_val: bool):
+        """写入YOLO数据集配置；没有验证集图片时用训练集验证"""
+        config = {
+            "path": str(dataset_dir),
+            "train": "images/train",
+            "val": "images/val" if has_val else "images/train",
+            "names": dict(enumerate(names)),
+        }
+        data = yaml.safe_dump(config, allow_unicode=True, sort_keys=False).encode("utf-8")
+        path = dataset_dir / "data.yaml"
+        try:
+            if path.read_bytes() == data:
+                return
+        except OSError:
+            pass
+        _write_atomic(path, data)
+
+
+_service: Optional[DatasetSyncService] = None
+
+
+def get_dataset_sync_service() -> DatasetSyncService:
+    """获取全局数据集同步服务（单例）"""
+    global _service
+    if _service is None:
+        _service = DatasetSyncService()
+    return _service
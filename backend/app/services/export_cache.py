@@ -0,0 +1,185 @@
+"""
+LabelStudio导出缓存
+导出的ZIP按 项目ID + 导出格式 + 项目变更标记 保存在磁盘上：项目的任务或标注有变化时标记随之变化，
+同一项目同一格式的旧导出被替换。从LabelStudio流式下载时边转发给客户端边写入临时文件，
+完整下载后才提交到缓存；总大小超出预算时按最近使用时间淘汰
+"""
+import hashlib
+import logging
+import os
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Any, Dict, Optional
+from app.config import (
+    EXPORT_CACHE_ENABLED,
+    EXPORT_CACHE_DIR,
+    EXPORT_CACHE_MAX_MB,
+    EXPORT_CACHE_MAX_AGE,
+)
+
+logger = logging.getLogger(__name__)
+
+
+class ExportWriter:
+    """把流式下载的导出写入临时文件，commit后才出现在缓存中"""
+
+    def __init__(self, cache: "ExportCache", final_path: Path):
+        self.cache = cache
+        self.final_path = final_path
+        self.tmp_path = final_path.with_name(f"{final_path.name}.{uuid.uuid4().hex}.tmp")
+        self.size = 0
+        self._file = open(self.tmp_path, "wb")
+
+    def write(self, chunk: bytes):
+        self._file.write(chunk)
+        self.size += len(chunk)
+
+    def commit(self, expected_size: Optional[int] = None) -> Optional[Path]:
+        """下载完整时提交到缓存；大小与Content-Length不一致时丢弃"""
+        self._file.close()
+        if expected_size is not None and expected_size != self.size:
+            logger.warning(f"导出大小不完整（{self.size}/{expected_size}字节），不缓存")
+            self._remove_tmp()
+            return None
+        return self.cache._commit(self)
+
+    def abort(self):
+        """下载中断（客户端断开或LabelStudio出错）时丢弃临时文件"""
+        self._file.close()
+        self._remove_tmp()
+
+    def _remove_tmp(self):
+        try:
+            self.tmp_path.unlink()
+        except OSError:
+            pass
+
+
+class ExportCache:
+    """导出文件磁盘缓存"""
+
+    def __init__(self, cache_dir: Path, max_bytes: int = 2048 * 1024 * 1024, max_age: float = 3600.0):
+        self.cache_dir = Path(cache_dir)
+        self.max_bytes = max(1, int(max_bytes))
+        # 标记不能反映对已有标注的修改（标注数不变），超过max_age的导出重新获取；0为不限
+        self.max_age = max(0.0, float(max_age))
+        self._lock = threading.Lock()
+        # 文件的mtime为提交时间；最近使用时间只记在内存中（重启后按提交时间）
+        self._last_used: Dict[Path, float] = {}
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        # 清理写入中断留下的临时文件
+        for path in self.cache_dir.glob("*/*/*.tmp"):
+            try:
+                path.unlink()
+            except OSError:
+                pass
+
+    def _path(self, project_id: int, export_type: str, marker: str) -> Path:
+        """<项目ID>/<导出格式>/<标记哈希>.zip"""
+        digest = hashlib.sha256(marker.encode("utf-8")).hexdigest()[:16]
+        return self.cache_dir / str(project_id) / export_type / f"{digest}.zip"
+
+    def lookup(self, project_id: int, export_type: str, marker: str) -> Optional[Path]:
+        """查找与当前标记一致的导出，命中时更新最近使用时间"""
+        path = self._path(project_id, export_type, marker)
+        with self._lock:
+            try:
+                stat = path.stat()
+            except OSError:
+                self._misses += 1
+                return None
+            if self.max_age and time.time() - stat.st_mtime > self.max_age:
+                self._remove(path)
+                self._misses += 1
+                return None
+            self._last_used[path] = time.time()
+            self._hits += 1
+            return path
+
+    def open_writer(self, project_id: int, export_type: str, marker: str) -> ExportWriter:
+        path = self._path(project_id, export_type, marker)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        return ExportWriter(self, path)
+
+    def _commit(self, writer: ExportWriter) -> Path:
+        final_path = writer.final_path
+        with self._lock:
+            os.replace(writer.tmp_path, final_path)
+            # 同一项目同一格式只保留最新的导出
+            for path in final_path.parent.glob("*.zip"):
+                if path != final_path:
+                    self._remove(path)
+            self._evict(keep=final_path)
+        return final_path
+
+    def _evict(self, keep: Optional[Path] = None):
+        """总大小超出预算时删除最久未使用的导出"""
+        files = []
+        for path in self.cache_dir.glob("*/*/*.zip"):
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            files.append((self._last_used.get(path, stat.st_mtime), stat.st_size, path))
+        total = sum(size for _, size, _ in files)
+        # 刚提交的文件最后淘汰（单个文件超出预算时也不保留）
+        files.sort(key=lambda item: (item[2] == keep, item[0]))
+        for _, size, path in files:
+            if total <= self.max_bytes:
+                break
+            self._remove(path)
+            self._evictions += 1
+            total -= size
+
+    def _remove(self, path: Path):
+        # 正在发送的文件已被打开，删除不影响读取
+        self._last_used.pop(path, None)
+        try:
+            path.unlink()
+        except OSError:
+            pass
+
+    def remove_project(self, project_id: int):
+        """删除项目的所有导出"""
+        with self._lock:
+            for path in (self.cache_dir / str(project_id)).glob("*/*.zip"):
+                self._remove(path)
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            sizes = [path.stat().st_size for path in self.cache_dir.glob("*/*/*.zip") if path.exists()]
+            total = self._hits + self._misses
+            return {
+                "entries": len(sizes),
+                "bytes": sum(sizes),
+                "max_bytes": self.max_bytes,
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_rate": (self._hits / total) if total else 0.0,
+                "evictions": self._evictions,
+            }
+
+
+_cache: Optional[ExportCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_export_cache() -> Optional[ExportCache]:
+    """获取全局导出缓存（未启用时返回None）"""
+    global _cache
+    if not EXPORT_CACHE_ENABLED:
+        return None
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = ExportCache(
+                    EXPORT_CACHE_DIR,
+                    max_bytes=EXPORT_CACHE_MAX_MB * 1024 * 1024,
+                    max_age=EXPORT_CACHE_MAX_AGE,
+                )
+    return _cache
@@ -1,30 +1,117 @@
+import hashlib
 from pathlib import Path
+from typing import NamedTuple, Optional
 from fastapi import UploadFile
 import aiofiles
-from app.config import UPLOAD_DIR, ALLOWED_EXTENSIONS
+from app.config import UPLOAD_DIR, ALLOWED_EXTENSIONS, UPLOAD_CHUNK_SIZE_KB, MAX_IMAGE_UPLOAD_MB
 from datetime import datetime
 
-async def save_uploaded_file(file: UploadFile) -> Path:
-    """保存上传的文件"""
+MB = 1024 * 1024
+
+
+class UploadTooLargeError(ValueError):
+    """上传内容超出大小上限（接口返回413）"""
+
+
+class SavedUpload(NamedTuple):
+    path: Path
+    size: int
+    sha256: str
+
+
+def check_upload_size(size: Optional[int], max_bytes: int):
+    """已知大小（Content-Length、表单中的文件大小）超出上限时在写入前拒绝"""
+    if size is not None and size > max_bytes:
+        raise UploadTooLargeError(f"文件大小 {size / MB:.1f}MB 超出上限 {max_bytes / MB:.0f}MB")
+
+
+def normalize_sha256(value: Optional[str]) -> Optional[str]:
+    """校验客户端提供的SHA-256（64位十六进制），统一为小写"""
+    if not value:
+        return None
+    value = value.strip().lower()
+    if len(value) != 64 or any(c not in "0123456789abcdef" for c in value):
+        raise ValueError("sha256 必须是64位十六进制字符串")
+    return value
+
+
+def make_upload_path(filename: str) -> Path:
+    """校验文件类型并生成上传目录中的唯一文件路径"""
     # 验证文件类型
-    file_ext = Path(file.filename).suffix.lower()
+    file_ext = Path(filename).suffix.lower()
     if file_ext not in ALLOWED_EXTENSIONS:
         raise ValueError(f"不支持的文件类型: {file_ext}")
     
     # 生成唯一文件名
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    safe_filename = f"{timestamp}_{file.filename}"
-    file_path = UPLOAD_DIR / safe_filename
-    
-    # 异步保存文件
+    safe_filename = f"{timestamp}_{Path(filename).name}"
+    return UPLOAD_DIR / safe_filename
+
+async def save_file_bytes(file_path: Path, content: bytes) -> Path:
+    """异步写入文件内容"""
     async with aiofiles.open(file_path, 'wb') as f:
-        content = await file.read()
         await f.write(content)
-    
     return file_path
 
+async def stream_upload_to_file(file: UploadFile, file_path: Path, max_bytes: int,
+                                expected_sha256: Optional[str] = None) -> SavedUpload:
+    """按块把上传内容写入文件，同时计算SHA-256，内存占用不超过一个块
+
+    先写入临时文件，完整且校验通过后才改名为目标文件；超出大小上限或校验和不一致时删除临时文件
+    """
+    check_upload_size(file.size, max_bytes)
+    expected_sha256 = normalize_sha256(expected_sha256)
+    chunk_size = max(1, UPLOAD_CHUNK_SIZE_KB) * 1024
+    tmp_path = file_path.with_name(f"{file_path.name}.part")
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        async with aiofiles.open(tmp_path, 'wb') as f:
+            while True:
+                chunk = await file.read(chunk_size)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > max_bytes:
+                    raise UploadTooLargeError(f"文件大小超出上限 {max_bytes / MB:.0f}MB")
+                digest.update(chunk)
+                await f.write(chunk)
+        sha256 = digest.hexdigest()
+        if expected_sha256 and sha256 != expected_sha256:
+            raise ValueError(f"SHA-256校验失败: 期望 {expected_sha256}，实际 {sha256}")
+        tmp_path.replace(file_path)
+    except BaseException:
+        tmp_path.unlink(missing_ok=True)
+        raise
+    return SavedUpload(file_path, size, sha256)
+
+async def save_image_upload(file: UploadFile) -> SavedUpload:
+    """流式保存上传的图片（大小受 MAX_IMAGE_UPLOAD_MB 限制）"""
+    file_path = make_upload_path(file.filename)
+    return await stream_upload_to_file(file, file_path, int(MAX_IMAGE_UPLOAD_MB * MB))
+
+async def read_upload_bytes(file: UploadFile, max_bytes: int) -> bytes:
+    """按块把上传内容读入内存，超出大小上限时立即停止读取"""
+    check_upload_size(file.size, max_bytes)
+    chunk_size = max(1, UPLOAD_CHUNK_SIZE_KB) * 1024
+    content = bytearray()
+    while True:
+        chunk = await file.read(chunk_size)
+        if not chunk:
+            return bytes(content)
+        if len(content) + len(chunk) > max_bytes:
+            raise UploadTooLargeError(f"文件大小超出上限 {max_bytes / MB:.0f}MB")
+        content += chunk
+
+async def read_image_upload(file: UploadFile) -> bytes:
+    """读取上传的图片字节（大小受 MAX_IMAGE_UPLOAD_MB 限制）"""
+    return await read_upload_bytes(file, int(MAX_IMAGE_UPLOAD_MB * MB))
+
+async def save_uploaded_file(file: UploadFile) -> Path:
+    """保存上传的文件"""
+    return (await save_image_upload(file)).path
+
 def get_file_url(file_path: Path) -> str:
     """获取文件的访问URL"""
     filename = file_path.name
     return f"/static/{filename}"
-
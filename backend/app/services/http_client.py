@@ -0,0 +1,145 @@
+"""
+共享HTTP客户端
+整个应用生命周期共用一个 httpx.AsyncClient（在FastAPI lifespan中创建和关闭），
+复用到LabelStudio和图片服务器的keep-alive连接，不再每次调用都重新建立TCP/TLS连接：
+- 连接池大小、keep-alive连接数、超时可配置
+- 安装了h2时启用HTTP/2
+- 幂等请求（GET/HEAD/OPTIONS/PUT/DELETE）在连接错误或 502/503/504/429 时按指数退避重试
+- 按主机限制并发请求数
+测试时可以传入自定义transport（如 httpx.MockTransport 或本地桩服务）
+"""
+import asyncio
+import logging
+import random
+from typing import Dict, Optional
+import httpx
+from app.config import (
+    HTTP_MAX_CONNECTIONS,
+    HTTP_MAX_KEEPALIVE_CONNECTIONS,
+    HTTP_KEEPALIVE_EXPIRY,
+    HTTP_MAX_PER_HOST,
+    HTTP_TIMEOUT,
+    HTTP_CONNECT_TIMEOUT,
+    HTTP_RETRIES,
+    HTTP_RETRY_BACKOFF,
+    HTTP2_ENABLED,
+)
+
+logger = logging.getLogger(__name__)
+
+try:
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+IDEMPOTENT_METHODS = frozenset({"GET", "HEAD", "OPTIONS", "PUT", "DELETE"})
+RETRY_STATUS_CODES = frozenset({429, 502, 503, 504})
+RETRY_EXCEPTIONS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.ReadTimeout,
+                    httpx.RemoteProtocolError, httpx.PoolTimeout)
+
+
+class RetryTransport(httpx.AsyncBaseTransport):
+    """包装底层transport：按主机限制并发，幂等请求失败时退避重试"""
+
+    def __init__(self, transport: httpx.AsyncBaseTransport, retries: int = HTTP_RETRIES,
+                 backoff: float = HTTP_RETRY_BACKOFF, max_per_host: int = HTTP_MAX_PER_HOST):
+        self._transport = transport
+        self.retries = max(0, int(retries))
+        self.backoff = max(0.0, float(backoff))
+        self.max_per_host = int(max_per_host)
+        self._host_limits: Dict[str, asyncio.Semaphore] = {}
+
+    def _host_limit(self, request: httpx.Request) -> Optional[asyncio.Semaphore]:
+        if self.max_per_host <= 0:
+            return None
+        host = request.url.netloc.decode("ascii", "ignore")
+        semaphore = self._host_limits.get(host)
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(self.max_per_host)
+            self._host_limits[host] = semaphore
+        return semaphore
+
+    def _delay(self, attempt: int, response: Optional[httpx.Response] = None) -> float:
+        """第attempt次重试前的等待时间：优先使用Retry-After，否则指数退避加随机抖动"""
+        if response is not None:
+            retry_after = response.headers.get("Retry-After")
+            if retry_after and retry_after.isdigit():
+                return min(float(retry_after), 30.0)
+        delay = self.backoff * (2 ** attempt)
+        return delay + random.uniform(0, delay / 2)
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        retries = self.retries if request.method in IDEMPOTENT_METHODS else 0
+        semaphore = self._host_limit(request)
+        attempt = 0
+        while True:
+            try:
+                if semaphore is None:
+                    response = await self._transport.handle_async_request(request)
+                else:
+                    async with semaphore:
+                        response = await self._transport.handle_async_request(request)
+            except RETRY_EXCEPTIONS as e:
+                if attempt >= retries:
+                    raise
+                delay = self._delay(attempt)
+                logger.warning(f"{request.method} {request.url} 失败({e!r})，{delay:.2f}s后第{attempt + 1}次重试")
+            else:
+                if response.status_code not in RETRY_STATUS_CODES or attempt >= retries:
+                    return response
+                delay = self._delay(attempt, response)
+                await response.aclose()
+                logger.warning(f"{request.method} {request.url} 返回{response.status_code}，{delay:.2f}s后第{attempt + 1}次重试")
+            attempt += 1
+            await asyncio.sleep(delay)
+
+    async def aclose(self):
+        await self._transport.aclose()
+
+
+def create_http_client(transport: Optional[httpx.AsyncBaseTransport] = None) -> httpx.AsyncClient:
+    """创建带连接池、重试和按主机限流的客户端；transport为空时使用默认的连接池transport"""
+    limits = httpx.Limits(
+        max_connections=HTTP_MAX_CONNECTIONS,
+        max_keepalive_connections=HTTP_MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=HTTP_KEEPALIVE_EXPIRY,
+    )
+    if transport is None:
+        transport = httpx.AsyncHTTPTransport(
+            limits=limits,
+            http2=HTTP2_ENABLED and HTTP2_AVAILABLE,
+        )
+    return httpx.AsyncClient(
+        transport=RetryTransport(transport),
+        timeout=httpx.Timeout(HTTP_TIMEOUT, connect=HTTP_CONNECT_TIMEOUT),
+        limits=limits,
+        follow_redirects=True,
+    )
+
+
+_client: Optional[httpx.AsyncClient] = None
+
+
+async def start_http_client(transport: Optional[httpx.AsyncBaseTransport] = None) -> httpx.AsyncClient:
+    """创建全局客户端（应用启动时调用）；已存在时先关闭旧客户端"""
+    global _client
+    await close_http_client()
+    _client = create_http_client(transport)
+    return _client
+
+
+async def close_http_client():
+    """关闭全局客户端，释放连接池（应用关闭时调用）"""
+    global _client
+    client, _client = _client, None
+    if client is not None:
+        await client.aclose()
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """获取全局客户端；未经lifespan启动时（脚本、测试）按默认配置创建"""
+    global _client
+    if _client is None or _client.is_closed:
+        _client = create_http_client()
+    return _client
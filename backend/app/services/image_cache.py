@@ -0,0 +1,280 @@
+"""
+图片下载缓存
+ML后端从LabelStudio/图片服务器下载的图片按内容哈希保存在磁盘上（相同内容只存一份），
+URL到内容的映射记录ETag/Last-Modified，再次预测同一任务时用 If-None-Match/If-Modified-Since 重新验证，
+未变化（304）时直接读取本地副本。总大小超出预算时按LRU淘汰。
+索引（index.json）不在每次获取后重写：修改只标记为未保存，距上次保存超过 IMAGE_CACHE_INDEX_FLUSH_SECONDS
+时才写入，应用关闭时再保存一次（进程异常退出最多丢失这段时间内的记录，对应的文件下次启动时清理）
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, Optional
+import httpx
+from app.config import (
+    IMAGE_CACHE_ENABLED,
+    IMAGE_CACHE_DIR,
+    IMAGE_CACHE_MAX_MB,
+    IMAGE_CACHE_REVALIDATE_SECONDS,
+    IMAGE_CACHE_INDEX_FLUSH_SECONDS,
+)
+from app.services.image_input import InMemoryImage
+
+logger = logging.getLogger(__name__)
+
+
+class ImageFetchCache:
+    """按URL和内容哈希缓存下载的图片"""
+
+    INDEX_FILE = "index.json"
+
+    def __init__(self, cache_dir: Path, max_bytes: int = 512 * 1024 * 1024,
+                 revalidate_seconds: float = 60.0, flush_seconds: float = 5.0):
+        self.cache_dir = Path(cache_dir)
+        self.max_bytes = max(1, int(max_bytes))
+        self.revalidate_seconds = max(0.0, float(revalidate_seconds))
+        self.flush_seconds = max(0.0, float(flush_seconds))
+
+        # url -> {"hash", "etag", "last_modified", "size", "validated_at"}，按最近使用排序
+        self._entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        # 内容哈希 -> 引用该内容的URL数量
+        self._refs: Dict[str, int] = {}
+        self._bytes = 0
+        self._lock = threading.Lock()
+        # 索引有未保存的修改；_flush_lock 保证同一时间只有一个线程写索引文件
+        self._dirty = False
+        self._last_flush = 0.0
+        self._flush_lock = threading.Lock()
+
+        self._hits = 0
+        self._revalidated = 0
+        self._misses = 0
+        self._evictions = 0
+
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self._load()
+
+    def _blob_path(self, content_hash: str) -> Path:
+        return self.cache_dir / content_hash[:2] / f"{content_hash}.img"
+
+    def _load(self):
+        """加载索引，丢弃缺失文件的记录，清理未被引用的文件和写入中断留下的临时文件"""
+        index_path = self.cache_dir / self.INDEX_FILE
+        try:
+            entries = json.loads(index_path.read_text(encoding="utf-8"))
+        except (FileNotFoundError, OSError, ValueError):
+            entries = []
+        for url, entry in entries:
+            if url in self._entries or not self._blob_path(entry["hash"]).exists():
+                continue
+            self._add_entry(url, entry)
+
+        for path in self.cache_dir.glob("*/*"):
+            if path.suffix == ".tmp" or path.stem not in self._refs:
+                try:
+                    path.unlink()
+                except OSError:
+                    pass
+        self._evict()
+        self._dirty = True
+        self.flush()
+
+    def _add_entry(self, url: str, entry: Dict[str, Any]):
+        self._entries[url] = entry
+        refs = self._refs.get(entry["hash"], 0)
+        if refs == 0:
+            self._bytes += entry["size"]
+        self._refs[entry["hash"]] = refs + 1
+
+    def _remove_entry(self, url: str):
+        """移除URL记录，内容不再被引用时删除文件"""
+        entry = self._entries.pop(url)
+        refs = self._refs[entry["hash"]] - 1
+        if refs > 0:
+            self._refs[entry["hash"]] = refs
+            return
+        del self._refs[entry["hash"]]
+        self._bytes -= entry["size"]
+        try:
+            self._blob_path(entry["hash"]).unlink()
+        except OSError:
+            pass
+
+    def _evict(self):
+        while self._bytes > self.max_bytes and self._entries:
+            url = next(iter(self._entries))
+            self._remove_entry(url)
+            self._evictions += 1
+
+    def flush(self):
+        """有未保存的修改时写入索引（应用关闭时调用）"""
+        with self._flush_lock:
+            with self._lock:
+                if not self._dirty:
+                    return
+                # 在锁内只做序列化，写文件在锁外进行，不阻塞其他请求
+                content = json.dumps(list(self._entries.items()))
+                self._dirty = False
+                self._last_flush = time.monotonic()
+            index_path = self.cache_dir / self.INDEX_FILE
+            tmp_path = index_path.with_suffix(".tmp")
+            try:
+                tmp_path.write_text(content, encoding="utf-8")
+                tmp_path.replace(index_path)
+            except OSError as e:
+                logger.warning(f"保存图片缓存索引失败: {e}")
+                with self._lock:
+                    self._dirty = True
+
+    def _flush_if_due(self):
+        """距上次保存超过 flush_seconds 时写入索引"""
+        if self._dirty and time.monotonic() - self._last_flush >= self.flush_seconds:
+            self.flush()
+
+    def _read_blob(self, content_hash: str) -> Optional[bytes]:
+        try:
+            return self._blob_path(content_hash).read_bytes()
+        except OSError:
+            return None
+
+    def _store(self, url: str, data: bytes, headers: httpx.Headers) -> str:
+        """保存下载的内容并更新URL记录，返回内容哈希"""
+        content_hash = hashlib.sha256(data).hexdigest()
+        if len(data) > self.max_bytes:
+            return content_hash
+        path = self._blob_path(content_hash)
+        if not path.exists():
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = path.with_name(f"{content_hash}.{os.getpid()}.{threading.get_ident()}.tmp")
+            tmp_path.write_bytes(data)
+            tmp_path.replace(path)
+        with self._lock:
+            if url in self._entries:
+                self._remove_entry(url)
+            self._add_entry(url, {
+                "hash": content_hash,
+                "etag": headers.get("ETag"),
+                "last_modified": headers.get("Last-Modified"),
+                "size": len(data),
+                "validated_at": time.time(),
+            })
+            self._evict()
+            self._dirty = True
+        self._flush_if_due()
+        return content_hash
+
+    def _touch(self, url: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            entry = self._entries.get(url)
+            if entry is not None:
+                self._entries.move_to_end(url)
+                self._dirty = True
+                return dict(entry)
+            return None
+
+    def _drop(self, url: str):
+        with self._lock:
+            if url in self._entries:
+                self._remove_entry(url)
+                self._dirty = True
+
+    async def fetch(self, url: str, client: httpx.AsyncClient, **kwargs) -> InMemoryImage:
+        """获取图片：最近验证过的缓存直接使用，否则带验证头请求，304时使用本地副本"""
+        entry = self._touch(url)
+        headers = dict(kwargs.pop("headers", None) or {})
+        if entry is not None:
+            if time.time() - entry["validated_at"] < self.revalidate_seconds:
+                data = await asyncio.to_thread(self._read_blob, entry["hash"])
+                if data is not None:
+                    with self._lock:
+                        self._hits += 1
+                    return InMemoryImage(data=data, name=url, content_hash=entry["hash"])
+            if entry.get("etag"):
+                headers["If-None-Match"] = entry["etag"]
+            if entry.get("last_modified"):
+                headers["If-Modified-Since"] = entry["last_modified"]
+
+        response = await client.get(url, headers=headers, **kwargs)
+        if response.status_code == 304 and entry is not None:
+            data = await asyncio.to_thread(self._read_blob, entry["hash"])
+            if data is not None:
+                with self._lock:
+                    current = self._entries.get(url)
+                    if current is not None:
+                        current["validated_at"] = time.time()
+                        self._dirty = True
+                    self._revalidated += 1
+                # 验证时间和LRU顺序只标记为未保存，到期时才写入索引
+                if self._dirty and time.monotonic() - self._last_flush >= self.flush_seconds:
+                    await asyncio.to_thread(self.flush)
+                return InMemoryImage(data=data, name=url, content_hash=entry["hash"])
+            # 本地副本丢失，去掉验证头重新下载
+            self._drop(url)
+            response = await client.get(url, **kwargs)
+        response.raise_for_status()
+
+        data = response.content
+        with self._lock:
+            self._misses += 1
+        if "no-store" in response.headers.get("Cache-Control", "").lower():
+            self._drop(url)
+            return InMemoryImage(data=data, name=url)
+        content_hash = await asyncio.to_thread(self._store, url, data, response.headers)
+        return InMemoryImage(data=data, name=url, content_hash=content_hash)
+
+    def clear(self):
+        """清空缓存"""
+        with self._lock:
+            for url in list(self._entries.keys()):
+                self._remove_entry(url)
+            self._dirty = True
+        self.flush()
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            hits = self._hits + self._revalidated
+            total = hits + self._misses
+            return {
+                "entries": len(self._entries),
+                "blobs": len(self._refs),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self._hits,
+                "revalidated": self._revalidated,
+                "misses": self._misses,
+                "hit_rate": (hits / total) if total else 0.0,
+                "evictions": self._evictions,
+            }
+
+
+_cache: Optional[ImageFetchCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_image_cache() -> Optional[ImageFetchCache]:
+    """获取全局图片下载缓存（未启用时返回None）"""
+    global _cache
+    if not IMAGE_CACHE_ENABLED:
+        return None
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = ImageFetchCache(
+                    IMAGE_CACHE_DIR,
+                    max_bytes=IMAGE_CACHE_MAX_MB * 1024 * 1024,
+                    revalidate_seconds=IMAGE_CACHE_REVALIDATE_SECONDS,
+                    flush_seconds=IMAGE_CACHE_INDEX_FLUSH_SECONDS,
+                )
+    return _cache
+
+
+def flush_image_cache():
+    """保存图片缓存索引（应用关闭时调用，缓存没有创建时什么也不做）"""
+    if _cache is not None:
+        _cache.flush()
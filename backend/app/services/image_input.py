@@ -0,0 +1,111 @@
+"""
+内存图片输入
+推理既可以使用磁盘上的图片路径，也可以直接使用内存中的图片（上传的字节或已解码的数组），
+后者不需要先写入磁盘再读回
+"""
+import hashlib
+import threading
+from typing import Optional, Union
+import cv2
+import numpy as np
+from app.services.result_cache import hash_file
+
+
+def decode_image(data: bytes) -> np.ndarray:
+    """把图片字节解码为BGR数组（与cv2.imread读取文件的结果一致）"""
+    if not data:
+        raise ValueError("图片数据为空")
+    image = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+    if image is None:
+        raise ValueError("无法解码图片数据")
+    return image
+
+
+class InMemoryImage:
+    """内存中的图片，name作为结果中的image_path
+
+    字节数据在第一次访问 array 时才解码，即在推理线程中解码，不占用事件循环
+    """
+
+    def __init__(self, data: Optional[bytes] = None, array: Optional[np.ndarray] = None,
+                 name: str = "memory", content_hash: Optional[str] = None):
+        if data is None and array is None:
+            raise ValueError("需要提供图片字节或图片数组")
+        self.data = data
+        self.name = name
+        self._array = array
+        # 已知的字节sha256（例如来自图片下载缓存），避免重复计算
+        self._hash: Optional[str] = content_hash
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        # 锁不能pickle（进程池推理执行器需要把图片传给子进程），在子进程中重新创建
+        state = self.__dict__.copy()
+        del state["_lock"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    @property
+    def array(self) -> np.ndarray:
+        """解码后的BGR图片"""
+        if self._array is None:
+            with self._lock:
+                if self._array is None:
+                    self._array = decode_image(self.data)
+        return self._array
+
+    @property
+    def content_hash(self) -> str:
+        """内容哈希：字节数据与同一图片文件的 hash_file 结果相同，可以共用结果缓存"""
+        if self._hash is None:
+            h = hashlib.sha256()
+            if self.data is not None:
+                h.update(self.data)
+            else:
+                array = np.ascontiguousarray(self._array)
+                h.update(f"{array.shape}:{array.dtype}".encode("utf-8"))
+                h.update(array.tobytes())
+            self._hash = h.hexdigest()
+        return self._hash
+
+    def __str__(self) -> str:
+        return self.name
+
+
+ImageSource = Union[str, InMemoryImage]
+
+
+def to_memory_image(image: Union[bytes, np.ndarray, InMemoryImage], name: str = "memory") -> InMemoryImage:
+    """把图片字节或BGR数组包装为InMemoryImage"""
+    if isinstance(image, InMemoryImage):
+        return image
+    if isinstance(image, np.ndarray):
+        return InMemoryImage(array=image, name=name)
+    return InMemoryImage(data=bytes(image), name=name)
+
+
+def source_hash(source: ImageSource) -> str:
+    """图片内容哈希（用于结果缓存）"""
+    if isinstance(source, InMemoryImage):
+        return source.content_hash
+    return hash_file(source)
+
+
+def model_input(source: ImageSource):
+    """传给模型的输入：路径或BGR数组"""
+    if isinstance(source, InMemoryImage):
+        return source.array
+    return source
+
+
+def read_image(source: ImageSource) -> np.ndarray:
+    """读取为BGR数组"""
+    if isinstance(source, InMemoryImage):
+        return source.array
+    image = cv2.imread(source)
+    if image is None:
+        raise ValueError(f"无法读取图片: {source}")
+    return image
@@ -0,0 +1,150 @@
+"""
+CPU推理后端
+支持通过导出的 ONNX Runtime / OpenVINO / TorchScript 模型进行检测和分割推理。
+每个模型文件只导出一次，导出结果按模型文件内容哈希缓存在 MODEL_EXPORT_DIR 中
+"""
+import hashlib
+import shutil
+import threading
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+from app.config import INFERENCE_BACKEND, MODEL_EXPORT_DIR, EXPORT_IMGSZ
+
+# 后端名称 -> ultralytics导出格式
+SUPPORTED_BACKENDS = {
+    "pytorch": None,
+    "onnx": "onnx",
+    "openvino": "openvino",
+    "torchscript": "torchscript",
+}
+
+# 支持动态batch导出的格式（批量推理、切片推理需要）
+_DYNAMIC_FORMATS = {"onnx", "openvino"}
+
+_export_locks: Dict[str, threading.Lock] = {}
+_export_locks_guard = threading.Lock()
+_digest_cache: Dict[Tuple[str, int, float], str] = {}
+
+
+def get_backend(backend: Optional[str] = None) -> str:
+    """获取（并校验）推理后端名称"""
+    backend = (backend or INFERENCE_BACKEND or "pytorch").lower()
+    if backend not in SUPPORTED_BACKENDS:
+        raise ValueError(
+            f"不支持的推理后端: {backend}，可选: {', '.join(SUPPORTED_BACKENDS)}"
+        )
+    return backend
+
+
+def _file_digest(path: Path) -> str:
+    """计算模型文件内容哈希（按路径+大小+修改时间缓存，避免重复读取大文件）"""
+    stat = path.stat()
+    key = (str(path.resolve()), stat.st_size, stat.st_mtime)
+    digest = _digest_cache.get(key)
+    if digest is None:
+        h = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                h.update(chunk)
+        digest = h.hexdigest()[:16]
+        _digest_cache[key] = digest
+    return digest
+
+
+def _get_lock(key: str) -> threading.Lock:
+    with _export_locks_guard:
+        lock = _export_locks.get(key)
+        if lock is None:
+            lock = threading.Lock()
+            _export_locks[key] = lock
+        return lock
+
+
+def _artifact_name(stem: str, fmt: str) -> str:
+    if fmt == "openvino":
+        return f"{stem}_openvino_model"
+    if fmt == "torchscript":
+        return f"{stem}.torchscript"
+    return f"{stem}.{fmt}"
+
+
+def _ensure_local_weights(model_path: str) -> Path:
+    """确保权重文件在本地（预训练模型名如 yolov8n.pt 会由ultralytics自动下载）"""
+    path = Path(model_path)
+    if path.exists():
+        return path
+    from ultralytics import YOLO
+    model = YOLO(model_path)
+    ckpt_path = getattr(model, "ckpt_path", None)
+    if ckpt_path and Path(ckpt_path).exists():
+        return Path(ckpt_path)
+    raise FileNotFoundError(f"模型文件不存在: {model_path}")
+
+
+def get_export_dir(model_path: str) -> Path:
+    """模型文件对应的导出缓存目录（按文件名+内容哈希区分）"""
+    weights = _ensure_local_weights(model_path)
+    return MODEL_EXPORT_DIR / f"{weights.stem}-{_file_digest(weights)}"
+
+
+def export_model(model_path: str, backend: str, task: str, **export_kwargs) -> str:
+    """导出模型到缓存目录，已导出则直接返回缓存的产物路径"""
+    fmt = SUPPORTED_BACKENDS[get_backend(backend)]
+    if fmt is None:
+        return model_path
+
+    weights = _ensure_local_weights(model_path)
+    export_dir = get_export_dir(str(weights))
+    stem = weights.stem
+    artifact = export_dir / _artifact_name(stem, fmt)
+    if artifact.exists():
+        return str(artifact)
+
+    kwargs = {"format": fmt, "imgsz": EXPORT_IMGSZ}
+    if fmt in _DYNAMIC_FORMATS:
+        kwargs["dynamic"] = True
+    kwargs.update(export_kwargs)
+    return export_artifact(weights, task, artifact, **kwargs)
+
+
+def export_artifact(weights: Path, task: str, artifact: Path, **export_kwargs) -> str:
+    """用ultralytics导出权重文件到指定位置（artifact已存在则直接返回）"""
+    with _get_lock(str(artifact)):
+        if artifact.exists():
+            return str(artifact)
+
+        from ultralytics import YOLO
+        artifact.parent.mkdir(parents=True, exist_ok=True)
+        # ultralytics会把导出结果写在权重文件旁边，先把权重复制到临时目录，导出后删除副本
+        work_dir = artifact.parent / f".work-{artifact.name}"
+        shutil.rmtree(work_dir, ignore_errors=True)
+        work_dir.mkdir(parents=True)
+        try:
+            local_weights = work_dir / f"{weights.stem}.pt"
+            shutil.copy2(weights, local_weights)
+            exported = Path(YOLO(str(local_weights), task=task).export(**export_kwargs))
+            # 在临时目录导出后再移动到目标位置，中断时不会留下半成品
+            shutil.move(str(exported), str(artifact))
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+    return str(artifact)
+
+
+def is_exported_artifact(model_path: str) -> bool:
+    """是否是已导出的模型产物（如量化后的OpenVINO模型目录），这类模型直接加载不再导出"""
+    path = Path(model_path)
+    return path.exists() and (path.is_dir() or path.suffix.lower() != ".pt")
+
+
+def resolve_backend_model_path(model_path: str, task: str, backend: Optional[str] = None) -> str:
+    """根据配置的推理后端返回实际加载的模型路径（PyTorch直接返回原路径）"""
+    backend = get_backend(backend)
+    if SUPPORTED_BACKENDS[backend] is None or is_exported_artifact(model_path):
+        return model_path
+    return export_model(model_path, backend, task)
+
+
+def load_model(model_path: str, task: str, backend: Optional[str] = None):
+    """按配置的推理后端加载模型，返回的对象与 YOLO(...) 用法一致"""
+    from ultralytics import YOLO
+    return YOLO(resolve_backend_model_path(model_path, task, backend), task=task)
@@ -0,0 +1,121 @@
+"""
+推理执行器
+所有阻塞的模型推理都通过一个有界的线程池/进程池执行，避免阻塞uvicorn事件循环；
+排队任务超过上限时立即拒绝，由API层返回503
+"""
+import asyncio
+import contextvars
+import functools
+import threading
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+from app.config import INFERENCE_EXECUTOR_TYPE, INFERENCE_EXECUTOR_WORKERS, INFERENCE_QUEUE_SIZE
+
+
+class InferenceQueueFullError(Exception):
+    """推理队列已满"""
+    pass
+
+
+class InferenceExecutor:
+    """有界推理执行器
+
+    同时允许 max_workers 个任务执行、max_queue 个任务排队，
+    超过 max_workers + max_queue 的请求直接抛出 InferenceQueueFullError。
+    """
+
+    def __init__(self, kind: str = "thread", max_workers: int = 4, max_queue: int = 16):
+        self.kind = kind
+        self.max_workers = max(1, int(max_workers))
+        self.max_queue = max(0, int(max_queue))
+        self._executor: Optional[Executor] = None
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._rejected = 0
+        self._completed = 0
+
+    def _get_executor(self) -> Executor:
+        if self._executor is None:
+            if self.kind == "process":
+                self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+            else:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.max_workers,
+                    thread_name_prefix="inference"
+                )
+        return self._executor
+
+    def _acquire(self):
+        with self._lock:
+            if self._in_flight >= self.max_workers + self.max_queue:
+                self._rejected += 1
+                raise InferenceQueueFullError(
+                    f"推理队列已满（执行中+排队 {self._in_flight}），请稍后重试"
+                )
+            self._in_flight += 1
+
+    def _release(self):
+        with self._lock:
+            self._in_flight -= 1
+            self._completed += 1
+
+    async def run(self, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        """在执行器中运行阻塞函数，队列满时抛出 InferenceQueueFullError
+
+        名额在执行器中的任务结束时释放（而不是调用方返回时）：请求被取消后已经开始的推理仍在占用工作线程
+        """
+        self._acquire()
+        call = functools.partial(fn, *args, **kwargs)
+        if self.kind != "process":
+            # 在当前上下文中执行，推理线程中记录的阶段耗时归属到当前请求
+            call = functools.partial(contextvars.copy_context().run, call)
+        try:
+            future = self._get_executor().submit(call)
+        except BaseException:
+            self._release()
+            raise
+        future.add_done_callback(lambda _: self._release())
+        return await asyncio.wrap_future(future)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取执行器状态"""
+        with self._lock:
+            in_flight = self._in_flight
+            return {
+                "kind": self.kind,
+                "max_workers": self.max_workers,
+                "max_queue": self.max_queue,
+                "in_flight": in_flight,
+                "queued": max(0, in_flight - self.max_workers),
+                "completed": self._completed,
+                "rejected": self._rejected,
+            }
+
+    def shutdown(self, wait: bool = True):
+        """关闭执行器"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait)
+            self._executor = None
+
+
+_executor: Optional[InferenceExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def get_inference_executor() -> InferenceExecutor:
+    """获取全局推理执行器（单例）"""
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = InferenceExecutor(
+                    kind=INFERENCE_EXECUTOR_TYPE,
+                    max_workers=INFERENCE_EXECUTOR_WORKERS,
+                    max_queue=INFERENCE_QUEUE_SIZE,
+                )
+    return _executor
+
+
+async def run_inference(fn: Callable[..., Any], *args, **kwargs) -> Any:
+    """通过全局推理执行器运行推理函数"""
+    return await get_inference_executor().run(fn, *args, **kwargs)
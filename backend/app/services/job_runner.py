@@ -0,0 +1,129 @@
+"""
+可恢复的后台任务
+批量预标注、批量导入等后台任务共用的生命周期：任务列表保存在JSON文件中（检查点），
+启动、恢复、取消、应用关闭时停止，服务重启后自动恢复仍在运行的任务；具体的处理过程由子类的 _run 实现
+"""
+import asyncio
+import json
+import logging
+from datetime import datetime
+from enum import Enum
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Type
+from pydantic import BaseModel
+
+logger = logging.getLogger(__name__)
+
+
+class CheckpointedJobService:
+    """可恢复的后台任务管理基类
+
+    子类设置 job_model（任务模型）、status_enum（包含RUNNING、COMPLETED、CANCELLED的状态枚举）、
+    job_label（日志和错误信息中的任务名称），并实现 _run(job)
+    """
+
+    job_model: Type[BaseModel]
+    status_enum: Type[Enum]
+    job_label = "任务"
+
+    def __init__(self, jobs_file: Path):
+        self.jobs_file = Path(jobs_file)
+        self.jobs: Dict[str, Any] = self._load_jobs()
+        self.running: Dict[str, asyncio.Task] = {}
+        self._cancel_requested: set = set()
+        # 检查点在线程中写入，同一时间只有一次写入
+        self._save_lock = asyncio.Lock()
+
+    def _load_jobs(self) -> Dict[str, Any]:
+        if not self.jobs_file.exists():
+            return {}
+        try:
+            with open(self.jobs_file, 'r', encoding='utf-8') as f:
+                items = json.load(f)
+        except Exception:
+            return {}
+        jobs = {}
+        for item in items:
+            try:
+                job = self.job_model(**item)
+                jobs[job.id] = job
+            except Exception:
+                continue
+        return jobs
+
+    def _write_jobs(self, items: List[Dict[str, Any]]):
+        self.jobs_file.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.jobs_file.with_suffix(".tmp")
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(items, f, ensure_ascii=False, indent=2)
+        tmp_path.replace(self.jobs_file)
+
+    async def _save_jobs(self):
+        """保存所有任务（检查点）：在事件循环中取快照，文件写入放到线程中，不阻塞事件循环"""
+        async with self._save_lock:
+            items = [job.model_dump(mode="json") for job in self.jobs.values()]
+            await asyncio.to_thread(self._write_jobs, items)
+
+    def list_jobs(self) -> List[Any]:
+        """列出所有任务（按创建时间倒序）"""
+        return sorted(self.jobs.values(), key=lambda job: job.created_at, reverse=True)
+
+    def get_job(self, job_id: str) -> Optional[Any]:
+        return self.jobs.get(job_id)
+
+    async def _start(self, job):
+        job.status = self.status_enum.RUNNING
+        job.started_at = datetime.now()
+        job.completed_at = None
+        job.error = None
+        self.running[job.id] = asyncio.create_task(self._run(job))
+        await self._save_jobs()
+
+    async def _run(self, job):
+        raise NotImplementedError
+
+    def _resume_message(self, job) -> str:
+        """服务重启后恢复任务时的日志"""
+        return f"恢复{self.job_label} {job.id}"
+
+    async def resume_job(self, job_id: str):
+        """从检查点恢复失败、已取消或被中断的任务"""
+        job = self.jobs.get(job_id)
+        if job is None:
+            raise KeyError(job_id)
+        if job.id in self.running:
+            raise ValueError(f"{self.job_label} {job_id} 正在运行中")
+        if job.status == self.status_enum.COMPLETED:
+            raise ValueError(f"{self.job_label} {job_id} 已完成")
+        await self._start(job)
+        return job
+
+    async def resume_interrupted(self) -> List[str]:
+        """恢复上次服务退出时仍在运行的任务（应用启动时调用）"""
+        resumed = []
+        for job in list(self.jobs.values()):
+            if job.status == self.status_enum.RUNNING and job.id not in self.running:
+                logger.info(self._resume_message(job))
+                await self._start(job)
+                resumed.append(job.id)
+        return resumed
+
+    async def cancel_job(self, job_id: str) -> bool:
+        """取消正在运行的任务，检查点之前的进度保留；_run 在取消时检查 _cancel_requested 并设为CANCELLED"""
+        task = self.running.get(job_id)
+        if task is None:
+            return False
+        self._cancel_requested.add(job_id)
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+        return True
+
+    async def shutdown(self):
+        """应用关闭时停止正在运行的任务，状态保持running，下次启动时从检查点恢复"""
+        tasks = list(self.running.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
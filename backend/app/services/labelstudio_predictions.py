@@ -0,0 +1,210 @@
+"""
+LabelStudio预标注公共逻辑
+ML后端 /predict 接口和后台批量预标注任务共用：获取任务图片、按批分割、转换为LabelStudio预测格式
+"""
+import asyncio
+import base64
+import logging
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+import httpx
+import numpy as np
+from app.config import INFERENCE_BATCH_MAX_SIZE, ML_BACKEND_FETCH_CONCURRENCY, ML_BACKEND_RESULT_TYPE
+from app.services.http_client import get_http_client
+from app.services.image_cache import get_image_cache
+from app.services.image_input import ImageSource, InMemoryImage
+from app.services.inference_executor import InferenceQueueFullError, run_inference
+from app.services.metrics import span
+
+logger = logging.getLogger(__name__)
+
+RESULT_TYPES = ("polygonlabels", "brushlabels")
+
+
+async def load_image(image_url: str, client: Optional[httpx.AsyncClient] = None) -> ImageSource:
+    """获取图片，支持URL、base64和本地路径；URL和base64返回内存图片（在推理线程中解码）"""
+    # 如果是base64数据
+    if image_url.startswith("data:image"):
+        # data:image/png;base64,iVBORw0KG...
+        header, data = image_url.split(",", 1)
+        return InMemoryImage(data=base64.b64decode(data), name=header)
+
+    # 如果是URL
+    if image_url.startswith("http"):
+        # 下载图片
+        if client is None:
+            client = get_http_client()
+        # 重复预测同一任务时使用本地缓存的副本（ETag/Last-Modified重新验证）
+        cache = get_image_cache()
+        with span("ml.download"):
+            if cache is not None:
+                return await cache.fetch(image_url, client)
+            response = await client.get(image_url)
+            response.raise_for_status()
+            return InMemoryImage(data=response.content, name=image_url)
+
+    # 如果是本地路径
+    if Path(image_url).exists():
+        return str(image_url)
+
+    raise ValueError(f"无法处理图片URL: {image_url}")
+
+
+async def load_task_images(tasks: List[Dict[str, Any]], client: Optional[httpx.AsyncClient] = None,
+                           concurrency: int = ML_BACKEND_FETCH_CONCURRENCY) -> List[Optional[ImageSource]]:
+    """并发获取任务图片（限制并发数），获取失败的任务为None，顺序与tasks一致"""
+    client = client or get_http_client()
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+
+    async def _fetch(task: Dict[str, Any]) -> Optional[ImageSource]:
+        task_id = task.get("id")
+        image_url = (task.get("data") or {}).get("image")
+        if not image_url:
+            logger.warning(f"Task {task_id} 没有图片URL")
+            return None
+        async with semaphore:
+            try:
+                return await load_image(image_url, client)
+            except Exception as e:
+                logger.error(f"Task {task_id} 获取图片失败: {e}")
+                return None
+
+    return await asyncio.gather(*(_fetch(task) for task in tasks))
+
+
+async def segment_images(images: List[Optional[ImageSource]], conf_threshold: float = 0.25,
+                         model_id: Optional[str] = None,
+                         batch_size: int = INFERENCE_BATCH_MAX_SIZE,
+                         mask_format: str = "polygon") -> List[Any]:
+    """按批分割（每批一次前向推理，各批并发提交到推理执行器），顺序与images一致
+
+    图片为None或分割失败的位置为None；推理队列已满时抛出 InferenceQueueFullError
+    """
+    from app.services.yolo_service import YoloService
+
+    results: List[Any] = [None] * len(images)
+    valid = [i for i, image in enumerate(images) if image is not None]
+    batch_size = max(1, batch_size)
+    chunks = [valid[i:i + batch_size] for i in range(0, len(valid), batch_size)]
+
+    async def _segment_chunk(chunk: List[int]):
+        try:
+            chunk_results = await run_inference(
+                YoloService.segment_batch, [images[i] for i in chunk], conf_threshold, model_id,
+                mask_format=mask_format
+            )
+        except InferenceQueueFullError:
+            raise
+        except Exception as e:
+            # 整批失败时逐张重试，找出失败的图片，其余图片不受影响
+            logger.warning(f"批量分割失败，逐张重试: {e}")
+            chunk_results = []
+            for i in chunk:
+                try:
+                    chunk_results.append(
+                        await run_inference(
+                            YoloService.segment, images[i], conf_threshold, model_id, mask_format=mask_format
+                        )
+                    )
+                except InferenceQueueFullError:
+                    raise
+                except Exception as e:
+                    logger.error(f"图片 {images[i]} 分割失败: {e}")
+                    chunk_results.append(None)
+        for i, result in zip(chunk, chunk_results):
+            results[i] = result
+
+    await asyncio.gather(*(_segment_chunk(chunk) for chunk in chunks))
+    return results
+
+
+def mask_format_for(result_type: str) -> str:
+    """预测结果类型对应的mask输出格式：brushlabels直接输出RLE，不提取轮廓"""
+    if result_type not in RESULT_TYPES:
+        raise ValueError(f"不支持的预测结果类型: {result_type}，可选: {', '.join(RESULT_TYPES)}")
+    return "rle" if result_type == "brushlabels" else "polygon"
+
+
+def segment_result_to_prediction(segment_result, task_id: Optional[int] = None,
+                                 result_type: str = ML_BACKEND_RESULT_TYPE) -> Dict[str, Any]:
+    """
+    将分割结果转换为LabelStudio格式
+
+    LabelStudio期望的格式:
+    {
+      "result": [{
+        "from_name": "label",  # 必须与标注配置中的from_name匹配
+        "to_name": "image",    # 必须与标注配置中的to_name匹配
+        "type": "polygonlabels",
+        "original_width": 1920,
+        "original_height": 1080,
+        "value": {
+          "polygonlabels": ["scratch"],
+          "points": [[x1, y1], [x2, y2], ...]  # 相对坐标 (0-100)
+        },
+        "score": 0.95
+      }],
+      "score": 0.95
+    }
+
+    brushlabels时 value 为 {"format": "rle", "rle": [...], "brushlabels": ["scratch"]}，
+    需要分割时以 mask_format="rle" 输出（见 mask_format_for）
+    """
+    if not segment_result or not segment_result.masks:
+        # 如果没有检测到任何东西，返回空结果
+        return {
+            "result": [],
+            "score": 0.0
+        }
+
+    masks = segment_result.masks
+    width, height = segment_result.image_width, segment_result.image_height
+    labels = [mask.class_name or "defect" for mask in masks]
+    scores = [float(mask.confidence) for mask in masks]
+    base = {
+        "from_name": "label",  # 这个名称需要与Label Studio项目配置匹配
+        "to_name": "image",    # 这个名称需要与Label Studio项目配置匹配
+        "original_width": width,
+        "original_height": height,
+        "image_rotation": 0,
+    }
+
+    result_items = []
+    if result_type == "brushlabels":
+        for mask, label, score in zip(masks, labels, scores):
+            if not mask.rle:
+                continue
+            result_items.append({
+                **base,
+                "type": "brushlabels",
+                "value": {"format": "rle", "rle": mask.rle, "brushlabels": [label]},
+                "score": score,
+            })
+    else:
+        # 所有多边形的顶点一次性换算为百分比坐标，再按顶点数切分
+        counts = np.array([len(mask.polygon) for mask in masks], dtype=np.int64)
+        xy = np.array([(p.x, p.y) for mask in masks for p in mask.polygon], dtype=np.float64).reshape(-1, 2)
+        if width and height:
+            xy = np.clip(xy * (100.0 / np.array([width, height], dtype=np.float64)), 0.0, 100.0)
+        else:
+            # 旧结果没有原图尺寸时只能输出像素坐标
+            logger.warning("分割结果缺少原图尺寸，多边形保留像素坐标")
+        points = np.round(xy, 4).tolist()
+        ends = np.cumsum(counts)
+        starts, ends, counts = (ends - counts).tolist(), ends.tolist(), counts.tolist()
+        for i, (label, score) in enumerate(zip(labels, scores)):
+            # LabelStudio要求至少有3个点才能形成多边形
+            if counts[i] < 3:
+                continue
+            result_items.append({
+                **base,
+                "type": "polygonlabels",
+                "value": {"polygonlabels": [label], "points": points[starts[i]:ends[i]]},
+                "score": score,
+            })
+
+    return {
+        "result": result_items,
+        # 平均置信度
+        "score": float(np.mean(scores))
+    }
@@ -1,7 +1,20 @@
+import asyncio
+import json
+import math
 import httpx
-from typing import List, Optional, Dict, Any
-from app.config import LABEL_STUDIO_URL, LABEL_STUDIO_API_KEY
+from typing import List, Optional, Dict, Any, Tuple
+from app.config import (
+    LABEL_STUDIO_URL,
+    LABEL_STUDIO_API_KEY,
+    LABEL_STUDIO_PROJECTS_PAGE_SIZE,
+    LABEL_STUDIO_EXPORT_TIMEOUT,
+    TASK_IMPORT_TIMEOUT,
+    HTTP_TIMEOUT,
+)
 from app.models.schemas import LabelStudioTask, LabelStudioTaskCreate
+from app.services.export_cache import get_export_cache
+from app.services.http_client import get_http_client
+from app.services.project_cache import get_project_list_cache
 from datetime import datetime
 
 class LabelStudioService:
@@ -19,17 +32,65 @@ class LabelStudioService:
             self.headers["Authorization"] = f"Token {self.api_key}"
     
     async def get_projects(self) -> List[Dict[str, Any]]:
-        """获取所有标注项目"""
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            try:
-                response = await client.get(
-                    f"{self.api_url}/projects/",
-                    headers=self.headers
-                )
-                response.raise_for_status()
-                return response.json().get("results", [])
-            except httpx.HTTPError as e:
-                raise Exception(f"获取LabelStudio项目失败: {str(e)}")
+        """获取所有标注项目（所有分页，短时间缓存）"""
+        return await get_project_list_cache().get(self._fetch_all_projects)
+    
+    async def _fetch_all_projects(self) -> List[Dict[str, Any]]:
+        """获取所有分页的项目：第一页得到总数后，其余分页并发获取"""
+        client = get_http_client()
+        page_size = max(1, LABEL_STUDIO_PROJECTS_PAGE_SIZE)
+        try:
+            first = await self._get_projects_page(client, 1, page_size)
+            # 旧版本LabelStudio不分页，直接返回列表
+            if isinstance(first, list):
+                return first
+            projects = list(first.get("results", []))
+            count = first.get("count")
+            if count is not None:
+                num_pages = math.ceil(count / page_size)
+                pages = await asyncio.gather(*(
+                    self._get_projects_page(client, page, page_size) for page in range(2, num_pages + 1)
+                ))
+                for data in pages:
+                    projects.extend(data.get("results", []))
+            else:
+                # 没有总数时只能按next逐页获取
+                page, data = 1, first
+                while data.get("next"):
+                    page += 1
+                    data = await self._get_projects_page(client, page, page_size)
+                    projects.extend(data.get("results", []))
+        except httpx.HTTPError as e:
+            raise Exception(f"获取LabelStudio项目失败: {str(e)}")
+        
+        # 并发分页期间有项目增删时，同一项目可能出现在相邻两页
+        seen = set()
+        unique = []
+        for project in projects:
+            if project.get("id") in seen:
+                continue
+            seen.add(project.get("id"))
+            unique.append(project)
+        return unique
+    
+    async def _get_projects_page(self, client: httpx.AsyncClient, page: int, page_size: int) -> Any:
+        """获取一页项目；之前的响应带ETag/Last-Modified时发送条件请求，304时复用缓存的该页"""
+        cache = get_project_list_cache()
+        response = await client.get(
+            f"{self.api_url}/projects/",
+            params={"page": page, "page_size": page_size},
+            headers={**self.headers, **cache.conditional_headers(page, page_size)}
+        )
+        if response.status_code == 304:
+            cached = cache.cached_page(page, page_size)
+            if cached is not None:
+                return cached
+        if response.status_code == 404 and page > 1:
+            return {"results": []}
+        response.raise_for_status()
+        data = response.json()
+        cache.store_page(page, page_size, response.headers, data)
+        return data
     
     async def create_project(self, task_data: LabelStudioTaskCreate) -> Dict[str, Any]:
         """创建新的标注项目"""
@@ -40,76 +101,159 @@ class LabelStudioService:
             "input_type": "IMAGE"
         }
         
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            try:
-                response = await client.post(
-                    f"{self.api_url}/projects/",
-                    json=project_data,
-                    headers=self.headers
-                )
-                response.raise_for_status()
-                return response.json()
-            except httpx.HTTPError as e:
-                raise Exception(f"创建LabelStudio项目失败: {str(e)}")
+        client = get_http_client()
+        try:
+            response = await client.post(
+                f"{self.api_url}/projects/",
+                json=project_data,
+                headers=self.headers
+            )
+            response.raise_for_status()
+            get_project_list_cache().invalidate()
+            return response.json()
+        except httpx.HTTPError as e:
+            raise Exception(f"创建LabelStudio项目失败: {str(e)}")
     
     async def get_project(self, project_id: int) -> Dict[str, Any]:
         """获取单个项目详情"""
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            try:
-                response = await client.get(
-                    f"{self.api_url}/projects/{project_id}/",
-                    headers=self.headers
-                )
-                response.raise_for_status()
-                return response.json()
-            except httpx.HTTPError as e:
-                raise Exception(f"获取LabelStudio项目详情失败: {str(e)}")
+        client = get_http_client()
+        try:
+            response = await client.get(
+                f"{self.api_url}/projects/{project_id}/",
+                headers=self.headers
+            )
+            response.raise_for_status()
+            return response.json()
+        except httpx.HTTPError as e:
+            raise Exception(f"获取LabelStudio项目详情失败: {str(e)}")
     
     async def delete_project(self, project_id: int) -> bool:
         """删除标注项目"""
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            try:
-                response = await client.delete(
-                    f"{self.api_url}/projects/{project_id}/",
-                    headers=self.headers
-                )
-                response.raise_for_status()
-                return True
-            except httpx.HTTPError as e:
-                raise Exception(f"删除LabelStudio项目失败: {str(e)}")
+        client = get_http_client()
+        try:
+            response = await client.delete(
+                f"{self.api_url}/projects/{project_id}/",
+                headers=self.headers
+            )
+            response.raise_for_status()
+            get_project_list_cache().invalidate()
+            export_cache = get_export_cache()
+            if export_cache is not None:
+                await asyncio.to_thread(export_cache.remove_project, project_id)
+            return True
+        except httpx.HTTPError as e:
+            raise Exception(f"删除LabelStudio项目失败: {str(e)}")
     
-    async def export_project(self, project_id: int, export_type: str = "YOLO") -> bytes:
-        """导出标注数据
+    async def open_export_stream(self, project_id: int, export_type: str = "YOLO") -> httpx.Response:
+        """以流式方式请求导出，返回尚未读取响应体的响应（调用方读取后负责 aclose）
         
-        Args:
-            project_id: 项目ID
-            export_type: 导出格式 (YOLO, JSON, COCO等)
+        LabelStudio生成导出期间不发送数据，读取超时使用 LABEL_STUDIO_EXPORT_TIMEOUT
         """
-        async with httpx.AsyncClient(timeout=60.0) as client:
+        client = get_http_client()
+        request = client.build_request(
+            "GET",
+            f"{self.api_url}/projects/{project_id}/export",
+            params={"exportType": export_type},
+            headers=self.headers,
+            timeout=httpx.Timeout(HTTP_TIMEOUT, read=LABEL_STUDIO_EXPORT_TIMEOUT)
+        )
+        try:
+            response = await client.send(request, stream=True)
+        except httpx.HTTPError as e:
+            raise Exception(f"导出LabelStudio项目数据失败: {str(e)}")
+        if response.is_error:
+            await response.aread()
+            await response.aclose()
             try:
-                response = await client.get(
-                    f"{self.api_url}/projects/{project_id}/export",
-                    params={"exportType": export_type},
-                    headers=self.headers
-                )
                 response.raise_for_status()
-                return response.content
             except httpx.HTTPError as e:
                 raise Exception(f"导出LabelStudio项目数据失败: {str(e)}")
+        return response
     
-    async def import_tasks(self, project_id: int, tasks: List[Dict[str, Any]]) -> Dict[str, Any]:
-        """导入任务到项目"""
-        async with httpx.AsyncClient(timeout=60.0) as client:
-            try:
-                response = await client.post(
-                    f"{self.api_url}/projects/{project_id}/import",
-                    json=tasks,
-                    headers=self.headers
-                )
-                response.raise_for_status()
-                return response.json()
-            except httpx.HTTPError as e:
-                raise Exception(f"导入任务到LabelStudio项目失败: {str(e)}")
+    @staticmethod
+    def project_change_marker(project_data: Dict[str, Any]) -> str:
+        """项目内容的变更标记（用作导出缓存键）
+        
+        LabelStudio没有统一的最后修改时间：组合updated_at（新版本才有）、任务数、标注/预测数和标注配置
+        """
+        fields = (
+            "updated_at", "task_number", "total_annotations_number", "total_predictions_number",
+            "skipped_annotations_number", "num_tasks_with_annotations", "finished_task_number", "label_config",
+        )
+        return json.dumps({field: project_data.get(field) for field in fields}, sort_keys=True, default=str)
+    
+    async def import_tasks(self, project_id: int, tasks: List[Dict[str, Any]],
+                           timeout: float = TASK_IMPORT_TIMEOUT) -> Dict[str, Any]:
+        """导入任务到项目（一次请求）；大量任务使用 TaskImportService 分块导入
+        
+        失败时抛出的异常以原始的httpx异常为 __cause__，调用方据此判断能否重试
+        """
+        client = get_http_client()
+        try:
+            response = await client.post(
+                f"{self.api_url}/projects/{project_id}/import",
+                json=tasks,
+                headers=self.headers,
+                timeout=timeout
+            )
+            response.raise_for_status()
+            return response.json()
+        except httpx.HTTPError as e:
+            raise Exception(f"导入任务到LabelStudio项目失败: {str(e)}") from e
+    
+    async def get_tasks_page(self, project_id: int, page: int = 1, page_size: int = 100,
+                             fields: Optional[str] = None) -> Tuple[List[Dict[str, Any]], Optional[int]]:
+        """分页获取项目中的任务，返回 (任务列表, 任务总数)；页码超出范围时返回空列表
+        
+        fields="all" 时任务中包含完整的标注（annotations）
+        """
+        client = get_http_client()
+        params = {"project": project_id, "page": page, "page_size": page_size}
+        if fields:
+            params["fields"] = fields
+        try:
+            response = await client.get(
+                f"{self.api_url}/tasks",
+                params=params,
+                headers=self.headers
+            )
+            if response.status_code == 404 and page > 1:
+                return [], None
+            response.raise_for_status()
+            data = response.json()
+            # 新版本返回 {"tasks": [...], "total": N}，旧版本直接返回列表
+            if isinstance(data, list):
+                return data, None
+            return data.get("tasks", data.get("results", [])), data.get("total", data.get("count"))
+        except httpx.HTTPError as e:
+            raise Exception(f"获取LabelStudio任务列表失败: {str(e)}")
+    
+    async def import_predictions(self, project_id: int, predictions: List[Dict[str, Any]]) -> int:
+        """批量导入预测结果，predictions中每项包含 task/result/score/model_version，返回导入数量
+        
+        不支持批量导入接口的旧版本LabelStudio逐条创建
+        """
+        client = get_http_client()
+        try:
+            response = await client.post(
+                f"{self.api_url}/projects/{project_id}/import/predictions",
+                json=predictions,
+                headers=self.headers,
+                timeout=60.0
+            )
+            if response.status_code in (404, 405):
+                for prediction in predictions:
+                    item_response = await client.post(
+                        f"{self.api_url}/predictions/",
+                        json=prediction,
+                        headers=self.headers
+                    )
+                    item_response.raise_for_status()
+                return len(predictions)
+            response.raise_for_status()
+            return len(predictions)
+        except httpx.HTTPError as e:
+            raise Exception(f"导入预测结果到LabelStudio项目失败: {str(e)}")
     
     def get_project_url(self, project_id: int) -> str:
         """获取项目访问URL"""
@@ -133,6 +277,10 @@ class LabelStudioService:
     
     async def convert_to_labelstudio_tasks(self, project_data: Dict[str, Any]) -> LabelStudioTask:
         """将LabelStudio项目数据转换为内部Task模型"""
+        return self.project_to_task(project_data)
+    
+    def project_to_task(self, project_data: Dict[str, Any]) -> LabelStudioTask:
+        """将LabelStudio项目数据转换为内部Task模型（纯转换，列表中的项目直接逐个调用）"""
         created_at = None
         if project_data.get("created_at"):
             try:
@@ -149,4 +297,3 @@ class LabelStudioService:
             created_at=created_at,
             url=self.get_project_url(project_data.get("id", 0))
         )
-
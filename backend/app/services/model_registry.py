@@ -0,0 +1,286 @@
+"""
+模型注册表
+在内存中按LRU保留多个已加载的模型（受数量和内存预算限制）。
+激活新模型时在后台线程加载并预热，完成后原子地切换当前模型，正在处理的请求继续使用旧模型
+"""
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import numpy as np
+from app.config import MODEL_REGISTRY_MAX_MODELS, MODEL_REGISTRY_MAX_MB, MODEL_WARMUP_RUNS, MODEL_WARMUP_IMGSZ
+from app.services.inference_backend import load_model
+from app.services.metrics import MODEL_LOAD_SECONDS
+
+class LockedModel:
+    """共享模型的调用包装：整个调用期间持有模型的锁
+
+    ultralytics在预测器的锁之外设置 predictor.args（conf、batch等），多个推理线程同时调用同一个模型时
+    会用到彼此的参数，所以同一模型的调用需要串行；其他属性（names等）直接转发给模型
+    """
+
+    def __init__(self, model: Any, lock: threading.Lock):
+        self._model = model
+        self._lock = lock
+
+    def __call__(self, *args, **kwargs):
+        with self._lock:
+            return self._model(*args, **kwargs)
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._model, name)
+
+
+class LoadedModel:
+    """一个已加载的模型，model 是加锁的调用包装"""
+
+    def __init__(self, task: str, model_path: str, model: Any, size_bytes: int, load_seconds: float):
+        self.task = task
+        self.model_path = model_path
+        self.lock = threading.Lock()
+        self.model = LockedModel(model, self.lock)
+        self.size_bytes = size_bytes
+        self.load_seconds = load_seconds
+        self.loaded_at = datetime.now()
+        self.last_used = time.time()
+        self.uses = 0
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "task": self.task,
+            "model_path": self.model_path,
+            "size_mb": round(self.size_bytes / 1024 / 1024, 2),
+            "load_seconds": round(self.load_seconds, 3),
+            "loaded_at": self.loaded_at.isoformat(),
+            "uses": self.uses,
+        }
+
+
+def estimate_model_size(model: Any, model_path: str) -> int:
+    """估算模型占用的内存：PyTorch模型按参数大小计算，导出的模型按文件大小计算"""
+    try:
+        module = getattr(model, "model", None)
+        if module is not None and hasattr(module, "parameters"):
+            return int(sum(p.numel() * p.element_size() for p in module.parameters()))
+    except Exception:
+        pass
+    path = Path(model_path)
+    if path.is_dir():
+        return sum(p.stat().st_size for p in path.rglob("*") if p.is_file())
+    if path.exists():
+        return path.stat().st_size
+    return 0
+
+
+def warmup_model(model: Any, runs: int = MODEL_WARMUP_RUNS, imgsz: int = MODEL_WARMUP_IMGSZ):
+    """用合成图片预热模型（内存分配、算子选择等首次推理开销）"""
+    if runs <= 0:
+        return
+    image = np.full((imgsz, imgsz, 3), 114, dtype=np.uint8)
+    for _ in range(runs):
+        model(image, verbose=False)
+
+
+class ModelRegistry:
+    """多模型LRU注册表"""
+
+    def __init__(self, max_models: int = 4, max_bytes: int = 1024 * 1024 * 1024,
+                 warmup_runs: int = MODEL_WARMUP_RUNS, load_weights: bool = True):
+        self.max_models = max(1, int(max_models))
+        self.max_bytes = max(1, int(max_bytes))
+        self.warmup_runs = warmup_runs
+        # 多进程推理模式下模型由工作进程加载，注册表只负责切换模型路径
+        self.load_weights = load_weights
+
+        self._models: "OrderedDict[Tuple[str, str], LoadedModel]" = OrderedDict()
+        self._active: Dict[str, str] = {}
+        self._lock = threading.RLock()
+        self._load_locks: Dict[Tuple[str, str], threading.Lock] = {}
+        self._activations: Dict[str, Dict[str, Any]] = {}
+        # 每个任务最新一次激活请求的序号，后台加载完成时只有仍是最新请求的才切换
+        self._generations: Dict[str, int] = {}
+        self._requested: Dict[str, Optional[str]] = {}
+        self._swap_listeners: List[Callable[[str, str], None]] = []
+
+    def add_swap_listener(self, listener: Callable[[str, str], None]):
+        """注册模型切换回调 listener(task, model_path)，例如用于清空结果缓存"""
+        self._swap_listeners.append(listener)
+
+    def _load_lock(self, key: Tuple[str, str]) -> threading.Lock:
+        with self._lock:
+            lock = self._load_locks.get(key)
+            if lock is None:
+                lock = threading.Lock()
+                self._load_locks[key] = lock
+            return lock
+
+    def get(self, task: str, model_path: str) -> Any:
+        """获取指定路径的模型，未加载则同步加载（用于请求固定model_id）"""
+        return self._get_entry(task, model_path).model
+
+    def _get_entry(self, task: str, model_path: str, warmup: bool = False) -> LoadedModel:
+        key = (task, model_path)
+        with self._lock:
+            entry = self._models.get(key)
+            if entry is not None:
+                self._models.move_to_end(key)
+                entry.last_used = time.time()
+                entry.uses += 1
+                return entry
+
+        with self._load_lock(key):
+            with self._lock:
+                entry = self._models.get(key)
+            if entry is None:
+                started = time.perf_counter()
+                model = load_model(model_path, task=task)
+                if warmup:
+                    warmup_model(model, self.warmup_runs)
+                entry = LoadedModel(
+                    task, model_path, model,
+                    estimate_model_size(model, model_path),
+                    time.perf_counter() - started
+                )
+                MODEL_LOAD_SECONDS.observe(entry.load_seconds, task=task)
+                with self._lock:
+                    self._models[key] = entry
+                    self._evict()
+            entry.uses += 1
+            entry.last_used = time.time()
+            return entry
+
+    def _evict(self):
+        """按LRU淘汰超出数量或内存预算的模型，当前激活的模型不会被淘汰"""
+        active_keys = {(task, path) for task, path in self._active.items()}
+        total = sum(e.size_bytes for e in self._models.values())
+        for key in list(self._models.keys()):
+            if len(self._models) <= self.max_models and total <= self.max_bytes:
+                break
+            if key in active_keys:
+                continue
+            entry = self._models.pop(key)
+            total -= entry.size_bytes
+
+    def active_path(self, task: str) -> Optional[str]:
+        """当前激活的模型路径"""
+        with self._lock:
+            return self._active.get(task)
+
+    def current_path(self, task: str, resolve_path: Callable[[], Optional[str]]) -> Optional[str]:
+        """当前激活的模型路径；还没有激活的模型时用 resolve_path() 确定并设为激活"""
+        model_path = self.active_path(task)
+        if model_path is None:
+            model_path = resolve_path()
+            if model_path is None:
+                return None
+            with self._lock:
+                model_path = self._active.setdefault(task, model_path)
+        return model_path
+
+    def get_active(self, task: str, resolve_path: Callable[[], Optional[str]]) -> Any:
+        """获取当前激活的模型（未加载则同步加载）"""
+        model_path = self.current_path(task, resolve_path)
+        if model_path is None:
+            return None
+        return self.get(task, model_path)
+
+    def _next_generation(self, task: str, model_path: Optional[str]) -> int:
+        with self._lock:
+            generation = self._generations.get(task, 0) + 1
+            self._generations[task] = generation
+            self._requested[task] = model_path
+            return generation
+
+    def activate(self, task: str, model_path: Optional[str], generation: Optional[int] = None) -> bool:
+        """同步加载并预热模型，然后原子地切换为当前模型
+
+        generation 为发起激活请求时取得的序号，加载期间该任务有了更新的激活请求时放弃切换，
+        返回是否已切换
+        """
+        if generation is None:
+            generation = self._next_generation(task, model_path)
+        if model_path is None:
+            with self._lock:
+                if self._generations.get(task) != generation:
+                    return False
+                self._active.pop(task, None)
+            return True
+        if self.load_weights:
+            self._get_entry(task, model_path, warmup=True)
+        with self._lock:
+            if self._generations.get(task) != generation:
+                self._discard(task, model_path)
+                return False
+            previous = self._active.get(task)
+            self._active[task] = model_path
+        if previous != model_path:
+            for listener in self._swap_listeners:
+                listener(task, model_path)
+        return True
+
+    def _discard(self, task: str, model_path: str):
+        """丢弃过期的激活请求加载的模型（当前激活或最新请求的模型除外）"""
+        if model_path not in (self._active.get(task), self._requested.get(task)):
+            self._models.pop((task, model_path), None)
+
+    def activate_in_background(self, task: str, model_path: Optional[str]) -> Dict[str, Any]:
+        """在后台线程加载并预热模型，完成后切换；返回激活状态
+
+        多次激活同一任务时以最后一次请求为准，先发起但后加载完成的请求不会覆盖它
+        """
+        status = {
+            "task": task,
+            "model_path": model_path,
+            "state": "loading",
+            "started_at": datetime.now().isoformat(),
+            "error": None,
+        }
+        with self._lock:
+            generation = self._next_generation(task, model_path)
+            self._activations[task] = status
+
+        def _run():
+            try:
+                status["state"] = "active" if self.activate(task, model_path, generation) else "superseded"
+            except Exception as e:
+                status["state"] = "failed"
+                status["error"] = str(e)
+            status["finished_at"] = datetime.now().isoformat()
+
+        threading.Thread(target=_run, name=f"model-activate-{task}", daemon=True).start()
+        return dict(status)
+
+    def get_status(self) -> Dict[str, Any]:
+        """注册表状态：已加载模型、当前激活模型、后台激活进度"""
+        with self._lock:
+            models = [e.to_dict() for e in self._models.values()]
+            return {
+                "max_models": self.max_models,
+                "max_mb": round(self.max_bytes / 1024 / 1024, 2),
+                "used_mb": round(sum(e.size_bytes for e in self._models.values()) / 1024 / 1024, 2),
+                "active": dict(self._active),
+                "activations": {task: dict(s) for task, s in self._activations.items()},
+                "loaded": models,
+            }
+
+
+_registry: Optional[ModelRegistry] = None
+_registry_lock = threading.Lock()
+
+
+def get_model_registry() -> ModelRegistry:
+    """获取全局模型注册表（单例）"""
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                from app.services.worker_pool import worker_pool_enabled
+                _registry = ModelRegistry(
+                    max_models=MODEL_REGISTRY_MAX_MODELS,
+                    max_bytes=MODEL_REGISTRY_MAX_MB * 1024 * 1024,
+                    warmup_runs=MODEL_WARMUP_RUNS,
+                    load_weights=not worker_pool_enabled(),
+                )
+    return _registry
@@ -4,10 +4,10 @@ import shutil
 from pathlib import Path
 from typing import List, Optional, Dict
 from datetime import datetime
-from app.config import MODELS_METADATA_FILE, MODEL_DIR
+from app.config import MODELS_METADATA_FILE, MODEL_DIR, MAX_MODEL_UPLOAD_MB
 from app.models.schemas import ModelMetadata, ModelType
+from app.services.file_service import MB, stream_upload_to_file
 from fastapi import UploadFile
-import aiofiles
 
 class ModelService:
     """模型管理服务"""
@@ -42,36 +42,51 @@ class ModelService:
         return None
     
     async def upload_model(self, file: UploadFile, name: str, description: Optional[str] = None, 
-                          training_task_id: Optional[str] = None, model_type: ModelType = ModelType.DETECTION) -> ModelMetadata:
-        """上传模型文件"""
+                          training_task_id: Optional[str] = None, model_type: ModelType = ModelType.DETECTION,
+                          sha256: Optional[str] = None) -> ModelMetadata:
+        """上传模型文件（流式写入，大小受 MAX_MODEL_UPLOAD_MB 限制；提供sha256时校验）"""
         # 验证文件扩展名
         if not file.filename.endswith('.pt'):
             raise ValueError("只支持.pt格式的模型文件")
         
         # 生成唯一ID和文件名
         model_id = str(uuid.uuid4())
-        safe_filename = f"{model_id}_{file.filename}"
+        safe_filename = f"{model_id}_{Path(file.filename).name}"
         file_path = self.model_dir / safe_filename
         
         # 保存文件
-        async with aiofiles.open(file_path, 'wb') as f:
-            content = await file.read()
-            await f.write(content)
+        saved = await stream_upload_to_file(file, file_path, int(MAX_MODEL_UPLOAD_MB * MB), sha256)
         
-        file_size = file_path.stat().st_size
+        return self.register_model(
+            model_id=model_id,
+            file_path=file_path,
+            name=name,
+            model_type=model_type,
+            description=description,
+            training_task_id=training_task_id,
+            sha256=saved.sha256
+        )
+    
+    def register_model(self, model_id: str, file_path: Path, name: str,
+                       model_type: ModelType = ModelType.DETECTION, **fields) -> ModelMetadata:
+        """登记已保存在模型目录中的模型文件（或导出的模型目录）"""
+        file_path = Path(file_path)
+        if file_path.is_dir():
+            file_size = sum(p.stat().st_size for p in file_path.rglob("*") if p.is_file())
+        else:
+            file_size = file_path.stat().st_size
         
         # 创建元数据
         model = ModelMetadata(
             id=model_id,
             name=name,
-            filename=safe_filename,
+            filename=file_path.name,
             file_path=str(file_path),
             file_size=file_size,
             model_type=model_type,
-            description=description,
-            training_task_id=training_task_id,
             is_active=False,
-            created_at=datetime.now()
+            created_at=datetime.now(),
+            **fields
         )
         
         # 保存元数据
@@ -140,7 +155,9 @@ class ModelService:
         
         # 删除文件
         file_path = Path(model.file_path)
-        if file_path.exists():
+        if file_path.is_dir():
+            shutil.rmtree(file_path)
+        elif file_path.exists():
             file_path.unlink()
         
         # 从元数据中删除
@@ -0,0 +1,49 @@
+"""
+请求/响应内容的抽样日志
+热路径上不再完整打印请求体（其中可能有base64图片）：按比例抽样，长字符串截断，整条日志限制长度
+"""
+import json
+import logging
+import random
+from typing import Any
+from app.config import PAYLOAD_LOG_SAMPLE_RATE, PAYLOAD_LOG_MAX_CHARS
+
+# 超过该长度的字符串只记录开头和长度
+MAX_STRING_CHARS = 120
+
+
+def _shorten(value: Any, depth: int = 0) -> Any:
+    if isinstance(value, str):
+        if len(value) > MAX_STRING_CHARS:
+            return f"{value[:MAX_STRING_CHARS]}...<{len(value)} chars>"
+        return value
+    if depth >= 6:
+        return "..."
+    if isinstance(value, dict):
+        return {key: _shorten(item, depth + 1) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        if len(value) > 20:
+            return [_shorten(item, depth + 1) for item in value[:20]] + [f"...<{len(value)} items>"]
+        return [_shorten(item, depth + 1) for item in value]
+    return value
+
+
+def summarize_payload(payload: Any, max_chars: int = PAYLOAD_LOG_MAX_CHARS) -> str:
+    """把内容转为截断后的单行文本"""
+    try:
+        text = json.dumps(_shorten(payload), ensure_ascii=False, default=str)
+    except (TypeError, ValueError):
+        text = repr(payload)
+    if len(text) > max_chars:
+        text = f"{text[:max_chars]}...<{len(text)} chars>"
+    return text
+
+
+def log_payload(logger: logging.Logger, message: str, payload: Any,
+                sample_rate: float = PAYLOAD_LOG_SAMPLE_RATE, level: int = logging.INFO):
+    """按抽样比例记录内容摘要；未抽中时不做任何序列化"""
+    if sample_rate <= 0 or not logger.isEnabledFor(level):
+        return
+    if sample_rate < 1 and random.random() >= sample_rate:
+        return
+    logger.log(level, f"{message}: {summarize_payload(payload)}")
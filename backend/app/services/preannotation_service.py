@@ -0,0 +1,230 @@
+"""
+LabelStudio批量预标注任务
+在后台逐页遍历项目中的所有任务：获取图片、分批分割、把预测结果分块批量导入LabelStudio。
+每页完成并导入后保存检查点（next_page），服务崩溃或重启后从检查点继续；
+默认跳过已有标注或预测的任务，因此中断页重新处理时不会重复导入
+"""
+import asyncio
+import logging
+import time
+import uuid
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+from app.config import (
+    PREANNOTATION_JOBS_FILE,
+    PREANNOTATION_PAGE_SIZE,
+    PREANNOTATION_IMPORT_CHUNK,
+    PREANNOTATION_INFERENCE_CONCURRENCY,
+    INFERENCE_BATCH_MAX_SIZE,
+    PREANNOTATION_MODEL_VERSION,
+    ML_BACKEND_RESULT_TYPE,
+)
+from app.models.schemas import PreannotationJob, PreannotationJobCreate, PreannotationStatus
+from app.services.inference_executor import InferenceQueueFullError
+from app.services.job_runner import CheckpointedJobService
+from app.services.labelstudio_predictions import (
+    load_task_images,
+    mask_format_for,
+    segment_images,
+    segment_result_to_prediction,
+)
+from app.services.labelstudio_service import LabelStudioService
+
+logger = logging.getLogger(__name__)
+
+# 推理队列已满时的最大重试次数
+QUEUE_FULL_RETRIES = 10
+
+
+def _is_labeled(task: Dict[str, Any]) -> bool:
+    """任务是否已有标注或预测"""
+    if task.get("total_annotations") or task.get("total_predictions"):
+        return True
+    return bool(task.get("annotations")) or bool(task.get("predictions"))
+
+
+class PreannotationService(CheckpointedJobService):
+    """批量预标注任务管理
+
+    labelstudio、fetch_images、segment 可以替换，便于对本地的假LabelStudio测试：
+    fetch_images(tasks) -> 图片列表，segment(images, conf_threshold, model_id, mask_format=...) -> 分割结果列表；
+    每页图片按 batch_size 分批调用 segment，同时最多 inference_concurrency 批
+    """
+
+    job_model = PreannotationJob
+    status_enum = PreannotationStatus
+    job_label = "预标注任务"
+
+    def __init__(self, labelstudio: Optional[LabelStudioService] = None,
+                 jobs_file: Path = PREANNOTATION_JOBS_FILE,
+                 fetch_images: Optional[Callable[[List[Dict[str, Any]]], Awaitable[List[Any]]]] = None,
+                 segment: Optional[Callable[..., Awaitable[List[Any]]]] = None,
+                 import_chunk: int = PREANNOTATION_IMPORT_CHUNK,
+                 inference_concurrency: int = PREANNOTATION_INFERENCE_CONCURRENCY,
+                 batch_size: int = INFERENCE_BATCH_MAX_SIZE):
+        super().__init__(jobs_file)
+        self.labelstudio = labelstudio or LabelStudioService()
+        self.fetch_images = fetch_images or load_task_images
+        self.segment = segment or segment_images
+        self.import_chunk = max(1, import_chunk)
+        self.inference_concurrency = max(1, inference_concurrency)
+        self.batch_size = max(1, batch_size)
+
+    async def create_job(self, project_id: int, job_create: Optional[PreannotationJobCreate] = None) -> PreannotationJob:
+        """创建并启动预标注任务"""
+        job_create = job_create or PreannotationJobCreate()
+        for job in self.jobs.values():
+            if job.project_id == project_id and job.id in self.running:
+                raise ValueError(f"项目 {project_id} 已有正在运行的预标注任务: {job.id}")
+
+        result_type = job_create.result_type or ML_BACKEND_RESULT_TYPE
+        mask_format_for(result_type)  # 提前校验结果类型
+        model_version = PREANNOTATION_MODEL_VERSION
+        if job_create.model_id:
+            model_version = f"{model_version}:{job_create.model_id}"
+        job = PreannotationJob(
+            id=str(uuid.uuid4()),
+            project_id=project_id,
+            status=PreannotationStatus.PENDING,
+            model_id=job_create.model_id,
+            model_version=model_version,
+            conf_threshold=job_create.conf_threshold,
+            skip_labeled=job_create.skip_labeled,
+            page_size=max(1, job_create.page_size or PREANNOTATION_PAGE_SIZE),
+            result_type=result_type,
+            created_at=datetime.now(),
+        )
+        self.jobs[job.id] = job
+        await self._start(job)
+        return job
+
+    def _resume_message(self, job: PreannotationJob) -> str:
+        return f"从第 {job.next_page} 页恢复预标注任务 {job.id}"
+
+    async def _run(self, job: PreannotationJob):
+        """逐页处理，下一页的任务列表在处理当前页时预先获取"""
+        run_started = time.monotonic()
+        run_processed = 0
+        page = job.next_page
+        next_fetch: Optional[asyncio.Task] = asyncio.create_task(
+            self.labelstudio.get_tasks_page(job.project_id, page, job.page_size)
+        )
+        try:
+            while next_fetch is not None:
+                tasks, total = await next_fetch
+                next_fetch = None
+                if total is not None:
+                    job.total_tasks = total
+                if not tasks:
+                    break
+                if len(tasks) >= job.page_size:
+                    next_fetch = asyncio.create_task(
+                        self.labelstudio.get_tasks_page(job.project_id, page + 1, job.page_size)
+                    )
+
+                skipped, failed, imported = await self._process_page(job, tasks)
+
+                # 本页已全部导入，保存检查点（计数只在检查点累加，中断后重新处理的页不会重复计数）
+                page += 1
+                job.next_page = page
+                job.processed_tasks += len(tasks)
+                job.skipped_tasks += skipped
+                job.failed_tasks += failed
+                job.predictions_imported += imported
+                run_processed += len(tasks)
+                elapsed = time.monotonic() - run_started
+                job.throughput = round(run_processed / elapsed, 3) if elapsed > 0 else 0.0
+                if job.total_tasks is not None and job.throughput > 0:
+                    job.eta_seconds = round(max(job.total_tasks - job.processed_tasks, 0) / job.throughput, 1)
+                await self._save_jobs()
+
+            job.status = PreannotationStatus.COMPLETED
+            job.completed_at = datetime.now()
+            job.eta_seconds = 0.0
+            if job.total_tasks is None:
+                job.total_tasks = job.processed_tasks
+            logger.info(f"预标注任务 {job.id} 完成: 导入 {job.predictions_imported} 个预测")
+        except asyncio.CancelledError:
+            if job.id in self._cancel_requested:
+                job.status = PreannotationStatus.CANCELLED
+                job.completed_at = datetime.now()
+            raise
+        except Exception as e:
+            logger.error(f"预标注任务 {job.id} 在第 {page} 页失败: {e}")
+            job.status = PreannotationStatus.FAILED
+            job.error = str(e)
+            job.completed_at = datetime.now()
+        finally:
+            if next_fetch is not None:
+                next_fetch.cancel()
+            self._cancel_requested.discard(job.id)
+            self.running.pop(job.id, None)
+            await self._save_jobs()
+
+    async def _process_page(self, job: PreannotationJob, tasks: List[Dict[str, Any]]) -> Tuple[int, int, int]:
+        """处理一页任务：获取图片、分批分割、分块导入预测，返回 (跳过数, 失败数, 导入的预测数)"""
+        todo = [task for task in tasks if not (job.skip_labeled and _is_labeled(task))]
+        skipped = len(tasks) - len(todo)
+        if not todo:
+            return skipped, 0, 0
+
+        images = await self.fetch_images(todo)
+        results = await self._segment_page(images, job)
+
+        failed = 0
+        predictions = []
+        for task, result in zip(todo, results):
+            if result is None:
+                failed += 1
+                continue
+            prediction = segment_result_to_prediction(result, task.get("id"), job.result_type)
+            predictions.append({
+                "task": task["id"],
+                "result": prediction["result"],
+                "score": prediction["score"],
+                "model_version": job.model_version,
+            })
+
+        imported = 0
+        for i in range(0, len(predictions), self.import_chunk):
+            chunk = predictions[i:i + self.import_chunk]
+            imported += await self.labelstudio.import_predictions(job.project_id, chunk)
+        return skipped, failed, imported
+
+    async def _segment_page(self, images: List[Any], job: PreannotationJob) -> List[Any]:
+        """把一页图片分成推理批次，同时只提交 inference_concurrency 批，不占满推理执行器"""
+        semaphore = asyncio.Semaphore(self.inference_concurrency)
+
+        async def _segment_batch(batch: List[Any]) -> List[Any]:
+            async with semaphore:
+                return await self._segment_with_retry(batch, job)
+
+        batches = [images[i:i + self.batch_size] for i in range(0, len(images), self.batch_size)]
+        parts = await asyncio.gather(*(_segment_batch(batch) for batch in batches))
+        return [result for part in parts for result in part]
+
+    async def _segment_with_retry(self, images: List[Any], job: PreannotationJob) -> List[Any]:
+        """推理队列已满时退避重试，后台任务让出推理资源给在线请求"""
+        delay = 0.5
+        for attempt in range(QUEUE_FULL_RETRIES + 1):
+            try:
+                return await self.segment(
+                    images, job.conf_threshold, job.model_id, mask_format=mask_format_for(job.result_type)
+                )
+            except InferenceQueueFullError:
+                if attempt >= QUEUE_FULL_RETRIES:
+                    raise
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 5.0)
+
+
+_service: Optional[PreannotationService] = None
+
+
+def get_preannotation_service() -> PreannotationService:
+    """获取全局预标注任务服务（单例）"""
+    global _service
+    if _service is None:
+        _service = PreannotationService()
+    return _service
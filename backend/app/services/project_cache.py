@@ -0,0 +1,142 @@
+"""
+LabelStudio项目列表缓存
+TTL内直接返回；过期后在stale窗口内先返回旧列表，同时在后台刷新（stale-while-revalidate），
+并发的刷新合并为一次；创建或删除项目时失效。
+另外保存各分页响应的ETag/Last-Modified，重新获取时发送条件请求，304时复用该页
+"""
+import asyncio
+import logging
+import threading
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+from app.config import LABEL_STUDIO_PROJECTS_CACHE_TTL, LABEL_STUDIO_PROJECTS_STALE_SECONDS
+
+logger = logging.getLogger(__name__)
+
+
+class ProjectListCache:
+    """项目列表缓存（stale-while-revalidate）"""
+
+    def __init__(self, ttl: float = 10.0, stale_seconds: float = 60.0):
+        self.ttl = max(0.0, float(ttl))
+        self.stale_seconds = max(0.0, float(stale_seconds))
+        self._projects: Optional[List[Dict[str, Any]]] = None
+        self._fetched_at = 0.0
+        # 失效时递增，失效前发起的刷新结果不再写入缓存
+        self._generation = 0
+        self._refresh: Optional[asyncio.Task] = None
+        # 分页条件请求缓存：(page, page_size) -> (验证头, 响应数据)
+        self._pages: Dict[Tuple[int, int], Tuple[Dict[str, str], Any]] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.refreshes = 0
+        self.not_modified = 0
+
+    async def get(self, fetch: Callable[[], Awaitable[List[Dict[str, Any]]]]) -> List[Dict[str, Any]]:
+        """获取项目列表，fetch() 从LabelStudio获取完整列表"""
+        if self.ttl <= 0:
+            return await fetch()
+
+        age = time.monotonic() - self._fetched_at
+        if self._projects is not None and age < self.ttl:
+            self.hits += 1
+            return self._projects
+        if self._projects is not None and age < self.ttl + self.stale_seconds:
+            self.stale_hits += 1
+            self._start_refresh(fetch)
+            return self._projects
+
+        self.misses += 1
+        # shield：某个请求被取消时不影响与之合并的其他请求
+        return await asyncio.shield(self._start_refresh(fetch))
+
+    def _start_refresh(self, fetch: Callable[[], Awaitable[List[Dict[str, Any]]]]) -> asyncio.Task:
+        """发起刷新；已有进行中的刷新时直接复用"""
+        refresh = self._refresh
+        if refresh is None or refresh.done() or refresh.get_loop() is not asyncio.get_running_loop():
+            refresh = asyncio.create_task(self._do_refresh(fetch, self._generation))
+            refresh.add_done_callback(self._log_failure)
+            self._refresh = refresh
+        return refresh
+
+    async def _do_refresh(self, fetch, generation: int) -> List[Dict[str, Any]]:
+        projects = await fetch()
+        self.refreshes += 1
+        if generation == self._generation:
+            self._projects = projects
+            self._fetched_at = time.monotonic()
+        return projects
+
+    @staticmethod
+    def _log_failure(task: asyncio.Task):
+        if not task.cancelled() and task.exception() is not None:
+            logger.warning(f"刷新LabelStudio项目列表失败: {task.exception()}")
+
+    def invalidate(self):
+        """项目增删后使列表失效（分页验证头保留，由LabelStudio判断是否变化）"""
+        self._projects = None
+        self._fetched_at = 0.0
+        self._generation += 1
+        self._refresh = None
+
+    def conditional_headers(self, page: int, page_size: int) -> Dict[str, str]:
+        """该分页的条件请求头（If-None-Match / If-Modified-Since）"""
+        with self._lock:
+            cached = self._pages.get((page, page_size))
+        if cached is None:
+            return {}
+        validators = cached[0]
+        headers = {}
+        if validators.get("etag"):
+            headers["If-None-Match"] = validators["etag"]
+        if validators.get("last_modified"):
+            headers["If-Modified-Since"] = validators["last_modified"]
+        return headers
+
+    def cached_page(self, page: int, page_size: int) -> Any:
+        """304时复用的分页数据"""
+        with self._lock:
+            cached = self._pages.get((page, page_size))
+        if cached is None:
+            return None
+        self.not_modified += 1
+        return cached[1]
+
+    def store_page(self, page: int, page_size: int, response_headers, data: Any):
+        """保存分页数据（只有响应带ETag或Last-Modified时才有意义）"""
+        validators = {
+            "etag": response_headers.get("etag"),
+            "last_modified": response_headers.get("last-modified"),
+        }
+        with self._lock:
+            if validators["etag"] or validators["last_modified"]:
+                self._pages[(page, page_size)] = (validators, data)
+            else:
+                self._pages.pop((page, page_size), None)
+
+    def get_stats(self) -> Dict[str, Any]:
+        total = self.hits + self.stale_hits + self.misses
+        return {
+            "ttl": self.ttl,
+            "stale_seconds": self.stale_seconds,
+            "entries": len(self._projects) if self._projects is not None else 0,
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+            "hit_rate": round((self.hits + self.stale_hits) / total, 4) if total else 0.0,
+            "refreshes": self.refreshes,
+            "not_modified_pages": self.not_modified,
+        }
+
+
+_cache: Optional[ProjectListCache] = None
+
+
+def get_project_list_cache() -> ProjectListCache:
+    """获取全局项目列表缓存（单例）"""
+    global _cache
+    if _cache is None:
+        _cache = ProjectListCache(LABEL_STUDIO_PROJECTS_CACHE_TTL, LABEL_STUDIO_PROJECTS_STALE_SECONDS)
+    return _cache
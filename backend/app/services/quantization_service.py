@@ -0,0 +1,187 @@
+"""
+INT8训练后量化服务
+用少量校准图片把已登记的模型量化为INT8（OpenVINO），作为新模型登记到模型管理中，
+并记录相对原始FP32模型的精度变化，便于按模型决定是否值得用量化版本
+"""
+import random
+import shutil
+import uuid
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+import yaml
+from app.config import UPLOAD_DIR, DATA_DIR, ALLOWED_EXTENSIONS, EXPORT_IMGSZ
+from app.models.schemas import ModelMetadata, ModelType
+from app.services.inference_backend import export_artifact
+from app.services.model_service import ModelService
+
+QUANTIZATION_WORK_DIR = DATA_DIR / "quantization"
+
+
+def box_iou(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """计算两组xyxy边界框的IoU矩阵"""
+    if len(a) == 0 or len(b) == 0:
+        return np.zeros((len(a), len(b)), dtype=np.float32)
+    lt = np.maximum(a[:, None, :2], b[None, :, :2])
+    rb = np.minimum(a[:, None, 2:], b[None, :, 2:])
+    inter = np.clip(rb - lt, 0, None).prod(axis=2)
+    area_a = (a[:, 2:] - a[:, :2]).prod(axis=1)
+    area_b = (b[:, 2:] - b[:, :2]).prod(axis=1)
+    return inter / (area_a[:, None] + area_b[None, :] - inter + 1e-9)
+
+
+class QuantizationService:
+    """INT8量化服务"""
+
+    def __init__(self):
+        self.model_service = ModelService()
+        self.work_dir = QUANTIZATION_WORK_DIR
+
+    def quantize_model(self, model_id: str, calibration_data: Optional[str] = None,
+                       num_samples: int = 100, name: Optional[str] = None,
+                       description: Optional[str] = None) -> ModelMetadata:
+        """量化模型并登记为新模型（阻塞操作，应在线程池中调用）
+
+        Args:
+            model_id: 原始模型ID
+            calibration_data: 训练数据集yaml（带标签，用mAP评估精度变化）或图片目录；
+                              默认从上传目录采样（无标签，用与FP32结果的一致性评估）
+            num_samples: 校准图片数量
+        """
+        base_model = self.model_service.get_model(model_id)
+        if not base_model:
+            raise ValueError(f"模型 {model_id} 不存在")
+        if base_model.quantization:
+            raise ValueError("该模型已经是量化模型")
+        weights = Path(base_model.file_path)
+        if not weights.exists() or weights.suffix.lower() != ".pt":
+            raise ValueError("只支持对.pt格式的模型进行量化")
+
+        task = "segment" if base_model.model_type == ModelType.SEGMENTATION else "detect"
+        job_dir = self.work_dir / str(uuid.uuid4())
+        job_dir.mkdir(parents=True, exist_ok=True)
+        try:
+            data_yaml, images, has_labels = self._prepare_calibration(
+                job_dir, weights, task, calibration_data, num_samples
+            )
+
+            # 量化模型保存在模型目录中，和上传的模型一样由ModelService管理
+            new_model_id = str(uuid.uuid4())
+            artifact = self.model_service.model_dir / f"{new_model_id}_{weights.stem}_int8_openvino_model"
+            export_artifact(
+                weights, task, artifact,
+                format="openvino", int8=True, data=str(data_yaml),
+                imgsz=EXPORT_IMGSZ, batch=1, dynamic=True
+            )
+
+            if has_labels:
+                delta, metric, int8_map = self._evaluate_map(weights, artifact, task, data_yaml)
+            else:
+                delta, metric = self._evaluate_agreement(weights, artifact, task, images)
+                int8_map = None
+
+            return self.model_service.register_model(
+                model_id=new_model_id,
+                file_path=artifact,
+                name=name or f"{base_model.name} (INT8)",
+                model_type=base_model.model_type,
+                description=description or f"{base_model.name} 的INT8量化版本",
+                version=base_model.version,
+                mAP=int8_map,
+                training_task_id=base_model.training_task_id,
+                quantization="int8",
+                base_model_id=base_model.id,
+                accuracy_delta=delta,
+                accuracy_delta_metric=metric
+            )
+        finally:
+            shutil.rmtree(job_dir, ignore_errors=True)
+
+    def _prepare_calibration(self, job_dir: Path, weights: Path, task: str,
+                             calibration_data: Optional[str],
+                             num_samples: int) -> Tuple[Path, List[Path], bool]:
+        """准备校准数据集，返回 (数据集yaml, 校准图片, 是否带标签)"""
+        if calibration_data and Path(calibration_data).suffix.lower() in (".yaml", ".yml"):
+            data_yaml = Path(calibration_data)
+            if not data_yaml.exists():
+                raise ValueError(f"数据集配置不存在: {calibration_data}")
+            return data_yaml, [], True
+
+        source_dir = Path(calibration_data) if calibration_data else UPLOAD_DIR
+        if not source_dir.is_dir():
+            raise ValueError(f"校准图片目录不存在: {source_dir}")
+        candidates = sorted(
+            p for p in source_dir.rglob("*") if p.is_file() and p.suffix.lower() in ALLOWED_EXTENSIONS
+        )
+        if not candidates:
+            raise ValueError(f"校准图片目录中没有图片: {source_dir}")
+
+        # 固定随机种子，同一批图片多次量化结果可复现
+        rng = random.Random(0)
+        samples = rng.sample(candidates, min(num_samples, len(candidates)))
+
+        images_dir = job_dir / "images"
+        images_dir.mkdir(parents=True)
+        images = []
+        for i, src in enumerate(samples):
+            dst = images_dir / f"{i:05d}{src.suffix.lower()}"
+            shutil.copy2(src, dst)
+            images.append(dst)
+
+        from ultralytics import YOLO
+        names: Dict[int, str] = dict(YOLO(str(weights), task=task).names)
+        data_yaml = job_dir / "data.yaml"
+        with open(data_yaml, "w", encoding="utf-8") as f:
+            yaml.safe_dump(
+                {"path": str(job_dir), "train": "images", "val": "images", "names": names},
+                f, allow_unicode=True
+            )
+        return data_yaml, images, False
+
+    @staticmethod
+    def _evaluate_map(weights: Path, artifact: Path, task: str,
+                      data_yaml: Path) -> Tuple[float, str, float]:
+        """在带标签的验证集上分别评估FP32和INT8模型的mAP50-95"""
+        from ultralytics import YOLO
+
+        def _map(model_path: Path) -> float:
+            metrics = YOLO(str(model_path), task=task).val(
+                data=str(data_yaml), imgsz=EXPORT_IMGSZ, batch=1, plots=False, verbose=False
+            )
+            return float(metrics.seg.map if task == "segment" else metrics.box.map)
+
+        fp32_map = _map(weights)
+        int8_map = _map(artifact)
+        return int8_map - fp32_map, "mAP50-95", int8_map
+
+    @staticmethod
+    def _evaluate_agreement(weights: Path, artifact: Path, task: str,
+                            images: List[Path], iou_threshold: float = 0.5) -> Tuple[float, str]:
+        """没有标签时，以FP32结果为基准计算INT8结果的F1一致性，精度变化 = F1 - 1"""
+        from ultralytics import YOLO
+        fp32_model = YOLO(str(weights), task=task)
+        int8_model = YOLO(str(artifact), task=task)
+
+        scores = []
+        for image in images:
+            ref = fp32_model(str(image), verbose=False)[0].boxes
+            cand = int8_model(str(image), verbose=False)[0].boxes
+            ref_xyxy, ref_cls = ref.xyxy.cpu().numpy(), ref.cls.cpu().numpy()
+            cand_xyxy, cand_cls = cand.xyxy.cpu().numpy(), cand.cls.cpu().numpy()
+            if len(ref_xyxy) == 0 and len(cand_xyxy) == 0:
+                scores.append(1.0)
+                continue
+
+            # 同类别且IoU超过阈值才算匹配，贪心一对一匹配
+            iou = box_iou(ref_xyxy, cand_xyxy)
+            iou[ref_cls[:, None] != cand_cls[None, :]] = 0.0
+            matched = 0
+            while iou.size and iou.max() >= iou_threshold:
+                i, j = np.unravel_index(np.argmax(iou), iou.shape)
+                matched += 1
+                iou[i, :] = 0.0
+                iou[:, j] = 0.0
+            scores.append(2.0 * matched / (len(ref_xyxy) + len(cand_xyxy)))
+
+        agreement = float(np.mean(scores)) if scores else 1.0
+        return agreement - 1.0, "agreement_f1"
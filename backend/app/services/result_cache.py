@@ -0,0 +1,140 @@
+"""
+推理结果缓存
+按 图片内容哈希 + 模型 + 推理参数 缓存检测/分割结果：内存中为有界LRU，可选磁盘二级缓存。
+切换模型时整体失效
+"""
+import hashlib
+import json
+import shutil
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+# 缓存结果的格式版本，结果模型增加字段（如分割结果的原图尺寸）时递增，使旧的磁盘缓存失效
+CACHE_FORMAT_VERSION = 2
+
+
+def hash_file(path: str) -> str:
+    """计算文件内容的sha256"""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def make_cache_key(kind: str, content_hash: str, model_key: str, params: Optional[Dict[str, Any]] = None) -> str:
+    """生成缓存键"""
+    raw = json.dumps(
+        {"kind": kind, "content": content_hash, "model": model_key, "params": params or {},
+         "version": CACHE_FORMAT_VERSION},
+        sort_keys=True
+    )
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class ResultCache:
+    """两级结果缓存（内存LRU + 可选磁盘），值为序列化后的JSON字符串"""
+
+    def __init__(self, max_entries: int = 256, max_bytes: int = 64 * 1024 * 1024,
+                 disk_dir: Optional[Path] = None):
+        self.max_entries = max(1, int(max_entries))
+        self.max_bytes = max(1, int(max_bytes))
+        self.disk_dir = Path(disk_dir) if disk_dir else None
+
+        self._entries: "OrderedDict[str, str]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+        self._hits = 0
+        self._disk_hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._invalidations = 0
+
+    def _disk_path(self, key: str) -> Path:
+        return self.disk_dir / key[:2] / f"{key}.json"
+
+    def get(self, key: str) -> Optional[str]:
+        """获取缓存值，内存未命中时尝试磁盘缓存"""
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+                self._hits += 1
+                return value
+
+        if self.disk_dir is not None:
+            path = self._disk_path(key)
+            try:
+                value = path.read_text(encoding="utf-8")
+            except (FileNotFoundError, OSError):
+                value = None
+            if value is not None:
+                with self._lock:
+                    self._disk_hits += 1
+                    self._put_memory(key, value)
+                return value
+
+        with self._lock:
+            self._misses += 1
+        return None
+
+    def put(self, key: str, value: str):
+        """写入缓存（同时写磁盘缓存）"""
+        with self._lock:
+            self._put_memory(key, value)
+
+        if self.disk_dir is not None:
+            path = self._disk_path(key)
+            try:
+                path.parent.mkdir(parents=True, exist_ok=True)
+                tmp_path = path.with_suffix(".tmp")
+                tmp_path.write_text(value, encoding="utf-8")
+                tmp_path.replace(path)
+            except OSError:
+                pass
+
+    def _put_memory(self, key: str, value: str):
+        size = len(value)
+        if size > self.max_bytes:
+            return
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self._bytes -= len(old)
+        self._entries[key] = value
+        self._bytes += size
+        while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self._bytes -= len(evicted)
+            self._evictions += 1
+
+    def clear(self):
+        """清空所有缓存（切换模型时调用）"""
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+            self._invalidations += 1
+        if self.disk_dir is not None and self.disk_dir.exists():
+            shutil.rmtree(self.disk_dir, ignore_errors=True)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取缓存命中统计"""
+        with self._lock:
+            hits = self._hits + self._disk_hits
+            total = hits + self._misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+                "disk_enabled": self.disk_dir is not None,
+                "hits": hits,
+                "memory_hits": self._hits,
+                "disk_hits": self._disk_hits,
+                "misses": self._misses,
+                "hit_rate": (hits / total) if total else 0.0,
+                "evictions": self._evictions,
+                "invalidations": self._invalidations,
+            }
@@ -0,0 +1,214 @@
+"""
+推理结果的紧凑编码
+默认仍返回pydantic模型的JSON；客户端可以通过 format 查询参数或 Accept 头选择：
+- compact: 列式JSON，检测框/置信度/类别各为一个数组，多边形顶点（及RLE）展平为一个数组（坐标保留2位小数）
+- msgpack: 与compact相同的结构，数值数组为小端float32/int32二进制（RLE为原始字节），需要安装msgpack
+安装了orjson时compact格式用orjson序列化。推理结果为 ArrayResult 时直接由数组编码，不经过pydantic模型
+"""
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+import json
+import numpy as np
+from fastapi.responses import JSONResponse, Response
+from app.models.schemas import DetectionResult, SegmentResult
+from app.services.metrics import span
+from app.services.yolo_service import ArrayResult, map_class_names
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+FORMATS = ("json", "compact", "msgpack")
+COMPACT_MEDIA_TYPE = "application/vnd.defect.compact+json"
+MSGPACK_MEDIA_TYPES = ("application/x-msgpack", "application/msgpack", "application/vnd.msgpack")
+
+
+class ResultFormatError(ValueError):
+    """不支持的结果格式"""
+
+
+def negotiate_format(accept: Optional[str] = None, requested: Optional[str] = None) -> str:
+    """确定响应格式：format查询参数优先，其次是Accept头，默认json"""
+    if requested:
+        fmt = requested.lower()
+        if fmt not in FORMATS:
+            raise ResultFormatError(f"不支持的结果格式: {requested}，可选: {', '.join(FORMATS)}")
+    else:
+        accept = (accept or "").lower()
+        if any(media_type in accept for media_type in MSGPACK_MEDIA_TYPES):
+            fmt = "msgpack"
+        elif COMPACT_MEDIA_TYPE in accept:
+            fmt = "compact"
+        else:
+            fmt = "json"
+    if fmt == "msgpack" and msgpack is None:
+        raise ResultFormatError("服务端未安装msgpack，无法使用msgpack格式")
+    return fmt
+
+
+def _pack_floats(values: np.ndarray, binary: bool):
+    """float数组：二进制格式为小端float32字节，JSON格式为保留2位小数的列表"""
+    if binary:
+        return np.ascontiguousarray(values, dtype="<f4").tobytes()
+    return np.round(values.astype(np.float64), 2).ravel().tolist()
+
+
+def _pack_ints(values: np.ndarray, binary: bool):
+    if binary:
+        return np.ascontiguousarray(values, dtype="<i4").tobytes()
+    return values.astype(np.int64).ravel().tolist()
+
+
+def _encode_classes(class_names: List[str], binary: bool) -> Tuple[List[str], Any]:
+    """类别名称去重为一张表，每个结果只保存在表中的下标"""
+    if not class_names:
+        return [], _pack_ints(np.zeros((0,), dtype=np.int32), binary)
+    table, index = np.unique(np.array(class_names, dtype=object), return_inverse=True)
+    return table.tolist(), _pack_ints(index, binary)
+
+
+def _pack_bytes(values: np.ndarray, binary: bool):
+    """uint8数组（RLE）：二进制格式为原始字节，JSON格式为整数列表"""
+    if binary:
+        return np.ascontiguousarray(values, dtype=np.uint8).tobytes()
+    return values.astype(np.int64).ravel().tolist()
+
+
+def _gather_ranges(values: np.ndarray, offsets: np.ndarray, indices: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """按offsets切分的展平数组只保留indices对应的各段，返回 (新的展平数组, 新的offsets)"""
+    lengths = (offsets[1:] - offsets[:-1])[indices]
+    new_offsets = np.zeros(len(indices) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=new_offsets[1:])
+    # 每个输出元素在原数组中的位置 = 所在段的原起点 + 段内序号
+    positions = np.repeat(offsets[:-1][indices] - new_offsets[:-1], lengths) + np.arange(new_offsets[-1])
+    return values[positions], new_offsets
+
+
+def arrays_to_columns(result: ArrayResult, binary: bool = False) -> Dict[str, Any]:
+    """由推理的紧凑数组直接生成列式结构，过滤规则与构建pydantic结果时一致（无效框、没有mask的分割结果）"""
+    arrays = result.arrays
+    xyxy, conf, cls_ids = arrays["xyxy"], arrays["conf"], arrays["cls"]
+    valid = np.isfinite(xyxy).all(axis=1) & np.isfinite(conf)
+    segment = result.kind == "segment"
+    rle_offsets = arrays.get("rle_offsets") if segment else None
+    if segment:
+        if rle_offsets is not None:
+            valid &= np.diff(rle_offsets) > 0
+        else:
+            valid &= np.diff(arrays["poly_offsets"]) >= 3
+    indices = np.flatnonzero(valid)
+    class_names, class_ids = _encode_classes(map_class_names(cls_ids[indices], result.names), binary)
+    columns = {
+        "image_path": result.image_path,
+        "timestamp": datetime.now().isoformat(),
+        "count": len(indices),
+        "class_names": class_names,
+        "class_ids": class_ids,
+        "confidence": _pack_floats(conf[indices], binary),
+        "xyxy": _pack_floats(xyxy[indices], binary),
+    }
+    if not segment:
+        return columns
+
+    polygons, offsets = _gather_ranges(arrays["poly_xy"], arrays["poly_offsets"], indices)
+    columns["polygon_offsets"] = _pack_ints(offsets, binary)
+    columns["polygons"] = _pack_floats(polygons, binary)
+    if rle_offsets is not None:
+        rle, rle_offsets = _gather_ranges(arrays["rle_bytes"], rle_offsets, indices)
+        columns["rle_offsets"] = _pack_ints(rle_offsets, binary)
+        columns["rle"] = _pack_bytes(rle, binary)
+    orig_shape = arrays.get("orig_shape")
+    image_height, image_width = orig_shape.tolist() if orig_shape is not None else (None, None)
+    columns["image_width"] = image_width
+    columns["image_height"] = image_height
+    return columns
+
+
+def detection_to_columns(result: DetectionResult, binary: bool = False) -> Dict[str, Any]:
+    """检测结果转为列式结构：xyxy为 N*4 展平数组"""
+    defects = result.defects
+    xyxy = np.array([[b.x1, b.y1, b.x2, b.y2] for b in defects], dtype=np.float32).reshape(-1, 4)
+    conf = np.array([b.confidence for b in defects], dtype=np.float32)
+    class_names, class_ids = _encode_classes([b.class_name for b in defects], binary)
+    return {
+        "image_path": result.image_path,
+        "timestamp": result.timestamp.isoformat(),
+        "count": len(defects),
+        "class_names": class_names,
+        "class_ids": class_ids,
+        "confidence": _pack_floats(conf, binary),
+        "xyxy": _pack_floats(xyxy, binary),
+    }
+
+
+def segment_to_columns(result: SegmentResult, binary: bool = False) -> Dict[str, Any]:
+    """分割结果转为列式结构：所有多边形顶点展平为 polygons [x0, y0, x1, y1, ...]，
+    第i个多边形为顶点 polygon_offsets[i] 到 polygon_offsets[i+1]；RLE输出时另有 rle / rle_offsets"""
+    masks = result.masks
+    xyxy = np.array(
+        [[m.bbox.x1, m.bbox.y1, m.bbox.x2, m.bbox.y2] for m in masks], dtype=np.float32
+    ).reshape(-1, 4)
+    conf = np.array([m.confidence for m in masks], dtype=np.float32)
+    class_names, class_ids = _encode_classes([m.class_name for m in masks], binary)
+
+    offsets = np.zeros(len(masks) + 1, dtype=np.int32)
+    offsets[1:] = np.cumsum([len(m.polygon) for m in masks])
+    polygons = np.array(
+        [(p.x, p.y) for m in masks for p in m.polygon], dtype=np.float32
+    ).reshape(-1, 2)
+    columns = {
+        "image_path": result.image_path,
+        "timestamp": result.timestamp.isoformat(),
+        "count": len(masks),
+        "class_names": class_names,
+        "class_ids": class_ids,
+        "confidence": _pack_floats(conf, binary),
+        "xyxy": _pack_floats(xyxy, binary),
+        "polygon_offsets": _pack_ints(offsets, binary),
+        "polygons": _pack_floats(polygons, binary),
+    }
+    if any(m.rle is not None for m in masks):
+        # RLE输出：第i个mask为 rle[rle_offsets[i]:rle_offsets[i+1]]
+        rle_offsets = np.zeros(len(masks) + 1, dtype=np.int64)
+        rle_offsets[1:] = np.cumsum([len(m.rle or ()) for m in masks])
+        rle = np.array([v for m in masks for v in (m.rle or ())], dtype=np.uint8)
+        columns["rle_offsets"] = _pack_ints(rle_offsets, binary)
+        columns["rle"] = _pack_bytes(rle, binary)
+    columns["image_width"] = result.image_width
+    columns["image_height"] = result.image_height
+    return columns
+
+
+def result_to_columns(result: Any, fmt: str) -> Any:
+    """按格式转换结果，json格式原样返回"""
+    if fmt == "json" or result is None:
+        return result
+    binary = fmt == "msgpack"
+    if isinstance(result, ArrayResult):
+        return arrays_to_columns(result, binary)
+    if isinstance(result, SegmentResult):
+        return segment_to_columns(result, binary)
+    return detection_to_columns(result, binary)
+
+
+def dumps_compact(content: Any) -> bytes:
+    """序列化compact格式（优先orjson）"""
+    if orjson is not None:
+        return orjson.dumps(content)
+    return json.dumps(content, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def encode_response(content: Dict[str, Any], fmt: str) -> Response:
+    """按格式生成响应，content中的result应已由 result_to_columns 转换"""
+    with span(f"api.serialize_{fmt}"):
+        if fmt == "msgpack":
+            return Response(content=msgpack.packb(content, use_bin_type=True), media_type=MSGPACK_MEDIA_TYPES[0])
+        if fmt == "compact":
+            return Response(content=dumps_compact(content), media_type=COMPACT_MEDIA_TYPE)
+        return JSONResponse(content=content)
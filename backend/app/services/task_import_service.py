@@ -0,0 +1,218 @@
+"""
+LabelStudio批量导入任务
+大量任务按数量（TASK_IMPORT_CHUNK_SIZE）和请求体大小（TASK_IMPORT_CHUNK_MAX_MB）分块，在后台并发发送；
+确定没有被LabelStudio处理的失败（连接失败、429、502/503/504）按指数退避自动重试。
+每个分块导入成功后保存检查点（completed_chunks），分块重试后仍失败时停止发送新的分块，
+恢复任务（或服务重启后自动恢复）时只发送未完成的分块
+"""
+import asyncio
+import json
+import logging
+import random
+import time
+import uuid
+from collections import deque
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+import httpx
+from app.config import (
+    TASK_IMPORT_JOBS_FILE,
+    TASK_IMPORT_DIR,
+    TASK_IMPORT_CHUNK_SIZE,
+    TASK_IMPORT_CHUNK_MAX_MB,
+    TASK_IMPORT_CONCURRENCY,
+    TASK_IMPORT_MAX_RETRIES,
+    TASK_IMPORT_RETRY_BACKOFF,
+)
+from app.models.schemas import TaskImportJob, TaskImportJobCreate, TaskImportStatus
+from app.services.job_runner import CheckpointedJobService
+from app.services.labelstudio_service import LabelStudioService
+
+logger = logging.getLogger(__name__)
+
+# 请求确定没有被处理、可以安全重试的状态码（其他错误重试可能导致任务被重复导入）
+RETRY_STATUS_CODES = (429, 502, 503, 504)
+MAX_RETRY_DELAY = 30.0
+
+
+def split_chunks(tasks: List[Dict[str, Any]], chunk_size: int, max_bytes: int) -> List[List[int]]:
+    """按任务数和JSON大小分块，返回各分块的 [起始, 结束) 位置；单个任务超过大小限制时独占一块"""
+    chunks = []
+    start, size = 0, 0
+    for i, task in enumerate(tasks):
+        task_bytes = len(json.dumps(task, ensure_ascii=False).encode("utf-8")) + 1
+        if i > start and (i - start >= chunk_size or size + task_bytes > max_bytes):
+            chunks.append([start, i])
+            start, size = i, 0
+        size += task_bytes
+    if start < len(tasks):
+        chunks.append([start, len(tasks)])
+    return chunks
+
+
+def _is_retryable(error: Exception) -> bool:
+    """失败的请求是否确定没有被LabelStudio处理"""
+    cause = error.__cause__ or error
+    if isinstance(cause, httpx.HTTPStatusError):
+        return cause.response.status_code in RETRY_STATUS_CODES
+    # 连接没有建立（读取超时等情况下LabelStudio可能已经导入了该分块）
+    return isinstance(cause, (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout))
+
+
+def _retry_after(error: Exception) -> Optional[float]:
+    """429/503响应中的Retry-After（秒）"""
+    cause = error.__cause__
+    if isinstance(cause, httpx.HTTPStatusError):
+        value = cause.response.headers.get("retry-after", "")
+        if value.isdigit():
+            return float(value)
+    return None
+
+
+class TaskImportService(CheckpointedJobService):
+    """批量导入任务管理，labelstudio 可以替换，便于对本地的假LabelStudio测试"""
+
+    job_model = TaskImportJob
+    status_enum = TaskImportStatus
+    job_label = "导入任务"
+
+    def __init__(self, labelstudio: Optional[LabelStudioService] = None,
+                 jobs_file: Path = TASK_IMPORT_JOBS_FILE,
+                 tasks_dir: Path = TASK_IMPORT_DIR,
+                 max_retries: int = TASK_IMPORT_MAX_RETRIES,
+                 retry_backoff: float = TASK_IMPORT_RETRY_BACKOFF):
+        super().__init__(jobs_file)
+        self.labelstudio = labelstudio or LabelStudioService()
+        self.tasks_dir = Path(tasks_dir)
+        self.max_retries = max(0, max_retries)
+        self.retry_backoff = max(0.0, retry_backoff)
+
+    def _tasks_path(self, job_id: str) -> Path:
+        return self.tasks_dir / f"{job_id}.json"
+
+    def _write_tasks(self, job_id: str, tasks: List[Dict[str, Any]]):
+        self.tasks_dir.mkdir(parents=True, exist_ok=True)
+        path = self._tasks_path(job_id)
+        tmp_path = path.with_suffix(".tmp")
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(tasks, f, ensure_ascii=False)
+        tmp_path.replace(path)
+
+    def _read_tasks(self, job_id: str) -> List[Dict[str, Any]]:
+        with open(self._tasks_path(job_id), 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    async def create_job(self, project_id: int, job_create: TaskImportJobCreate) -> TaskImportJob:
+        """保存待导入的任务并在后台开始导入"""
+        if not job_create.tasks:
+            raise ValueError("没有要导入的任务")
+        chunk_size = max(1, job_create.chunk_size or TASK_IMPORT_CHUNK_SIZE)
+        max_bytes = max(1, int(TASK_IMPORT_CHUNK_MAX_MB * 1024 * 1024))
+        chunks = await asyncio.to_thread(split_chunks, job_create.tasks, chunk_size, max_bytes)
+        job = TaskImportJob(
+            id=str(uuid.uuid4()),
+            project_id=project_id,
+            status=TaskImportStatus.PENDING,
+            total_tasks=len(job_create.tasks),
+            chunks=chunks,
+            concurrency=max(1, job_create.concurrency or TASK_IMPORT_CONCURRENCY),
+            created_at=datetime.now(),
+        )
+        await asyncio.to_thread(self._write_tasks, job.id, job_create.tasks)
+        self.jobs[job.id] = job
+        await self._start(job)
+        return job
+
+    def _resume_message(self, job: TaskImportJob) -> str:
+        return f"恢复导入任务 {job.id}（已完成 {len(job.completed_chunks)}/{len(job.chunks)} 块）"
+
+    async def _run(self, job: TaskImportJob):
+        """多个worker从待发送队列中取分块，任何分块最终失败后不再取新的分块"""
+        run_started = time.monotonic()
+        run_imported = 0
+        try:
+            tasks = await asyncio.to_thread(self._read_tasks, job.id)
+            done = set(job.completed_chunks)
+            pending = deque(i for i in range(len(job.chunks)) if i not in done)
+            job.failed_chunks = []
+
+            async def _worker():
+                nonlocal run_imported
+                while pending and not job.failed_chunks:
+                    index = pending.popleft()
+                    start, end = job.chunks[index]
+                    try:
+                        await self._import_chunk(job, tasks[start:end])
+                    except Exception as e:
+                        logger.error(f"导入任务 {job.id} 第 {index} 块失败: {e}")
+                        job.failed_chunks.append(index)
+                        job.error = f"第 {index} 块导入失败: {e}"
+                        await self._save_jobs()
+                        return
+                    job.completed_chunks.append(index)
+                    job.imported_tasks += end - start
+                    run_imported += end - start
+                    elapsed = time.monotonic() - run_started
+                    job.throughput = round(run_imported / elapsed, 3) if elapsed > 0 else 0.0
+                    if job.throughput > 0:
+                        job.eta_seconds = round((job.total_tasks - job.imported_tasks) / job.throughput, 1)
+                    await self._save_jobs()
+
+            await asyncio.gather(*(_worker() for _ in range(min(job.concurrency, len(pending)))))
+
+            job.completed_at = datetime.now()
+            if job.failed_chunks:
+                job.status = TaskImportStatus.FAILED
+                logger.warning(
+                    f"导入任务 {job.id} 失败: 已导入 {job.imported_tasks}/{job.total_tasks} 个任务，可恢复后继续"
+                )
+            else:
+                job.status = TaskImportStatus.COMPLETED
+                job.eta_seconds = 0.0
+                job.error = None
+                await asyncio.to_thread(self._tasks_path(job.id).unlink, missing_ok=True)
+                logger.info(f"导入任务 {job.id} 完成: 导入 {job.imported_tasks} 个任务")
+        except asyncio.CancelledError:
+            if job.id in self._cancel_requested:
+                job.status = TaskImportStatus.CANCELLED
+                job.completed_at = datetime.now()
+            raise
+        except Exception as e:
+            logger.error(f"导入任务 {job.id} 失败: {e}")
+            job.status = TaskImportStatus.FAILED
+            job.error = str(e)
+            job.completed_at = datetime.now()
+        finally:
+            self._cancel_requested.discard(job.id)
+            self.running.pop(job.id, None)
+            await self._save_jobs()
+
+    async def _import_chunk(self, job: TaskImportJob, tasks: List[Dict[str, Any]]):
+        """导入一个分块，可重试的错误按指数退避（带随机抖动，优先使用Retry-After）重试"""
+        attempt = 0
+        while True:
+            try:
+                await self.labelstudio.import_tasks(job.project_id, tasks)
+                return
+            except Exception as e:
+                if attempt >= self.max_retries or not _is_retryable(e):
+                    raise
+                delay = _retry_after(e)
+                if delay is None:
+                    delay = self.retry_backoff * (2 ** attempt) * (0.5 + random.random())
+                attempt += 1
+                job.retries += 1
+                logger.warning(f"导入任务 {job.id} 分块导入失败，{delay:.1f}秒后第 {attempt} 次重试: {e}")
+                await asyncio.sleep(min(delay, MAX_RETRY_DELAY))
+
+
+_service: Optional[TaskImportService] = None
+
+
+def get_task_import_service() -> TaskImportService:
+    """获取全局批量导入任务服务（单例）"""
+    global _service
+    if _service is None:
+        _service = TaskImportService()
+    return _service
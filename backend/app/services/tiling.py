@@ -0,0 +1,140 @@
+"""
+切片推理工具
+把高分辨率图片切成互相重叠的小块分别推理，再把各块的检测框/多边形平移回原图坐标，
+用NMS合并重复结果，提升大图上细小瑕疵的召回率
+"""
+from typing import Dict, List, Optional
+import numpy as np
+import torch
+import torchvision
+
+
+def make_tiles(width: int, height: int, tile_size: int, overlap: float) -> np.ndarray:
+    """计算切片位置 (N, 4) [x1, y1, x2, y2]，相邻切片按overlap比例重叠，最后一块贴齐图片边缘"""
+    tile_size = max(1, int(tile_size))
+    stride = max(1, int(tile_size * (1.0 - min(max(overlap, 0.0), 0.9))))
+
+    def _starts(length: int) -> List[int]:
+        if length <= tile_size:
+            return [0]
+        starts = list(range(0, length - tile_size, stride))
+        starts.append(length - tile_size)
+        return starts
+
+    tiles = [
+        (x, y, min(x + tile_size, width), min(y + tile_size, height))
+        for y in _starts(height)
+        for x in _starts(width)
+    ]
+    return np.array(tiles, dtype=np.int32).reshape(-1, 4)
+
+
+# 包含关系后处理时每次计算的行数（限制 行数×候选框数 的临时矩阵大小）
+_CONTAINMENT_BLOCK = 1024
+# 框的边与切片内部边缘（不是图片边缘）的距离小于此像素数时，认为框被切片截断
+EDGE_MARGIN = 2.0
+
+
+def nms(xyxy: np.ndarray, conf: np.ndarray, cls: np.ndarray, threshold: float,
+        truncated: Optional[np.ndarray] = None) -> np.ndarray:
+    """按类别NMS，返回保留的下标（按置信度降序）
+
+    先用 torchvision 的 batched_nms（IoU，C++实现）完成主要的抑制；被切片边缘截断的框与完整框的IoU很低，
+    但几乎被完整框包含，再对这些框按 交集/较小框面积 去除。truncated 为被截断的框（为空时检查所有框）
+    """
+    if len(xyxy) == 0:
+        return np.zeros((0,), dtype=np.int64)
+    keep = torchvision.ops.batched_nms(
+        torch.from_numpy(np.ascontiguousarray(xyxy, dtype=np.float32)),
+        torch.from_numpy(np.ascontiguousarray(conf, dtype=np.float32)),
+        torch.from_numpy(np.ascontiguousarray(cls, dtype=np.int64)),
+        float(threshold),
+    ).numpy()
+    candidates = np.flatnonzero(truncated[keep]) if truncated is not None else np.arange(len(keep))
+    if len(candidates) == 0:
+        return keep
+    suppressed = _contained(xyxy[keep].astype(np.float32), cls[keep], candidates, threshold)
+    return np.delete(keep, candidates[suppressed])
+
+
+def _contained(boxes: np.ndarray, cls: np.ndarray, candidates: np.ndarray, threshold: float) -> np.ndarray:
+    """boxes按置信度降序；候选框与置信度更高的同类框的 交集/较小框面积 超过阈值时被抑制，返回候选框是否被抑制
+
+    分块计算 (框 × 候选框) 的重叠矩阵，没有逐框的Python循环
+    """
+    boxes_t = torch.from_numpy(boxes)
+    cls_t = torch.from_numpy(np.ascontiguousarray(cls, dtype=np.int64))
+    cand_t = torch.from_numpy(np.ascontiguousarray(candidates, dtype=np.int64))
+    areas = (boxes_t[:, 2] - boxes_t[:, 0]).clamp(min=0) * (boxes_t[:, 3] - boxes_t[:, 1]).clamp(min=0)
+    cols, col_areas, col_cls = boxes_t[cand_t][None], areas[cand_t][None], cls_t[cand_t][None]
+    suppressed = torch.zeros(len(candidates), dtype=torch.bool)
+    # 只有排在最后一个候选框之前的框才可能抑制候选框
+    last = int(candidates.max())
+    for start in range(0, last, _CONTAINMENT_BLOCK):
+        stop = min(start + _CONTAINMENT_BLOCK, last)
+        rows = boxes_t[start:stop, None]
+        inter = (
+            (torch.minimum(rows[..., 2], cols[..., 2]) - torch.maximum(rows[..., 0], cols[..., 0])).clamp(min=0)
+            * (torch.minimum(rows[..., 3], cols[..., 3]) - torch.maximum(rows[..., 1], cols[..., 1])).clamp(min=0)
+        )
+        overlap = inter / (torch.minimum(areas[start:stop, None], col_areas) + 1e-9)
+        # 只有置信度更高（排在前面）的同类框可以抑制候选框
+        valid = (torch.arange(start, stop)[:, None] < cand_t[None]) & (cls_t[start:stop, None] == col_cls)
+        suppressed |= ((overlap > threshold) & valid).any(dim=0)
+    return suppressed.numpy()
+
+
+def _truncated_boxes(xyxy: np.ndarray, regions: np.ndarray, width: int, height: int) -> np.ndarray:
+    """各框是否贴着所在切片的内部边缘（切片边缘与图片边缘重合的一侧不算截断）"""
+    x1, y1, x2, y2 = (regions[:, i].astype(np.float32) for i in range(4))
+    near = np.zeros(len(xyxy), dtype=bool)
+    for edge, coord, inner in (
+        (x1, xyxy[:, 0], x1 > 0), (y1, xyxy[:, 1], y1 > 0),
+        (x2, xyxy[:, 2], x2 < width), (y2, xyxy[:, 3], y2 < height),
+    ):
+        near |= inner & (np.abs(coord - edge) <= EDGE_MARGIN)
+    return near
+
+
+def merge_tile_arrays(items: List[Dict[str, np.ndarray]], regions: np.ndarray,
+                      nms_threshold: float) -> Dict[str, np.ndarray]:
+    """把各切片的紧凑数组结果平移回原图坐标并合并，NMS去除重叠区域的重复结果
+
+    items 的格式与 YoloService.extract_detection_arrays / extract_segmentation_arrays 一致，
+    坐标为各切片内的像素坐标；regions 为各切片在原图中的位置 (N, 4) [x1, y1, x2, y2]
+    """
+    regions = np.asarray(regions).reshape(-1, 4)
+    width, height = (int(regions[:, 2].max()), int(regions[:, 3].max())) if len(regions) else (0, 0)
+    has_polygons = bool(items) and "poly_xy" in items[0]
+    xyxy, conf, cls, polygons, truncated = [], [], [], [], []
+    for item, region in zip(items, regions):
+        x0, y0 = int(region[0]), int(region[1])
+        boxes = item["xyxy"] + np.array([x0, y0, x0, y0], dtype=np.float32)
+        xyxy.append(boxes)
+        truncated.append(_truncated_boxes(boxes.reshape(-1, 4), region[None].repeat(len(boxes), 0), width, height))
+        conf.append(item["conf"])
+        cls.append(item["cls"])
+        if has_polygons:
+            offsets = item["poly_offsets"]
+            shifted = item["poly_xy"] + np.array([x0, y0], dtype=np.float32)
+            polygons.extend(shifted[offsets[i]:offsets[i + 1]] for i in range(len(offsets) - 1))
+
+    merged = {
+        "xyxy": np.concatenate(xyxy).astype(np.float32).reshape(-1, 4) if xyxy else np.zeros((0, 4), dtype=np.float32),
+        "conf": np.concatenate(conf).astype(np.float32) if conf else np.zeros((0,), dtype=np.float32),
+        "cls": np.concatenate(cls).astype(np.int32) if cls else np.zeros((0,), dtype=np.int32),
+    }
+    truncated = np.concatenate(truncated) if truncated else np.zeros((0,), dtype=bool)
+    keep = nms(merged["xyxy"], merged["conf"], merged["cls"], nms_threshold, truncated)
+    merged = {key: value[keep] for key, value in merged.items()}
+
+    if has_polygons:
+        kept = [polygons[i] for i in keep.tolist()]
+        offsets = np.zeros(len(kept) + 1, dtype=np.int32)
+        if kept:
+            offsets[1:] = np.cumsum([len(p) for p in kept])
+            merged["poly_xy"] = np.concatenate(kept).astype(np.float32).reshape(-1, 2)
+        else:
+            merged["poly_xy"] = np.zeros((0, 2), dtype=np.float32)
+        merged["poly_offsets"] = offsets
+    return merged
@@ -0,0 +1,87 @@
+"""
+启动预热服务
+服务启动后在后台线程预加载当前激活的检测/分割模型，并用合成图片执行若干次预热推理，
+使首个请求不再承担模型加载和首次推理（内存分配、算子选择）的开销。
+预热完成前 /ready 返回未就绪，/health 只表示进程存活
+"""
+import threading
+import time
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+# 预热的任务类型；检测模型是必需的，分割模型加载失败只记录错误，不影响就绪
+_TASKS = ("detect", "segment")
+_REQUIRED_TASKS = ("detect",)
+
+
+class WarmupState:
+    """启动预热状态"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self.state = "pending"  # pending / warming / ready / failed
+        self.started_at: Optional[str] = None
+        self.finished_at: Optional[str] = None
+        self.tasks: Dict[str, Dict[str, Any]] = {}
+
+    def start(self, enabled: bool = True):
+        """在后台线程开始预热；未启用预加载时直接标记为就绪"""
+        with self._lock:
+            if self._thread is not None or self.state != "pending":
+                return
+            self.started_at = datetime.now().isoformat()
+            if not enabled:
+                self.state = "ready"
+                self.finished_at = self.started_at
+                return
+            self.state = "warming"
+            self.tasks = {
+                task: {"state": "pending", "model_path": None, "seconds": None, "error": None}
+                for task in _TASKS
+            }
+            self._thread = threading.Thread(target=self._run, name="model-warmup", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        from app.services.yolo_service import YoloService
+        for task in _TASKS:
+            status = self.tasks[task]
+            status["state"] = "warming"
+            started = time.perf_counter()
+            try:
+                status["model_path"] = YoloService.preload_model(task)
+                status["state"] = "ready" if status["model_path"] else "skipped"
+            except Exception as e:
+                status["state"] = "failed"
+                status["error"] = str(e)
+                print(f"⚠️ {task} 模型预热失败: {e}")
+            status["seconds"] = round(time.perf_counter() - started, 3)
+
+        failed = [t for t in _REQUIRED_TASKS if self.tasks[t]["state"] != "ready"]
+        with self._lock:
+            self.state = "failed" if failed else "ready"
+            self.finished_at = datetime.now().isoformat()
+        if not failed:
+            print("✅ 模型预热完成，服务已就绪")
+
+    @property
+    def ready(self) -> bool:
+        return self.state == "ready"
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "status": self.state,
+            "ready": self.ready,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "models": {task: dict(status) for task, status in self.tasks.items()},
+        }
+
+
+_warmup_state = WarmupState()
+
+
+def get_warmup_state() -> WarmupState:
+    """获取全局预热状态"""
+    return _warmup_state
@@ -0,0 +1,313 @@
+"""
+多进程推理工作池
+预先启动N个工作进程，每个进程只加载一次模型；API进程解码后的图片通过共享内存传给工作进程（不经过pickle），
+工作进程返回紧凑的numpy数组结果（边界框、置信度、类别、多边形顶点）。
+工作进程开始处理任务时先通知主进程，进程意外退出时其正在处理的任务立即以异常结束（不必等到超时）
+"""
+import itertools
+import multiprocessing as mp
+import os
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from multiprocessing import shared_memory
+from typing import Any, Dict, List, Optional, Tuple
+import numpy as np
+from app.config import INFERENCE_PROCESS_WORKERS, INFERENCE_WORKER_THREADS, INFERENCE_WORKER_TIMEOUT
+
+
+def _worker_main(worker_index: int, task_queue, result_queue, num_threads: int):
+    """工作进程入口：循环读取任务，按需加载模型并执行推理"""
+    import torch
+    from ultralytics import YOLO
+    from app.services.yolo_service import YoloService
+
+    if num_threads > 0:
+        torch.set_num_threads(num_threads)
+
+    # 每种任务类型缓存一个模型，模型路径变化（激活了新模型）时才重新加载
+    models: Dict[str, Tuple[str, Any]] = {}
+
+    while True:
+        message = task_queue.get()
+        if message is None:
+            break
+
+        task_id, kind, model_path, conf, mask_format, shm_name, layout = message
+        # 通知主进程该任务由本进程处理（ok为None）
+        result_queue.put((task_id, None, worker_index))
+        try:
+            cached = models.get(kind)
+            if cached is None or cached[0] != model_path:
+                models[kind] = (model_path, YOLO(model_path, task=kind))
+            model = models[kind][1]
+
+            # 从共享内存复制出图片后立即释放，避免推理框架持有共享内存的引用
+            shm = shared_memory.SharedMemory(name=shm_name)
+            try:
+                images = [
+                    np.ndarray(shape, dtype=np.uint8, buffer=shm.buf, offset=offset).copy()
+                    for offset, shape in layout
+                ]
+            finally:
+                shm.close()
+
+            kwargs = {"batch": len(images), "verbose": False}
+            if conf is not None:
+                kwargs["conf"] = conf
+            results = model(images, **kwargs)
+
+            if kind == "segment":
+                items = [YoloService.extract_segmentation_arrays(r, mask_format) for r in results]
+            else:
+                items = [YoloService.extract_detection_arrays(r) for r in results]
+
+            result_queue.put((task_id, True, {"names": dict(model.names), "items": items}))
+        except Exception as e:
+            result_queue.put((task_id, False, f"{type(e).__name__}: {e}"))
+
+
+# 检查工作进程是否存活的间隔（秒）
+WORKER_CHECK_INTERVAL = 0.5
+
+
+class _PendingTask:
+    __slots__ = ("future", "shm", "submitted_at", "worker")
+
+    def __init__(self, shm: shared_memory.SharedMemory):
+        self.future: Future = Future()
+        self.shm = shm
+        self.submitted_at = time.perf_counter()
+        # 正在处理该任务的工作进程下标（还在队列中时为None）
+        self.worker: Optional[int] = None
+
+
+class InferenceWorkerPool:
+    """多进程推理工作池"""
+
+    def __init__(self, num_workers: int, threads_per_worker: int = 0, timeout: float = 120.0):
+        self.num_workers = max(1, int(num_workers))
+        if threads_per_worker <= 0:
+            threads_per_worker = max(1, (os.cpu_count() or 1) // self.num_workers)
+        self.threads_per_worker = threads_per_worker
+        self.timeout = timeout
+
+        self._ctx = mp.get_context("spawn")
+        self._task_queue = None
+        self._result_queue = None
+        self._workers: List[Optional[mp.process.BaseProcess]] = []
+        self._pending: Dict[int, _PendingTask] = {}
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self._dispatcher: Optional[threading.Thread] = None
+        self._running = False
+
+        self._completed = 0
+        self._failed = 0
+        self._restarts = 0
+
+    @property
+    def running(self) -> bool:
+        return self._running
+
+    def start(self):
+        """启动工作进程和结果分发线程"""
+        with self._lock:
+            if self._running:
+                return
+            self._task_queue = self._ctx.Queue()
+            self._result_queue = self._ctx.Queue()
+            self._workers = [self._spawn_worker(i) for i in range(self.num_workers)]
+            self._running = True
+            self._dispatcher = threading.Thread(target=self._dispatch_loop, name="worker-pool-dispatcher", daemon=True)
+            self._dispatcher.start()
+
+    def _spawn_worker(self, index: int):
+        process = self._ctx.Process(
+            target=_worker_main,
+            args=(index, self._task_queue, self._result_queue, self.threads_per_worker),
+            name=f"inference-worker-{index}",
+            daemon=True
+        )
+        process.start()
+        return process
+
+    def stop(self):
+        """停止所有工作进程，未完成的任务以异常结束"""
+        with self._lock:
+            if not self._running:
+                return
+            self._running = False
+            workers = list(self._workers)
+            pending = list(self._pending.items())
+            self._pending.clear()
+
+        for _ in workers:
+            self._task_queue.put(None)
+        for process in workers:
+            if process is not None:
+                process.join(timeout=5)
+                if process.is_alive():
+                    process.terminate()
+        for _, task in pending:
+            self._release_shm(task)
+            if not task.future.done():
+                task.future.set_exception(RuntimeError("推理工作池已停止"))
+
+    def submit(self, kind: str, images: List[np.ndarray], model_path: str,
+               conf: Optional[float] = None, mask_format: str = "polygon") -> Future:
+        """提交一批图片给工作进程（同一批在一个进程内一次前向推理完成）"""
+        if not self._running:
+            self.start()
+
+        images = [np.ascontiguousarray(image, dtype=np.uint8) for image in images]
+        layout = []
+        total = 0
+        for image in images:
+            layout.append((total, image.shape))
+            total += image.nbytes
+
+        shm = shared_memory.SharedMemory(create=True, size=max(1, total))
+        for (offset, shape), image in zip(layout, images):
+            np.ndarray(shape, dtype=np.uint8, buffer=shm.buf, offset=offset)[...] = image
+
+        task_id = next(self._ids)
+        task = _PendingTask(shm)
+        with self._lock:
+            self._pending[task_id] = task
+        self._task_queue.put((task_id, kind, model_path, conf, mask_format, shm.name, layout))
+        return task.future
+
+    def run(self, kind: str, images: List[np.ndarray], model_path: str,
+            conf: Optional[float] = None, mask_format: str = "polygon") -> Dict[str, Any]:
+        """提交并等待结果"""
+        return self.wait(self.submit(kind, images, model_path, conf, mask_format))
+
+    def warmup(self, kind: str, model_path: str, runs: int, imgsz: int):
+        """让每个工作进程加载模型并用合成图片预热（同时提交 num_workers*runs 个任务，尽量分散到所有进程）"""
+        if runs <= 0:
+            return
+        image = np.full((imgsz, imgsz, 3), 114, dtype=np.uint8)
+        futures = [self.submit(kind, [image], model_path) for _ in range(self.num_workers * runs)]
+        for future in futures:
+            self.wait(future)
+
+    def wait(self, future: Future) -> Dict[str, Any]:
+        """等待任务结果，超时则放弃该任务"""
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeoutError:
+            with self._lock:
+                for task_id, task in list(self._pending.items()):
+                    if task.future is future:
+                        del self._pending[task_id]
+                        self._release_shm(task)
+                        break
+            raise TimeoutError(f"推理工作进程超时（{self.timeout}s）")
+
+    @staticmethod
+    def _release_shm(task: _PendingTask):
+        try:
+            task.shm.close()
+            task.shm.unlink()
+        except FileNotFoundError:
+            pass
+
+    def _dispatch_loop(self):
+        """接收工作进程的结果并分发给等待的调用方，同时拉起意外退出的工作进程"""
+        last_check = time.monotonic()
+        while self._running:
+            # 结果持续到达时也定期检查工作进程
+            if time.monotonic() - last_check >= WORKER_CHECK_INTERVAL:
+                self._check_workers()
+                last_check = time.monotonic()
+            try:
+                task_id, ok, payload = self._result_queue.get(timeout=WORKER_CHECK_INTERVAL)
+            except Exception:
+                continue
+
+            if ok is None:
+                with self._lock:
+                    task = self._pending.get(task_id)
+                    if task is not None:
+                        task.worker = payload
+                continue
+
+            with self._lock:
+                task = self._pending.pop(task_id, None)
+                if ok:
+                    self._completed += 1
+                else:
+                    self._failed += 1
+            if task is None:
+                continue
+            self._release_shm(task)
+            if ok:
+                task.future.set_result(payload)
+            else:
+                task.future.set_exception(RuntimeError(payload))
+
+    def _check_workers(self):
+        """拉起意外退出的工作进程，它正在处理的任务立即失败（可能正是该任务导致进程崩溃，不重新提交）"""
+        lost = []
+        with self._lock:
+            if not self._running:
+                return
+            for i, process in enumerate(self._workers):
+                if process is not None and not process.is_alive():
+                    exitcode = process.exitcode
+                    for task_id, task in list(self._pending.items()):
+                        if task.worker == i:
+                            del self._pending[task_id]
+                            lost.append((task, exitcode))
+                            self._failed += 1
+                    self._workers[i] = self._spawn_worker(i)
+                    self._restarts += 1
+        for task, exitcode in lost:
+            self._release_shm(task)
+            if not task.future.done():
+                task.future.set_exception(RuntimeError(f"推理工作进程意外退出（exitcode={exitcode}）"))
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取工作池状态"""
+        with self._lock:
+            return {
+                "enabled": True,
+                "running": self._running,
+                "num_workers": self.num_workers,
+                "alive_workers": sum(1 for p in self._workers if p is not None and p.is_alive()),
+                "threads_per_worker": self.threads_per_worker,
+                "pending_tasks": len(self._pending),
+                "completed": self._completed,
+                "failed": self._failed,
+                "restarts": self._restarts,
+            }
+
+
+_pool: Optional[InferenceWorkerPool] = None
+_pool_lock = threading.Lock()
+
+
+def worker_pool_enabled() -> bool:
+    """是否启用多进程推理模式"""
+    return INFERENCE_PROCESS_WORKERS > 0
+
+
+def get_worker_pool() -> InferenceWorkerPool:
+    """获取全局推理工作池（单例）"""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = InferenceWorkerPool(
+                    num_workers=INFERENCE_PROCESS_WORKERS,
+                    threads_per_worker=INFERENCE_WORKER_THREADS,
+                    timeout=INFERENCE_WORKER_TIMEOUT,
+                )
+    return _pool
+
+
+def shutdown_worker_pool():
+    """关闭全局推理工作池"""
+    if _pool is not None:
+        _pool.stop()
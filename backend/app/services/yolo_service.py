@@ -1,180 +1,934 @@
-from ultralytics import YOLO
 from pathlib import Path
+import base64
+import json
 import numpy as np
 import cv2
-from app.config import YOLO_MODEL_PATH, YOLO_SEG_MODEL_PATH, MODEL_DIR
-from app.models.schemas import DetectionResult, BoundingBox, SegmentResult, SegmentMask, PolygonPoint
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from app.config import (
+    YOLO_MODEL_PATH, YOLO_SEG_MODEL_PATH, MODEL_DIR,
+    INFERENCE_BATCH_ENABLED, INFERENCE_BATCH_MAX_SIZE, INFERENCE_BATCH_WINDOW_MS,
+    INFERENCE_BACKEND, RESULT_CACHE_ENABLED, RESULT_CACHE_MAX_ENTRIES, RESULT_CACHE_MAX_MB,
+    RESULT_CACHE_DISK_ENABLED, RESULT_CACHE_DIR, MODEL_WARMUP_IMGSZ,
+    TILE_SIZE, TILE_OVERLAP, TILE_NMS_THRESHOLD, TILE_BATCH_SIZE, TILE_INCLUDE_FULL_IMAGE,
+    POLYGON_WORKERS, POLYGON_PARALLEL_MIN_MASKS
+)
+from pydantic import TypeAdapter
+from app.models.schemas import DetectionResult, BoundingBox, SegmentResult, SegmentMask
+from app.services.batching_service import MicroBatcher
+from app.services.brush_rle import roi_mask_to_rle
+from app.services.worker_pool import get_worker_pool, worker_pool_enabled
+from app.services.inference_backend import resolve_backend_model_path
+from app.services.result_cache import ResultCache, make_cache_key
+from app.services.image_input import (
+    ImageSource, InMemoryImage, to_memory_image, source_hash, model_input, read_image
+)
+from app.services.model_registry import ModelRegistry, get_model_registry
+from app.services.tiling import make_tiles, merge_tile_arrays
+from app.services.metrics import span, BATCH_SIZE
 from datetime import datetime
-from typing import List, Optional
+from typing import List, NamedTuple, Optional, Dict, Any, Union
+
+
+class ArrayResult(NamedTuple):
+    """还没有构建成pydantic模型的推理结果（紧凑数组 + 类别名）
+
+    compact/msgpack响应直接由数组编码成列，不需要先构建再拆开pydantic模型；build() 得到普通结果
+    """
+    kind: str  # detect / segment
+    image_path: str
+    arrays: Dict[str, np.ndarray]
+    names: Dict[int, str]
+
+    def build(self) -> Union[DetectionResult, SegmentResult]:
+        if self.kind == "segment":
+            return YoloService.build_segment_result(self.image_path, self.arrays, self.names)
+        return YoloService.build_detection_result(self.image_path, self.arrays, self.names)
+
+
+def _worker_item_result(kind: str, image_path: ImageSource, item: Dict[str, Any]) -> ArrayResult:
+    """工作进程返回的结果（数组 + names）转为ArrayResult"""
+    arrays = {key: value for key, value in item.items() if key != "names"}
+    return ArrayResult(kind, str(image_path), arrays, item["names"])
+
+
+def _decode_each(decode, image_paths: List[ImageSource]):
+    """逐张解码图片，返回 (解码成功的输入, 它们的下标, 结果列表)；解码失败的图片在结果列表中对应位置放异常，
+    合并成一批的其他请求不受影响"""
+    inputs, indices = [], []
+    results: List[Any] = [None] * len(image_paths)
+    for i, image_path in enumerate(image_paths):
+        try:
+            inputs.append(decode(image_path))
+            indices.append(i)
+        except Exception as e:
+            results[i] = e
+    return inputs, indices, results
+
+
+def _raise_failed(results: List[Any]):
+    """结果中有解码失败的图片时抛出其异常（不经过微批处理器的调用一次返回所有结果）"""
+    for result in results:
+        if isinstance(result, BaseException):
+            raise result
+
+
+def _dump_array_result(result: ArrayResult) -> str:
+    """ArrayResult序列化为缓存值：各数组保存dtype、形状和base64编码的原始字节"""
+    return json.dumps({
+        "names": {str(k): v for k, v in result.names.items()},
+        "arrays": {
+            key: [value.dtype.str, list(value.shape), base64.b64encode(np.ascontiguousarray(value).tobytes()).decode("ascii")]
+            for key, value in result.arrays.items()
+        },
+    }, ensure_ascii=False)
+
+
+def _load_array_result(kind: str, image_path: str, value: str) -> Optional[ArrayResult]:
+    """解析缓存值，格式不对（例如旧版本保存的pydantic结果）时返回None，按未命中处理"""
+    try:
+        data = json.loads(value)
+        arrays = {
+            key: np.frombuffer(base64.b64decode(raw), dtype=np.dtype(dtype)).reshape(shape).copy()
+            for key, (dtype, shape, raw) in data["arrays"].items()
+        }
+        names = {int(k): v for k, v in data["names"].items()}
+    except (ValueError, KeyError, TypeError):
+        return None
+    return ArrayResult(kind, image_path, arrays, names)
+
 
 class YoloService:
-    _model: Optional[YOLO] = None
-    _seg_model: Optional[YOLO] = None
+    _registry_ready = False
+    _detect_batcher: Optional[MicroBatcher] = None
+    _segment_batcher: Optional[MicroBatcher] = None
+    _result_cache: Optional[ResultCache] = None
+    _batcher_lock = threading.Lock()
+    
+    @staticmethod
+    def resolve_model_path() -> str:
+        """解析检测模型路径：激活的检测模型 > 自定义模型 > 预训练模型"""
+        try:
+            from app.services.model_service import ModelService
+            active_model = ModelService().get_active_model()
+            if active_model and active_model.model_type == "detection":
+                if Path(active_model.file_path).exists():
+                    return active_model.file_path
+        except Exception:
+            pass
+        
+        custom_model = MODEL_DIR / "best.pt"
+        if custom_model.exists():
+            return str(custom_model)
+        return YOLO_MODEL_PATH
+    
+    @staticmethod
+    def resolve_segmentation_model_path() -> Optional[str]:
+        """解析分割模型路径，激活的分割模型文件不存在时返回None"""
+        try:
+            # 先尝试从激活的模型中找到分割模型
+            from app.services.model_service import ModelService
+            model_service = ModelService()
+            active_model = model_service.get_active_model()
+            
+            if active_model and active_model.model_type == "segmentation":
+                seg_model_path = Path(active_model.file_path)
+                if seg_model_path.exists():
+                    return str(seg_model_path)
+                return None
+            
+            # 尝试加载自定义分割模型
+            custom_seg_model = MODEL_DIR / "best-seg.pt"
+            if custom_seg_model.exists():
+                return str(custom_seg_model)
+        except Exception:
+            pass
+        # 使用预训练的分割模型
+        return YOLO_SEG_MODEL_PATH
     
     @classmethod
-    def get_model(cls):
-        """单例模式获取检测模型"""
-        if cls._model is None:
-            # 尝试加载自定义模型，如果没有则使用预训练模型
-            custom_model = MODEL_DIR / "best.pt"
-            if custom_model.exists():
-                cls._model = YOLO(str(custom_model))
-            else:
-                cls._model = YOLO(YOLO_MODEL_PATH)
-        return cls._model
-    
-    @classmethod
-    def get_segmentation_model(cls):
-        """单例模式获取分割模型"""
-        if cls._seg_model is None:
-            try:
-                # 先尝试从激活的模型中找到分割模型
-                from app.services.model_service import ModelService
-                model_service = ModelService()
-                active_model = model_service.get_active_model()
-                
-                if active_model and active_model.model_type == "segmentation":
-                    seg_model_path = Path(active_model.file_path)
-                    if seg_model_path.exists():
-                        cls._seg_model = YOLO(str(seg_model_path))
-                    else:
-                        cls._seg_model = None
-                else:
-                    # 尝试加载自定义分割模型
-                    custom_seg_model = MODEL_DIR / "best-seg.pt"
-                    if custom_seg_model.exists():
-                        cls._seg_model = YOLO(str(custom_seg_model))
+    def _get_registry(cls) -> ModelRegistry:
+        """获取模型注册表，模型切换后自动清空结果缓存"""
+        if not cls._registry_ready:
+            with cls._batcher_lock:
+                if not cls._registry_ready:
+                    get_model_registry().add_swap_listener(lambda task, path: cls.invalidate_cache())
+                    cls._registry_ready = True
+        return get_model_registry()
+    
+    @staticmethod
+    def _pinned_model_path(model_id: str, task: str) -> str:
+        """请求固定使用的模型（用于A/B对比），校验模型存在且类型匹配"""
+        from app.services.model_service import ModelService
+        model = ModelService().get_model(model_id)
+        if not model:
+            raise ValueError(f"模型 {model_id} 不存在")
+        expected = "segmentation" if task == "segment" else "detection"
+        if model.model_type != expected:
+            raise ValueError(f"模型 {model_id} 不是{'分割' if task == 'segment' else '检测'}模型")
+        if not Path(model.file_path).exists():
+            raise FileNotFoundError(f"模型文件不存在: {model.file_path}")
+        return model.file_path
+    
+    @classmethod
+    def current_model_path(cls, task: str, model_id: Optional[str] = None) -> Optional[str]:
+        """本次推理使用的模型路径：固定的model_id，否则为当前激活的模型"""
+        if model_id:
+            return cls._pinned_model_path(model_id, task)
+        resolve = cls.resolve_segmentation_model_path if task == "segment" else cls.resolve_model_path
+        return cls._get_registry().current_path(task, resolve)
+    
+    @classmethod
+    def get_model(cls, model_id: Optional[str] = None):
+        """获取检测模型（默认为当前激活的模型，已加载的模型由注册表复用）"""
+        return cls._get_registry().get("detect", cls.current_model_path("detect", model_id))
+    
+    @classmethod
+    def get_segmentation_model(cls, model_id: Optional[str] = None):
+        """获取分割模型（默认为当前激活的模型，已加载的模型由注册表复用）"""
+        seg_model_path = cls.current_model_path("segment", model_id)
+        if seg_model_path is None:
+            return None
+        return cls._load_segmentation_model(seg_model_path)
+    
+    @classmethod
+    def _load_segmentation_model(cls, model_path: str):
+        try:
+            return cls._get_registry().get("segment", model_path)
+        except Exception:
+            if model_path == YOLO_SEG_MODEL_PATH:
+                raise
+            # 如果出错，使用预训练模型
+            return cls._get_registry().get("segment", YOLO_SEG_MODEL_PATH)
+    
+    @classmethod
+    def activate_models(cls) -> Dict[str, Any]:
+        """模型激活状态变化后，在后台加载并预热新的检测/分割模型，完成后原子切换"""
+        registry = cls._get_registry()
+        return {
+            "detect": registry.activate_in_background("detect", cls.resolve_model_path()),
+            "segment": registry.activate_in_background("segment", cls.resolve_segmentation_model_path()),
+        }
+    
+    @classmethod
+    def preload_model(cls, task: str) -> Optional[str]:
+        """同步加载并预热当前的检测/分割模型（服务启动时调用），返回模型路径"""
+        resolve = cls.resolve_segmentation_model_path if task == "segment" else cls.resolve_model_path
+        model_path = resolve()
+        if model_path is None:
+            return None
+        registry = cls._get_registry()
+        registry.activate(task, model_path)
+        if worker_pool_enabled():
+            # 多进程模式下模型在工作进程中加载，逐个进程预热
+            get_worker_pool().warmup(
+                task, resolve_backend_model_path(model_path, task=task),
+                runs=max(1, registry.warmup_runs), imgsz=MODEL_WARMUP_IMGSZ
+            )
+        return model_path
+    
+    @classmethod
+    def get_registry_status(cls) -> Dict[str, Any]:
+        """获取模型注册表状态"""
+        return cls._get_registry().get_status()
+    
+    @classmethod
+    def _get_detect_batcher(cls) -> MicroBatcher:
+        """获取检测微批处理器（懒加载）"""
+        if cls._detect_batcher is None:
+            with cls._batcher_lock:
+                if cls._detect_batcher is None:
+                    cls._detect_batcher = MicroBatcher(
+                        "detect",
+                        lambda model_path, paths: cls._run_detect(paths, model_path),
+                        max_batch_size=INFERENCE_BATCH_MAX_SIZE,
+                        max_wait_ms=INFERENCE_BATCH_WINDOW_MS,
+                    )
+        return cls._detect_batcher
+    
+    @classmethod
+    def _get_segment_batcher(cls) -> MicroBatcher:
+        """获取分割微批处理器（懒加载），按模型、置信度阈值和mask格式分组合并"""
+        if cls._segment_batcher is None:
+            with cls._batcher_lock:
+                if cls._segment_batcher is None:
+                    cls._segment_batcher = MicroBatcher(
+                        "segment",
+                        lambda key, paths: cls._run_segment(
+                            paths, key[0], conf_threshold=key[1], mask_format=key[2]
+                        ),
+                        max_batch_size=INFERENCE_BATCH_MAX_SIZE,
+                        max_wait_ms=INFERENCE_BATCH_WINDOW_MS,
+                    )
+        return cls._segment_batcher
+    
+    @classmethod
+    def get_batch_stats(cls) -> Dict[str, Any]:
+        """获取微批处理统计信息"""
+        return {
+            "enabled": INFERENCE_BATCH_ENABLED,
+            "detect": cls._detect_batcher.get_stats() if cls._detect_batcher else None,
+            "segment": cls._segment_batcher.get_stats() if cls._segment_batcher else None,
+        }
+    
+    @staticmethod
+    def _check_image_paths(image_paths: List[ImageSource]) -> List[ImageSource]:
+        """检查图片文件是否存在（内存中的图片直接通过）"""
+        checked = []
+        for image_path in image_paths:
+            if isinstance(image_path, InMemoryImage):
+                checked.append(image_path)
+                continue
+            image_path_obj = Path(image_path)
+            if not image_path_obj.exists():
+                raise FileNotFoundError(f"图片文件不存在: {image_path}")
+            checked.append(str(image_path_obj))
+        return checked
+    
+    # ---- 结果缓存 ----
+    
+    @classmethod
+    def _get_result_cache(cls) -> Optional[ResultCache]:
+        """获取结果缓存（懒加载），未启用时返回None"""
+        if not RESULT_CACHE_ENABLED:
+            return None
+        if cls._result_cache is None:
+            with cls._batcher_lock:
+                if cls._result_cache is None:
+                    cls._result_cache = ResultCache(
+                        max_entries=RESULT_CACHE_MAX_ENTRIES,
+                        max_bytes=RESULT_CACHE_MAX_MB * 1024 * 1024,
+                        disk_dir=RESULT_CACHE_DIR if RESULT_CACHE_DISK_ENABLED else None,
+                    )
+        return cls._result_cache
+    
+    @classmethod
+    def invalidate_cache(cls):
+        """清空结果缓存（切换模型时调用）"""
+        cache = cls._get_result_cache()
+        if cache is not None:
+            cache.clear()
+    
+    @classmethod
+    def get_cache_stats(cls) -> Dict[str, Any]:
+        """获取结果缓存命中统计"""
+        cache = cls._get_result_cache()
+        if cache is None:
+            return {"enabled": False}
+        return {"enabled": True, **cache.get_stats()}
+    
+    @staticmethod
+    def _model_cache_key(model_path: Optional[str]) -> str:
+        """模型在缓存键中的标识：模型路径 + 文件大小/修改时间 + 推理后端"""
+        if model_path is None:
+            return "none"
+        path = Path(model_path)
+        if path.exists():
+            stat = path.stat()
+            return f"{path.resolve()}:{stat.st_size}:{stat.st_mtime}:{INFERENCE_BACKEND}"
+        return f"{model_path}:{INFERENCE_BACKEND}"
+    
+    @classmethod
+    def _with_cache(cls, kind: str, image_paths: List[ImageSource], params: Dict[str, Any],
+                    model_path: Optional[str], compute, raw: bool = False) -> List[Any]:
+        """先查缓存，只对未命中的图片调用 compute(paths) 推理（返回ArrayResult），并写回缓存
+
+        缓存中保存的是数组；raw为True时直接返回ArrayResult，否则构建为pydantic结果
+        """
+        cache = cls._get_result_cache()
+        if cache is None:
+            results = compute(image_paths)
+            _raise_failed(results)
+        else:
+            model_key = cls._model_cache_key(model_path)
+            results = [None] * len(image_paths)
+            missing = []
+            with span("yolo.cache_lookup"):
+                keys = [make_cache_key(kind, source_hash(p), model_key, params) for p in image_paths]
+                for i, key in enumerate(keys):
+                    cached = cache.get(key)
+                    result = _load_array_result(kind, str(image_paths[i]), cached) if cached is not None else None
+                    if result is not None:
+                        results[i] = result
                     else:
-                        # 使用预训练的分割模型
-                        cls._seg_model = YOLO(YOLO_SEG_MODEL_PATH)
-            except Exception as e:
-                # 如果出错，使用预训练模型
-                cls._seg_model = YOLO(YOLO_SEG_MODEL_PATH)
-        
-        return cls._seg_model
+                        missing.append(i)
+            
+            if missing:
+                computed = compute([image_paths[i] for i in missing])
+                _raise_failed(computed)
+                for i, result in zip(missing, computed):
+                    results[i] = result
+                    cache.put(keys[i], _dump_array_result(result))
+        if raw:
+            return results
+        with span("yolo.build"):
+            return [result.build() for result in results]
+    
+    # ---- 检测 ----
     
     @classmethod
-    def detect(cls, image_path: str) -> DetectionResult:
-        """检测图片中的瑕疵"""
-        model = cls.get_model()
-        image_path_obj = Path(image_path)
+    def detect(cls, image_path: ImageSource, model_id: Optional[str] = None, tiled: bool = False,
+               raw: bool = False) -> Union[DetectionResult, ArrayResult]:
+        """检测图片中的瑕疵，model_id为空时使用当前激活的模型，tiled为True时切片推理
+        
+        raw为True时返回ArrayResult（不构建pydantic模型，供紧凑格式的响应使用）
+        """
+        image_path = cls._check_image_paths([image_path])[0]
+        model_path = cls.current_model_path("detect", model_id)
+        if tiled:
+            return cls._with_cache(
+                "detect", [image_path], cls._tile_params(), model_path,
+                lambda paths: [cls._run_detect_tiled(paths[0], model_path)], raw
+            )[0]
         
-        if not image_path_obj.exists():
-            raise FileNotFoundError(f"图片文件不存在: {image_path}")
+        def _compute(paths: List[str]) -> List[ArrayResult]:
+            if INFERENCE_BATCH_ENABLED:
+                return [cls._get_detect_batcher().submit(paths[0], key=model_path)]
+            return cls._run_detect(paths, model_path)
         
+        return cls._with_cache("detect", [image_path], {}, model_path, _compute, raw)[0]
+    
+    @classmethod
+    def detect_batch(cls, image_paths: List[ImageSource], model_id: Optional[str] = None,
+                     tiled: bool = False, raw: bool = False) -> List[Union[DetectionResult, ArrayResult]]:
+        """批量检测图片中的瑕疵（一次前向推理），结果顺序与输入一致"""
+        image_paths = cls._check_image_paths(image_paths)
+        if not image_paths:
+            return []
+        model_path = cls.current_model_path("detect", model_id)
+        if tiled:
+            # 每张图片的切片已经组成一批，逐张推理
+            return cls._with_cache(
+                "detect", image_paths, cls._tile_params(), model_path,
+                lambda paths: [cls._run_detect_tiled(p, model_path) for p in paths], raw
+            )
+        return cls._with_cache(
+            "detect", image_paths, {}, model_path,
+            lambda paths: cls._run_detect(paths, model_path), raw
+        )
+    
+    @classmethod
+    def _run_detect(cls, image_paths: List[ImageSource], model_path: str) -> List[Any]:
+        """执行检测推理（不经过缓存），返回数组结果；无法解码的图片在对应位置返回异常，只推理解码成功的图片"""
+        if worker_pool_enabled():
+            return cls._detect_batch_in_workers(image_paths, model_path)
+        
+        model = cls._get_registry().get("detect", model_path)
+        with span("yolo.decode"):
+            inputs, indices, results = _decode_each(model_input, image_paths)
+        if not inputs:
+            return results
+        BATCH_SIZE.observe(len(inputs), kind="detect")
         # 运行检测
-        results = model(str(image_path_obj))
-        
-        # 解析结果
-        defects = []
-        for result in results:
-            boxes = result.boxes
-            if boxes is not None and len(boxes) > 0:
-                for box in boxes:
-                    # 获取边界框坐标
-                    x1, y1, x2, y2 = box.xyxy[0].tolist()
-                    confidence = float(box.conf[0])
-                    class_id = int(box.cls[0])
-                    
-                    # 获取类别名称
-                    class_name = model.names.get(class_id, f"class_{class_id}")
-                    
-                    defects.append(BoundingBox(
-                        x1=x1,
-                        y1=y1,
-                        x2=x2,
-                        y2=y2,
-                        confidence=confidence,
-                        class_name=class_name
-                    ))
+        with span("yolo.inference"):
+            outputs = model(inputs, batch=len(inputs), verbose=False)
         
-        return DetectionResult(
-            image_path=str(image_path),
-            defects=defects,
-            timestamp=datetime.now()
+        names = dict(model.names)
+        with span("yolo.extract"):
+            for i, output in zip(indices, outputs):
+                results[i] = ArrayResult("detect", str(image_paths[i]), cls.extract_detection_arrays(output), names)
+        return results
+    
+    # ---- 分割 ----
+    
+    @classmethod
+    def segment(cls, image_path: ImageSource, conf_threshold: float = 0.25,
+                model_id: Optional[str] = None, tiled: bool = False,
+                mask_format: str = "polygon", raw: bool = False) -> Union[SegmentResult, ArrayResult]:
+        """分割图片中的瑕疵，model_id为空时使用当前激活的模型，tiled为True时切片推理
+        
+        mask_format为rle时不提取轮廓，直接输出LabelStudio画笔RLE（不支持切片推理）；
+        raw为True时返回ArrayResult
+        """
+        image_path = cls._check_image_paths([image_path])[0]
+        model_path = cls._segment_model_path(model_id)
+        params = _segment_params(conf_threshold, mask_format, tiled)
+        if tiled:
+            return cls._with_cache(
+                "segment", [image_path], {**params, **cls._tile_params()}, model_path,
+                lambda paths: [cls._run_segment_tiled(paths[0], model_path, conf_threshold)], raw
+            )[0]
+        
+        def _compute(paths: List[str]) -> List[ArrayResult]:
+            if INFERENCE_BATCH_ENABLED:
+                return [cls._get_segment_batcher().submit(
+                    paths[0], key=(model_path, conf_threshold, mask_format)
+                )]
+            return cls._run_segment(paths, model_path, conf_threshold=conf_threshold, mask_format=mask_format)
+        
+        return cls._with_cache("segment", [image_path], params, model_path, _compute, raw)[0]
+    
+    @classmethod
+    def segment_batch(cls, image_paths: List[ImageSource], conf_threshold: float = 0.25,
+                      model_id: Optional[str] = None, tiled: bool = False,
+                      mask_format: str = "polygon", raw: bool = False) -> List[Union[SegmentResult, ArrayResult]]:
+        """批量分割图片中的瑕疵（一次前向推理），结果顺序与输入一致"""
+        image_paths = cls._check_image_paths(image_paths)
+        if not image_paths:
+            return []
+        model_path = cls._segment_model_path(model_id)
+        params = _segment_params(conf_threshold, mask_format, tiled)
+        if tiled:
+            return cls._with_cache(
+                "segment", image_paths, {**params, **cls._tile_params()}, model_path,
+                lambda paths: [cls._run_segment_tiled(p, model_path, conf_threshold) for p in paths], raw
+            )
+        return cls._with_cache(
+            "segment", image_paths, params, model_path,
+            lambda paths: cls._run_segment(paths, model_path, conf_threshold=conf_threshold, mask_format=mask_format),
+            raw
         )
     
     @classmethod
-    def segment(cls, image_path: str, conf_threshold: float = 0.25) -> SegmentResult:
-        """分割图片中的瑕疵"""
-        model = cls.get_segmentation_model()
-        if model is None:
+    def _segment_model_path(cls, model_id: Optional[str] = None) -> str:
+        model_path = cls.current_model_path("segment", model_id)
+        if model_path is None:
             raise ValueError("分割模型未加载，请确保有可用的分割模型")
+        return model_path
+    
+    @classmethod
+    def _run_segment(cls, image_paths: List[ImageSource], model_path: str,
+                     conf_threshold: float = 0.25, mask_format: str = "polygon") -> List[Any]:
+        """执行分割推理（不经过缓存），返回数组结果；无法解码的图片在对应位置返回异常"""
+        if worker_pool_enabled():
+            return cls._segment_batch_in_workers(image_paths, model_path, conf_threshold, mask_format)
         
-        image_path_obj = Path(image_path)
-        if not image_path_obj.exists():
-            raise FileNotFoundError(f"图片文件不存在: {image_path}")
+        model = cls._load_segmentation_model(model_path)
         
+        with span("yolo.decode"):
+            inputs, indices, results = _decode_each(model_input, image_paths)
+        if not inputs:
+            return results
+        BATCH_SIZE.observe(len(inputs), kind="segment")
         # 运行分割
-        results = model(str(image_path_obj), conf=conf_threshold)
-        
-        # 解析结果
-        masks = []
-        for result in results:
-            if result.masks is not None:
-                boxes = result.boxes
-                seg_masks = result.masks
-                
-                for idx, mask in enumerate(seg_masks):
-                    if boxes is not None and idx < len(boxes):
-                        box = boxes[idx]
-                        # 获取边界框坐标
-                        x1, y1, x2, y2 = box.xyxy[0].tolist()
-                        confidence = float(box.conf[0])
-                        class_id = int(box.cls[0])
-                        class_name = model.names.get(class_id, f"class_{class_id}")
-                    else:
-                        # 如果没有box信息，从mask计算
-                        mask_data = mask.data[0].cpu().numpy()
-                        y_coords, x_coords = np.where(mask_data > 0)
-                        if len(x_coords) > 0 and len(y_coords) > 0:
-                            x1, x2 = float(x_coords.min()), float(x_coords.max())
-                            y1, y2 = float(y_coords.min()), float(y_coords.max())
-                        else:
-                            continue
-                        confidence = 0.5
-                        class_id = 0
-                        class_name = model.names.get(class_id, "object")
-                    
-                    # 将mask转换为多边形
-                    mask_data = mask.data[0].cpu().numpy().astype(np.uint8) * 255
-                    
-                    # 使用OpenCV找到轮廓
-                    contours, _ = cv2.findContours(mask_data, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-                    
-                    if len(contours) > 0:
-                        # 取最大的轮廓
-                        largest_contour = max(contours, key=cv2.contourArea)
-                        # 简化轮廓（减少点数）
-                        epsilon = 0.002 * cv2.arcLength(largest_contour, True)
-                        approx = cv2.approxPolyDP(largest_contour, epsilon, True)
-                        
-                        # 转换为点列表
-                        polygon_points = []
-                        for point in approx:
-                            polygon_points.append(PolygonPoint(
-                                x=float(point[0][0]),
-                                y=float(point[0][1])
-                            ))
-                        
-                        if len(polygon_points) >= 3:  # 至少3个点才能形成多边形
-                            masks.append(SegmentMask(
-                                polygon=polygon_points,
-                                bbox=BoundingBox(
-                                    x1=x1,
-                                    y1=y1,
-                                    x2=x2,
-                                    y2=y2,
-                                    confidence=confidence,
-                                    class_name=class_name
-                                ),
-                                confidence=confidence,
-                                class_name=class_name
-                            ))
+        with span("yolo.inference"):
+            outputs = model(inputs, conf=conf_threshold, batch=len(inputs), verbose=False)
+        
+        names = dict(model.names)
+        with span("yolo.rle" if mask_format == "rle" else "yolo.polygons"):
+            for i, output in zip(indices, outputs):
+                results[i] = ArrayResult(
+                    "segment", str(image_paths[i]), cls.extract_segmentation_arrays(output, mask_format), names
+                )
+        return results
+    
+    # ---- 内存图片 ----
+    
+    @classmethod
+    def detect_image(cls, image: Union[bytes, np.ndarray], name: str = "memory",
+                     model_id: Optional[str] = None, tiled: bool = False,
+                     raw: bool = False) -> Union[DetectionResult, ArrayResult]:
+        """直接检测内存中的图片（字节或BGR数组），不经过磁盘；字节在调用线程中解码"""
+        return cls.detect(to_memory_image(image, name), model_id=model_id, tiled=tiled, raw=raw)
+    
+    @classmethod
+    def segment_image(cls, image: Union[bytes, np.ndarray], name: str = "memory",
+                      conf_threshold: float = 0.25, model_id: Optional[str] = None,
+                      tiled: bool = False, raw: bool = False) -> Union[SegmentResult, ArrayResult]:
+        """直接分割内存中的图片（字节或BGR数组），不经过磁盘；字节在调用线程中解码"""
+        return cls.segment(to_memory_image(image, name), conf_threshold=conf_threshold,
+                           model_id=model_id, tiled=tiled, raw=raw)
+    
+    # ---- 切片推理 ----
+    
+    @staticmethod
+    def _tile_params() -> Dict[str, Any]:
+        """切片参数（作为结果缓存键的一部分）"""
+        return {
+            "tiled": True,
+            "tile_size": TILE_SIZE,
+            "tile_overlap": TILE_OVERLAP,
+            "tile_nms": TILE_NMS_THRESHOLD,
+            "tile_full": TILE_INCLUDE_FULL_IMAGE,
+        }
+    
+    @classmethod
+    def _run_detect_tiled(cls, image_path: ImageSource, model_path: str) -> ArrayResult:
+        """切片检测：各切片结果平移回原图坐标后NMS合并"""
+        arrays, names = cls._run_tiled("detect", image_path, model_path)
+        return ArrayResult("detect", str(image_path), arrays, names)
+    
+    @classmethod
+    def _run_segment_tiled(cls, image_path: ImageSource, model_path: str, conf_threshold: float) -> ArrayResult:
+        """切片分割：多边形先换算到切片坐标，再平移回原图坐标合并"""
+        arrays, names = cls._run_tiled("segment", image_path, model_path, conf_threshold)
+        return ArrayResult("segment", str(image_path), arrays, names)
+    
+    @classmethod
+    def _run_tiled(cls, kind: str, image_path: ImageSource, model_path: str,
+                   conf: Optional[float] = None):
+        """把图片切成重叠的切片，作为一批推理（多进程模式下分发到多个工作进程并行），返回 (合并后的数组, 类别名)"""
+        image = cls._read_images([image_path])[0]
+        height, width = image.shape[:2]
+        tiles = make_tiles(width, height, TILE_SIZE, TILE_OVERLAP)
+        crops = [image[y1:y2, x1:x2] for x1, y1, x2, y2 in tiles.tolist()]
+        regions = tiles
+        if TILE_INCLUDE_FULL_IMAGE and len(tiles) > 1:
+            crops.append(image)
+            regions = np.vstack([regions, np.array([[0, 0, width, height]], dtype=np.int32)])
+        
+        if worker_pool_enabled():
+            items = cls._run_images_in_workers(
+                kind, crops, resolve_backend_model_path(model_path, task=kind), conf
+            )
+            names = items[0]["names"]
+        else:
+            if kind == "segment":
+                model = cls._load_segmentation_model(model_path)
+            else:
+                model = cls._get_registry().get("detect", model_path)
+            extract = cls.extract_segmentation_arrays if kind == "segment" else cls.extract_detection_arrays
+            kwargs = {"verbose": False}
+            if conf is not None:
+                kwargs["conf"] = conf
+            items = []
+            batch_size = max(1, TILE_BATCH_SIZE)
+            for start in range(0, len(crops), batch_size):
+                batch = crops[start:start + batch_size]
+                BATCH_SIZE.observe(len(batch), kind=kind)
+                with span("yolo.inference"):
+                    results = model(batch, batch=len(batch), **kwargs)
+                with span("yolo.polygons" if kind == "segment" else "yolo.extract"):
+                    items.extend(extract(r) for r in results)
+            names = dict(model.names)
         
+        with span("yolo.tile_merge"):
+            merged = merge_tile_arrays(items, regions, TILE_NMS_THRESHOLD)
+        merged["orig_shape"] = np.array([height, width], dtype=np.int32)
+        return merged, names
+    
+    # ---- 多进程工作池模式 ----
+    
+    @staticmethod
+    def _read_images(image_paths: List[ImageSource]) -> List[np.ndarray]:
+        """在API进程中解码图片（BGR），再通过共享内存交给工作进程"""
+        with span("yolo.decode"):
+            return [read_image(image_path) for image_path in image_paths]
+    
+    @classmethod
+    def _run_in_workers(cls, kind: str, image_paths: List[ImageSource], model_path: str,
+                        conf: Optional[float] = None, mask_format: str = "polygon") -> List[Any]:
+        """把图片分成若干块分发给工作进程，每块在一个进程内批量推理；无法解码的图片在对应位置返回异常"""
+        with span("yolo.decode"):
+            images, indices, items = _decode_each(read_image, image_paths)
+        if images:
+            for i, item in zip(indices, cls._run_images_in_workers(kind, images, model_path, conf, mask_format)):
+                items[i] = item
+        return items
+    
+    @classmethod
+    def _run_images_in_workers(cls, kind: str, images: List[np.ndarray], model_path: str,
+                               conf: Optional[float] = None, mask_format: str = "polygon") -> List[Dict[str, Any]]:
+        """把已解码的图片分块交给工作进程推理"""
+        pool = get_worker_pool()
+        num_chunks = min(len(images), pool.num_workers)
+        chunks = [list(range(i, len(images), num_chunks)) for i in range(num_chunks)]
+        for chunk in chunks:
+            BATCH_SIZE.observe(len(chunk), kind=kind)
+        # 工作进程中的推理和结果提取都计入inference阶段
+        with span("yolo.inference"):
+            futures = [
+                pool.submit(kind, [images[i] for i in chunk], model_path, conf, mask_format)
+                for chunk in chunks
+            ]
+            
+            items: List[Optional[Dict[str, Any]]] = [None] * len(images)
+            for chunk, future in zip(chunks, futures):
+                payload = pool.wait(future)
+                for i, item in zip(chunk, payload["items"]):
+                    item["names"] = payload["names"]
+                    items[i] = item
+        return items
+    
+    @classmethod
+    def _detect_batch_in_workers(cls, image_paths: List[ImageSource], model_path: str) -> List[Any]:
+        model_path = resolve_backend_model_path(model_path, task="detect")
+        items = cls._run_in_workers("detect", image_paths, model_path)
+        return [
+            item if isinstance(item, BaseException) else _worker_item_result("detect", image_path, item)
+            for image_path, item in zip(image_paths, items)
+        ]
+    
+    @classmethod
+    def _segment_batch_in_workers(cls, image_paths: List[ImageSource], model_path: str,
+                                  conf_threshold: float, mask_format: str = "polygon") -> List[Any]:
+        model_path = resolve_backend_model_path(model_path, task="segment")
+        items = cls._run_in_workers("segment", image_paths, model_path, conf_threshold, mask_format)
+        return [
+            item if isinstance(item, BaseException) else _worker_item_result("segment", image_path, item)
+            for image_path, item in zip(image_paths, items)
+        ]
+    
+    # ---- 紧凑数组结果（工作进程 -> API进程） ----
+    
+    @staticmethod
+    def extract_detection_arrays(result) -> Dict[str, np.ndarray]:
+        """把检测结果一次性转为紧凑的numpy数组"""
+        boxes = result.boxes
+        if boxes is None or len(boxes) == 0:
+            return {
+                "xyxy": np.zeros((0, 4), dtype=np.float32),
+                "conf": np.zeros((0,), dtype=np.float32),
+                "cls": np.zeros((0,), dtype=np.int32),
+            }
+        return {
+            "xyxy": boxes.xyxy.cpu().numpy().astype(np.float32),
+            "conf": boxes.conf.cpu().numpy().astype(np.float32),
+            "cls": boxes.cls.cpu().numpy().astype(np.int32),
+        }
+    
+    @classmethod
+    def extract_segmentation_arrays(cls, result, mask_format: str = "polygon") -> Dict[str, np.ndarray]:
+        """把分割结果转为紧凑数组，所有多边形顶点展平为一个数组，用offsets切分
+        
+        多边形坐标为原图像素坐标；mask_format为rle时不提取轮廓（多边形为空），
+        各mask的RLE字节同样展平为 rle_bytes，用 rle_offsets 切分
+        """
+        arrays = cls.extract_detection_arrays(result)
+        orig_shape = result.orig_shape[:2]
+        arrays["orig_shape"] = np.array(orig_shape, dtype=np.int32)
+        polygons: List[np.ndarray] = []
+        rles: List[Optional[np.ndarray]] = []
+        num_boxes = len(arrays["conf"])
+        # 没有mask（或没有检测框）时为None，多边形为空，不需要换算坐标
+        mask_shape = None
+        if result.masks is not None and num_boxes:
+            data = result.masks.data[:num_boxes]
+            # 所有mask一次性拷贝到CPU，而不是逐个mask拷贝
+            mask_data = data.cpu().numpy() if hasattr(data, "cpu") else np.asarray(data)
+            mask_shape = mask_data.shape[1:]
+            if mask_format == "rle":
+                rles = _masks_to_rle(mask_data, arrays["xyxy"], mask_shape, orig_shape)
+            else:
+                # mask在检测框以外都是0，只在框对应的区域内提取轮廓
+                gain, pad_x, pad_y = _letterbox_params(mask_shape, orig_shape)
+                rois = arrays["xyxy"] * gain + np.array([pad_x, pad_y, pad_x, pad_y], dtype=np.float32)
+                rois = np.hstack([np.floor(rois[:, :2]) - 1, np.ceil(rois[:, 2:]) + 1])
+                rois = np.clip(rois, 0, [mask_shape[1], mask_shape[0], mask_shape[1], mask_shape[0]]).astype(np.int32)
+                polygons = _masks_to_polygons(mask_data, rois)
+        if mask_format == "rle":
+            rles.extend(None for _ in range(num_boxes - len(rles)))
+            rle_offsets = np.zeros(num_boxes + 1, dtype=np.int64)
+            rle_offsets[1:] = np.cumsum([0 if r is None else len(r) for r in rles])
+            arrays["rle_offsets"] = rle_offsets
+            arrays["rle_bytes"] = (
+                np.concatenate([r for r in rles if r is not None]) if rle_offsets[-1]
+                else np.zeros((0,), dtype=np.uint8)
+            )
+        # 没有mask的检测框多边形为空
+        polygons.extend(np.zeros((0, 2), dtype=np.float32) for _ in range(len(arrays["conf"]) - len(polygons)))
+        
+        offsets = np.zeros(len(polygons) + 1, dtype=np.int32)
+        if polygons:
+            offsets[1:] = np.cumsum([len(p) for p in polygons])
+        if mask_shape is not None and offsets[-1]:
+            poly_xy = np.concatenate(polygons).astype(np.float32).reshape(-1, 2)
+            # mask坐标系是推理输入尺寸（含letterbox填充），统一换算回原图坐标
+            arrays["poly_xy"] = _scale_polygons(poly_xy, mask_shape, result.orig_shape[:2])
+        else:
+            arrays["poly_xy"] = np.zeros((0, 2), dtype=np.float32)
+        arrays["poly_offsets"] = offsets
+        return arrays
+    
+    @staticmethod
+    def build_detection_result(image_path: str, arrays: Dict[str, np.ndarray], names: Dict[int, str]) -> DetectionResult:
+        """由紧凑数组构建检测结果"""
+        xyxy, conf, cls_ids = arrays["xyxy"], arrays["conf"], arrays["cls"]
+        # 过滤掉坐标或置信度无效的框（导出后端偶尔会输出NaN）
+        valid = np.isfinite(xyxy).all(axis=1) & np.isfinite(conf)
+        if not valid.all():
+            xyxy, conf, cls_ids = xyxy[valid], conf[valid], cls_ids[valid]
+        
+        # 整个列表一次交给pydantic校验（比逐个构造模型对象快）
+        defects = _BOX_LIST.validate_python([
+            {"x1": x1, "y1": y1, "x2": x2, "y2": y2, "confidence": confidence, "class_name": class_name}
+            for (x1, y1, x2, y2), confidence, class_name in zip(
+                xyxy.tolist(), conf.tolist(), map_class_names(cls_ids, names)
+            )
+        ])
+        return DetectionResult(
+            image_path=str(image_path),
+            defects=defects,
+            timestamp=datetime.now()
+        )
+    
+    @staticmethod
+    def build_segment_result(image_path: str, arrays: Dict[str, np.ndarray], names: Dict[int, str]) -> SegmentResult:
+        """由紧凑数组构建分割结果"""
+        xyxy, conf, cls_ids = arrays["xyxy"], arrays["conf"], arrays["cls"]
+        offsets = arrays["poly_offsets"]
+        rle_offsets = arrays.get("rle_offsets")
+        if rle_offsets is not None:
+            # RLE输出：mask内至少有一个像素
+            has_mask = np.diff(rle_offsets) > 0
+            rle_bytes = arrays["rle_bytes"].tolist()
+            rle_starts, rle_ends = rle_offsets[:-1].tolist(), rle_offsets[1:].tolist()
+        else:
+            # 至少3个点才能形成多边形
+            has_mask = np.diff(offsets) >= 3
+        valid = has_mask & np.isfinite(xyxy).all(axis=1) & np.isfinite(conf)
+        indices = np.flatnonzero(valid)
+        
+        points = arrays["poly_xy"].tolist()
+        starts, ends = offsets[:-1].tolist(), offsets[1:].tolist()
+        masks = _MASK_LIST.validate_python([
+            {
+                "polygon": [{"x": x, "y": y} for x, y in points[starts[idx]:ends[idx]]],
+                "bbox": {"x1": x1, "y1": y1, "x2": x2, "y2": y2, "confidence": confidence, "class_name": class_name},
+                "confidence": confidence,
+                "class_name": class_name,
+                "rle": rle_bytes[rle_starts[idx]:rle_ends[idx]] if rle_offsets is not None else None,
+            }
+            for idx, (x1, y1, x2, y2), confidence, class_name in zip(
+                indices.tolist(), xyxy[indices].tolist(), conf[indices].tolist(),
+                map_class_names(cls_ids[indices], names)
+            )
+        ])
+        orig_shape = arrays.get("orig_shape")
+        image_height, image_width = orig_shape.tolist() if orig_shape is not None else (None, None)
         return SegmentResult(
             image_path=str(image_path),
             masks=masks,
-            timestamp=datetime.now()
+            timestamp=datetime.now(),
+            image_width=image_width,
+            image_height=image_height
         )
 
+
+_BOX_LIST = TypeAdapter(List[BoundingBox])
+_MASK_LIST = TypeAdapter(List[SegmentMask])
+
+
+def map_class_names(class_ids: np.ndarray, names: Dict[int, str]) -> List[str]:
+    """把类别ID数组映射为类别名称列表（每个不同的类别只查一次字典）"""
+    if len(class_ids) == 0:
+        return []
+    unique_ids, inverse = np.unique(class_ids, return_inverse=True)
+    table = np.array([names.get(c, f"class_{c}") for c in unique_ids.tolist()], dtype=object)
+    return table[inverse].tolist()
+
+
+def _mask_to_polygon(mask_data: np.ndarray, offset=(0, 0)) -> Optional[np.ndarray]:
+    """将单个mask转换为多边形顶点数组 (K, 2)，没有轮廓时返回None
+
+    mask_data可以是mask的局部区域，offset为该区域左上角在整个mask中的位置
+    """
+    if mask_data.size == 0:
+        return None
+    mask_uint8 = (mask_data > 0).view(np.uint8)
+    
+    # 使用OpenCV找到轮廓
+    contours, _ = cv2.findContours(mask_uint8, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE, offset=offset)
+    if len(contours) == 0:
+        return None
+    
+    # 取最大的轮廓
+    largest_contour = max(contours, key=cv2.contourArea)
+    # 简化轮廓（减少点数）
+    epsilon = 0.002 * cv2.arcLength(largest_contour, True)
+    approx = cv2.approxPolyDP(largest_contour, epsilon, True)
+    return approx.reshape(-1, 2).astype(np.float32)
+
+
+_polygon_executor: Optional[ThreadPoolExecutor] = None
+_polygon_executor_lock = threading.Lock()
+
+
+def _get_polygon_executor() -> Optional[ThreadPoolExecutor]:
+    """轮廓提取线程池（OpenCV在findContours/approxPolyDP中释放GIL，可以真正并行）"""
+    global _polygon_executor
+    if POLYGON_WORKERS <= 1:
+        return None
+    if _polygon_executor is None:
+        with _polygon_executor_lock:
+            if _polygon_executor is None:
+                _polygon_executor = ThreadPoolExecutor(
+                    max_workers=POLYGON_WORKERS, thread_name_prefix="polygon"
+                )
+    return _polygon_executor
+
+
+def _masks_to_polygons(mask_data: np.ndarray, rois: np.ndarray) -> List[np.ndarray]:
+    """把 (N, H, W) mask批量转换为多边形（mask坐标系），只处理各自的 rois [x1, y1, x2, y2] 区域，
+    mask较多时并行提取轮廓"""
+    empty = np.zeros((0, 2), dtype=np.float32)
+    
+    def _extract(i: int) -> Optional[np.ndarray]:
+        x1, y1, x2, y2 = rois[i].tolist()
+        return _mask_to_polygon(mask_data[i, y1:y2, x1:x2], offset=(x1, y1))
+    
+    executor = _get_polygon_executor()
+    if executor is not None and len(mask_data) >= POLYGON_PARALLEL_MIN_MASKS:
+        polygons = list(executor.map(_extract, range(len(mask_data))))
+    else:
+        polygons = [_extract(i) for i in range(len(mask_data))]
+    return [p if p is not None else empty for p in polygons]
+
+
+def _masks_to_rle(mask_data: np.ndarray, xyxy: np.ndarray, mask_shape, orig_shape) -> List[Optional[np.ndarray]]:
+    """把 (N, H, W) mask批量编码为原图尺寸的LabelStudio画笔RLE（uint8数组），不提取轮廓
+    
+    只把检测框对应的区域从mask坐标系（含letterbox填充）采样到原图像素，再由该区域直接计算游程；
+    mask为空时返回None
+    """
+    orig_h, orig_w = int(orig_shape[0]), int(orig_shape[1])
+    gain, pad_x, pad_y = _letterbox_params(mask_shape, orig_shape)
+    boxes = np.hstack([np.floor(xyxy[:, :2]), np.ceil(xyxy[:, 2:])])
+    boxes = np.clip(boxes, 0, [orig_w, orig_h, orig_w, orig_h]).astype(np.int32)
+    
+    def _encode(i: int) -> Optional[np.ndarray]:
+        x1, y1, x2, y2 = boxes[i].tolist()
+        if x2 <= x1 or y2 <= y1:
+            return None
+        # 原图像素 (x, y) 的中心对应mask坐标 ((x + 0.5) * gain + pad_x - 0.5, ...)
+        matrix = np.array([
+            [gain, 0, gain * (x1 + 0.5) - 0.5 + pad_x],
+            [0, gain, gain * (y1 + 0.5) - 0.5 + pad_y],
+        ], dtype=np.float64)
+        roi = cv2.warpAffine(
+            mask_data[i].astype(np.float32, copy=False), matrix, (x2 - x1, y2 - y1),
+            flags=cv2.INTER_LINEAR | cv2.WARP_INVERSE_MAP
+        ) > 0.5
+        if not roi.any():
+            return None
+        return np.array(roi_mask_to_rle(roi, x1, y1, orig_w, orig_h), dtype=np.uint8)
+    
+    # 与轮廓提取共用线程池（warpAffine释放GIL）
+    executor = _get_polygon_executor()
+    if executor is not None and len(mask_data) >= POLYGON_PARALLEL_MIN_MASKS:
+        return list(executor.map(_encode, range(len(mask_data))))
+    return [_encode(i) for i in range(len(mask_data))]
+
+
+def _segment_params(conf_threshold: float, mask_format: str, tiled: bool = False) -> Dict[str, Any]:
+    """分割结果缓存键的参数（默认多边形输出时不带mask_format，保持原有缓存键）"""
+    if mask_format not in ("polygon", "rle"):
+        raise ValueError(f"不支持的mask格式: {mask_format}")
+    if mask_format == "rle" and tiled:
+        raise ValueError("切片推理不支持RLE mask输出")
+    params: Dict[str, Any] = {"conf": conf_threshold}
+    if mask_format == "rle":
+        params["mask_format"] = mask_format
+    return params
+
+
+def _letterbox_params(mask_shape, orig_shape):
+    """原图到推理输入尺寸（letterbox居中填充）的缩放比例和填充 (gain, pad_x, pad_y)"""
+    mask_h, mask_w = int(mask_shape[0]), int(mask_shape[1])
+    orig_h, orig_w = int(orig_shape[0]), int(orig_shape[1])
+    gain = min(mask_h / orig_h, mask_w / orig_w)
+    pad_x = round((mask_w - orig_w * gain) / 2 - 0.1)
+    pad_y = round((mask_h - orig_h * gain) / 2 - 0.1)
+    return gain, pad_x, pad_y
+
+
+def _scale_polygons(poly_xy: np.ndarray, mask_shape, orig_shape) -> np.ndarray:
+    """把mask坐标系（推理输入尺寸，含letterbox居中填充）下的多边形顶点换算到原图坐标"""
+    if len(poly_xy) == 0:
+        return poly_xy
+    orig_h, orig_w = int(orig_shape[0]), int(orig_shape[1])
+    gain, pad_x, pad_y = _letterbox_params(mask_shape, orig_shape)
+    xy = (poly_xy - np.array([pad_x, pad_y], dtype=np.float32)) / gain
+    xy[:, 0] = np.clip(xy[:, 0], 0, orig_w)
+    xy[:, 1] = np.clip(xy[:, 1], 0, orig_h)
+    return xy.astype(np.float32)
@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""
+检测/分割后处理微基准
+对比逐框访问张量的旧实现与一次性取数组的新实现的单张图片后处理耗时
+用法: python bench_postprocess.py [--boxes 300] [--masks 50] [--runs 50]
+"""
+import argparse
+import time
+from datetime import datetime
+import numpy as np
+
+
+def legacy_parse_detection(result, model, image_path):
+    """旧实现：逐框访问张量"""
+    from app.models.schemas import BoundingBox, DetectionResult
+    defects = []
+    boxes = result.boxes
+    if boxes is not None and len(boxes) > 0:
+        for box in boxes:
+            x1, y1, x2, y2 = box.xyxy[0].tolist()
+            confidence = float(box.conf[0])
+            class_id = int(box.cls[0])
+            class_name = model.names.get(class_id, f"class_{class_id}")
+            defects.append(BoundingBox(
+                x1=x1, y1=y1, x2=x2, y2=y2, confidence=confidence, class_name=class_name
+            ))
+    return DetectionResult(image_path=str(image_path), defects=defects, timestamp=datetime.now())
+
+
+def legacy_parse_segmentation(result, model, image_path):
+    """旧实现：逐个mask访问框和mask张量"""
+    from app.models.schemas import BoundingBox, PolygonPoint, SegmentMask, SegmentResult
+    from app.services.yolo_service import _mask_to_polygon
+    masks = []
+    if result.masks is not None:
+        boxes = result.boxes
+        for idx, mask in enumerate(result.masks):
+            box = boxes[idx]
+            x1, y1, x2, y2 = box.xyxy[0].tolist()
+            confidence = float(box.conf[0])
+            class_id = int(box.cls[0])
+            class_name = model.names.get(class_id, f"class_{class_id}")
+            polygon = _mask_to_polygon(mask.data[0].cpu().numpy())
+            if polygon is not None and len(polygon) >= 3:
+                masks.append(SegmentMask(
+                    polygon=[PolygonPoint(x=x, y=y) for x, y in polygon.tolist()],
+                    bbox=BoundingBox(x1=x1, y1=y1, x2=x2, y2=y2, confidence=confidence, class_name=class_name),
+                    confidence=confidence,
+                    class_name=class_name
+                ))
+    return SegmentResult(image_path=str(image_path), masks=masks, timestamp=datetime.now())
+
+
+def array_parse_detection(result, model, image_path):
+    """新实现：一次性取出所有框的数组，再生成结果"""
+    from app.services.yolo_service import YoloService
+    arrays = YoloService.extract_detection_arrays(result)
+    return YoloService.build_detection_result(str(image_path), arrays, model.names)
+
+
+def array_parse_segmentation(result, model, image_path):
+    """新实现：框和mask各一次性取出，再生成结果"""
+    from app.services.yolo_service import YoloService
+    arrays = YoloService.extract_segmentation_arrays(result)
+    return YoloService.build_segment_result(str(image_path), arrays, model.names)
+
+
+class _FakeModel:
+    def __init__(self, names):
+        self.names = names
+
+
+def make_result(num_boxes: int, with_masks: bool, image_size: int = 640, seed: int = 0):
+    """构造带随机框（和圆形mask）的ultralytics Results"""
+    import torch
+    from ultralytics.engine.results import Results
+
+    rng = np.random.default_rng(seed)
+    xy = rng.uniform(0, image_size - 64, size=(num_boxes, 2))
+    wh = rng.uniform(8, 64, size=(num_boxes, 2))
+    conf = rng.uniform(0.25, 1.0, size=(num_boxes, 1))
+    cls = rng.integers(0, 5, size=(num_boxes, 1))
+    boxes = torch.tensor(np.hstack([xy, xy + wh, conf, cls]), dtype=torch.float32)
+
+    masks = None
+    if with_masks:
+        yy, xx = np.mgrid[0:image_size, 0:image_size]
+        centers = xy + wh / 2
+        radii = wh.min(axis=1) / 2
+        data = np.stack([
+            ((xx - cx) ** 2 + (yy - cy) ** 2 <= r ** 2) for (cx, cy), r in zip(centers, radii)
+        ]).astype(np.float32)
+        masks = torch.from_numpy(data)
+
+    names = {i: f"defect_{i}" for i in range(5)}
+    image = np.zeros((image_size, image_size, 3), dtype=np.uint8)
+    return Results(image, path="bench.jpg", names=names, boxes=boxes, masks=masks), _FakeModel(names)
+
+
+def bench(fn, result, model, runs: int) -> float:
+    """返回每张图片的平均耗时（毫秒）"""
+    fn(result, model, "bench.jpg")
+    started = time.perf_counter()
+    for _ in range(runs):
+        fn(result, model, "bench.jpg")
+    return (time.perf_counter() - started) / runs * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="后处理微基准")
+    parser.add_argument("--boxes", type=int, default=300, help="检测框数量")
+    parser.add_argument("--masks", type=int, default=50, help="分割mask数量")
+    parser.add_argument("--runs", type=int, default=50, help="每项重复次数")
+    args = parser.parse_args()
+
+    print(f"后处理微基准（每张图片平均耗时，重复{args.runs}次）")
+    print("-" * 50)
+
+    result, model = make_result(args.boxes, with_masks=False)
+    before = bench(legacy_parse_detection, result, model, args.runs)
+    after = bench(array_parse_detection, result, model, args.runs)
+    same = legacy_parse_detection(result, model, "x").defects == array_parse_detection(result, model, "x").defects
+    print(f"检测 {args.boxes} 个框: 旧 {before:.2f} ms  新 {after:.2f} ms  加速 {before / after:.1f}x  结果一致: {same}")
+
+    result, model = make_result(args.masks, with_masks=True)
+    before = bench(legacy_parse_segmentation, result, model, args.runs)
+    after = bench(array_parse_segmentation, result, model, args.runs)
+    print(f"分割 {args.masks} 个mask: 旧 {before:.2f} ms  新 {after:.2f} ms  加速 {before / after:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+测试推理后端与PyTorch结果一致性
+模型权重无法获取（例如离线时无法下载yolov8n）或无法导出为指定后端时跳过该项，不计为不一致
+用法: python test_backend_parity.py --backend onnx [--images a.jpg b.jpg ...]
+"""
+import argparse
+import sys
+import traceback
+from pathlib import Path
+import numpy as np
+
+
+def _to_arrays(boxes):
+    xyxy = np.array([[b.x1, b.y1, b.x2, b.y2] for b in boxes], dtype=np.float32).reshape(-1, 4)
+    conf = np.array([b.confidence for b in boxes], dtype=np.float32)
+    names = [b.class_name for b in boxes]
+    return xyxy, conf, names
+
+
+def compare(reference, candidate, iou_threshold: float, conf_tolerance: float) -> list:
+    """以PyTorch结果为基准，检查候选后端的每个框是否能匹配上"""
+    from app.services.quantization_service import box_iou
+
+    errors = []
+    ref_xyxy, ref_conf, ref_names = _to_arrays(reference)
+    cand_xyxy, cand_conf, cand_names = _to_arrays(candidate)
+    iou = box_iou(ref_xyxy, cand_xyxy)
+    for i in range(len(ref_xyxy)):
+        # 只要求置信度明显高于容差的框必须匹配，临界框在不同后端下可能被阈值过滤掉
+        if ref_conf[i] < conf_tolerance * 2:
+            continue
+        candidates = [j for j in range(len(cand_xyxy)) if cand_names[j] == ref_names[i]]
+        best = max(candidates, key=lambda j: iou[i, j], default=None)
+        if best is None or iou[i, best] < iou_threshold:
+            errors.append(f"框 {i} ({ref_names[i]}, conf={ref_conf[i]:.3f}) 没有匹配")
+        elif abs(ref_conf[i] - cand_conf[best]) > conf_tolerance:
+            errors.append(
+                f"框 {i} ({ref_names[i]}) 置信度差异过大: {ref_conf[i]:.3f} vs {cand_conf[best]:.3f}"
+            )
+    return errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description="推理后端一致性测试")
+    parser.add_argument("--backend", default="onnx", help="onnx / openvino / torchscript")
+    parser.add_argument("--images", nargs="*", help="测试图片，默认使用ultralytics自带示例图片")
+    parser.add_argument("--detect-model", default=None, help="检测模型路径")
+    parser.add_argument("--seg-model", default=None, help="分割模型路径")
+    parser.add_argument("--iou", type=float, default=0.9, help="边界框匹配的最小IoU")
+    parser.add_argument("--conf-tol", type=float, default=0.05, help="置信度允许的最大差异")
+    args = parser.parse_args()
+
+    from ultralytics.utils import ASSETS
+    from app.services.inference_backend import load_model
+    from app.services.yolo_service import YoloService
+
+    images = args.images or [str(p) for p in sorted(Path(ASSETS).glob("*.jpg"))]
+    detect_model = args.detect_model or YoloService.resolve_model_path()
+    seg_model = args.seg_model or YoloService.resolve_segmentation_model_path()
+
+    print(f"测试推理后端一致性: pytorch vs {args.backend}")
+    print("-" * 50)
+
+    failures = 0
+    skipped = 0
+    for task, model_path in (("detect", detect_model), ("segment", seg_model)):
+        if model_path is None:
+            print(f"⏭️  {task} 跳过: 没有可用的模型")
+            skipped += 1
+            continue
+        try:
+            reference_model = load_model(model_path, task=task, backend="pytorch")
+        except Exception as e:
+            print(f"⏭️  {task} 跳过: 模型权重 {model_path} 加载失败（离线时无法下载？）: {e}")
+            skipped += 1
+            continue
+        try:
+            candidate_model = load_model(model_path, task=task, backend=args.backend)
+        except Exception as e:
+            print(f"⏭️  {task} 跳过: 模型无法导出/加载为 {args.backend} 后端: {e}")
+            traceback.print_exc()
+            skipped += 1
+            continue
+
+        for image_path in images:
+            ref = reference_model(image_path, verbose=False)[0]
+            cand = candidate_model(image_path, verbose=False)[0]
+            if task == "segment":
+                ref_result = YoloService.build_segment_result(
+                    image_path, YoloService.extract_segmentation_arrays(ref), reference_model.names
+                )
+                cand_result = YoloService.build_segment_result(
+                    image_path, YoloService.extract_segmentation_arrays(cand), candidate_model.names
+                )
+                ref_boxes = [m.bbox for m in ref_result.masks]
+                cand_boxes = [m.bbox for m in cand_result.masks]
+            else:
+                ref_boxes = YoloService.build_detection_result(
+                    image_path, YoloService.extract_detection_arrays(ref), reference_model.names
+                ).defects
+                cand_boxes = YoloService.build_detection_result(
+                    image_path, YoloService.extract_detection_arrays(cand), candidate_model.names
+                ).defects
+
+            errors = compare(ref_boxes, cand_boxes, args.iou, args.conf_tol)
+            name = Path(image_path).name
+            if errors:
+                failures += 1
+                print(f"❌ {task} {name}: {len(ref_boxes)} vs {len(cand_boxes)} 个结果")
+                for error in errors:
+                    print(f"    - {error}")
+            else:
+                print(f"✅ {task} {name}: {len(ref_boxes)} vs {len(cand_boxes)} 个结果一致")
+
+    print("-" * 50)
+    if skipped:
+        print(f"跳过 {skipped} 项（模型不可用）")
+    if failures:
+        print(f"测试失败: {failures} 项不一致")
+        sys.exit(1)
+    print("测试完成！")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+"""
+测试LabelStudio → YOLO数据集增量同步
+用假的LabelStudio（httpx.MockTransport）检查：首次同步写入所有已标注任务、内容相同的图片只保存一份、
+再次同步不下载也不重写文件、修改标注只重写标签、新增/删除任务只处理变化部分、分页全部获取
+用法: python test_dataset_sync.py
+"""
+import asyncio
+import shutil
+import sys
+import tempfile
+from pathlib import Path
+import httpx
+import yaml
+
+LABEL_CONFIG = """<View>
+  <Image name="image" value="$image"/>
+  <RectangleLabels name="label" toName="image">
+    <Label value="scratch"/><Label value="dent"/>
+  </RectangleLabels>
+</View>"""
+
+
+def rectangle(label: str, x: float, y: float, w: float, h: float) -> dict:
+    return {"type": "rectanglelabels", "value": {"x": x, "y": y, "width": w, "height": h, "rectanglelabels": [label]}}
+
+
+def image_bytes(seed: int) -> bytes:
+    return b"\x89PNG\r\n\x1a\n" + bytes([seed]) * 64
+
+
+class FakeLabelStudio:
+    """分页的 /api/tasks（fields=all时带标注）和 /data/upload/ 下的图片"""
+
+    def __init__(self):
+        self.tasks = {}
+        self.images = {}
+        self.image_requests = []
+        self.pages = []
+
+    def add_task(self, task_id: int, image_seed: int, result=None, cancelled: bool = False):
+        url = f"/data/upload/1/{task_id}.png"
+        self.images[url] = image_bytes(image_seed)
+        annotations = [] if result is None else [{"id": task_id, "result": result, "was_cancelled": cancelled,
+                                                  "updated_at": "2024-01-01T00:00:00"}]
+        self.tasks[task_id] = {"id": task_id, "data": {"image": url}, "annotations": annotations}
+
+    def annotate(self, task_id: int, result):
+        annotation = {"id": 1000 + task_id, "result": result, "was_cancelled": False, "updated_at": "2024-02-01T00:00:00"}
+        self.tasks[task_id]["annotations"].append(annotation)
+
+    def handle(self, request: httpx.Request) -> httpx.Response:
+        path = request.url.path
+        if path == "/api/projects/1/":
+            return httpx.Response(200, json={"id": 1, "label_config": LABEL_CONFIG})
+        if path == "/api/tasks":
+            page = int(request.url.params.get("page", 1))
+            page_size = int(request.url.params.get("page_size", 100))
+            self.pages.append(page)
+            tasks = [self.tasks[i] for i in sorted(self.tasks)]
+            if request.url.params.get("fields") != "all":
+                tasks = [{**task, "annotations": []} for task in tasks]
+            return httpx.Response(200, json={
+                "tasks": tasks[(page - 1) * page_size:page * page_size], "total": len(tasks),
+            })
+        if path in self.images:
+            self.image_requests.append(path)
+            if request.headers.get("authorization") != "Token secret":
+                return httpx.Response(401)
+            return httpx.Response(200, content=self.images[path])
+        return httpx.Response(404, json={"detail": "not found"})
+
+
+def snapshot(dataset_dir: Path) -> dict:
+    """数据集中所有图片和标签文件的修改时间"""
+    return {
+        str(path.relative_to(dataset_dir)): path.stat().st_mtime_ns
+        for path in dataset_dir.glob("*/*/*") if path.is_file()
+    }
+
+
+async def run_checks(root: Path) -> list:
+    from app.services import dataset_sync_service, http_client
+    from app.services.dataset_sync_service import DatasetSyncService
+    from app.services.labelstudio_service import LabelStudioService
+
+    errors = []
+    fake = FakeLabelStudio()
+    fake.add_task(1, 1, [rectangle("scratch", 10, 20, 30, 40)])
+    fake.add_task(2, 2, [rectangle("dent", 0, 0, 50, 50), {"type": "brushlabels", "value": {"brushlabels": ["dent"]}}])
+    fake.add_task(3, 1, [rectangle("dent", 50, 50, 10, 10)])  # 与任务1图片内容相同
+    fake.add_task(4, 4, [])  # 标注为空：背景图片
+    fake.add_task(5, 5)  # 未标注
+    fake.add_task(6, 6, [rectangle("scratch", 0, 0, 10, 10)], cancelled=True)
+    await http_client.start_http_client(transport=httpx.MockTransport(fake.handle))
+    dataset_sync_service.DATASET_SYNC_PAGE_SIZE = 2
+    labelstudio = LabelStudioService()
+    labelstudio.base_url = "http://ls.test"
+    labelstudio.api_url = "http://ls.test/api"
+    labelstudio.headers["Authorization"] = "Token secret"
+    service = DatasetSyncService(labelstudio, root=root)
+    dataset_dir = service.dataset_dir(1)
+
+    # 1. 首次同步：4个已标注任务，3张不同图片，所有分页都被获取
+    result = await service.sync(1, val_ratio=0)
+    if (result.added, result.total_tasks, result.images, result.duplicates) != (4, 4, 3, 1):
+        errors.append(f"首次同步计数错误: {result}")
+    if result.images_downloaded != 4 or result.skipped_regions != 1 or result.failed != 0:
+        errors.append(f"首次同步下载/跳过计数错误: {result}")
+    if sorted(fake.pages) != [1, 2, 3]:
+        errors.append(f"应获取3个分页: {fake.pages}")
+    data_yaml = yaml.safe_load(Path(result.dataset_path).read_text(encoding="utf-8"))
+    if data_yaml["names"] != {0: "scratch", 1: "dent"} or data_yaml["val"] != "images/train":
+        errors.append(f"data.yaml错误: {data_yaml}")
+    labels = {path.stem: path.read_text() for path in (dataset_dir / "labels" / "train").glob("*.txt")}
+    if "0 0.250000 0.400000 0.300000 0.400000\n" not in labels.values():
+        errors.append(f"矩形框标签错误（重复图片应使用任务1的标注）: {labels}")
+    if "" not in labels.values() or len(labels) != 3:
+        errors.append(f"空标注应生成空标签文件: {labels}")
+
+    # 2. 再次同步：不下载、不写文件
+    before = snapshot(dataset_dir)
+    fake.image_requests.clear()
+    result = await service.sync(1)
+    if result.unchanged != 4 or result.images_downloaded or fake.image_requests:
+        errors.append(f"无变化时不应下载: {result} {fake.image_requests}")
+    if snapshot(dataset_dir) != before:
+        errors.append("无变化时不应写入文件")
+
+    # 3. 修改任务1的标注：只重写一个标签，不下载
+    fake.annotate(1, [rectangle("dent", 0, 0, 100, 100)])
+    result = await service.sync(1)
+    after = snapshot(dataset_dir)
+    changed = [name for name in after if after[name] != before.get(name)]
+    if result.updated != 1 or result.images_downloaded or len(changed) != 1 or not changed[0].startswith("labels"):
+        errors.append(f"修改标注应只重写一个标签: {result} {changed}")
+
+    # 4. 新增任务7、删除任务2：只下载一张图片，任务2的图片和标签被删除
+    fake.add_task(7, 7, [rectangle("crack", 0, 0, 20, 20)])
+    del fake.tasks[2]
+    fake.image_requests.clear()
+    result = await service.sync(1)
+    if (result.added, result.removed, result.images_downloaded, result.images) != (1, 1, 1, 3):
+        errors.append(f"增删任务计数错误: {result}")
+    if fake.image_requests != ["/data/upload/1/7.png"]:
+        errors.append(f"应只下载新任务的图片: {fake.image_requests}")
+    if len(list((dataset_dir / "images" / "train").iterdir())) != 3:
+        errors.append("删除任务的图片应被移除")
+    if result.names != ["scratch", "dent", "crack"]:
+        errors.append(f"新类别应追加到末尾: {result.names}")
+
+    # 5. 全部划分到验证集：文件被移动，不重新下载
+    result = await service.sync(1, val_ratio=1)
+    if result.val_images != 3 or result.images_downloaded or len(list((dataset_dir / "labels" / "val").iterdir())) != 3:
+        errors.append(f"调整验证集比例后应移动文件: {result}")
+    if service.get_status(1) != result:
+        errors.append("get_status 应返回上次同步的结果")
+
+    await http_client.close_http_client()
+    return errors
+
+
+def main():
+    root = Path(tempfile.mkdtemp(prefix="dataset_sync_"))
+    try:
+        errors = asyncio.run(run_checks(root))
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+    if errors:
+        for error in errors:
+            print(f"❌ {error}")
+        sys.exit(1)
+    print("✅ LabelStudio数据集增量同步测试通过")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+"""
+测试共享HTTP客户端与LabelStudioService
+在本地启动一个桩LabelStudio服务，检查：连接复用、幂等请求在503后重试、非幂等请求不重试、
+按主机并发限制，以及通过自定义transport注入
+用法: python test_http_client.py
+"""
+import asyncio
+import json
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import httpx
+
+
+class StubLabelStudio(BaseHTTPRequestHandler):
+    """桩LabelStudio：/api/projects/ 第一次返回503，之后返回项目列表"""
+    protocol_version = "HTTP/1.1"
+    connections = set()
+    requests = []
+    fail_next = {"GET /api/projects/": 1, "POST /api/projects/": 1}
+    active = 0
+    max_active = 0
+    lock = threading.Lock()
+
+    def log_message(self, format, *args):
+        pass
+
+    def _reply(self, status: int, payload):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _handle(self):
+        cls = type(self)
+        path = self.path.split("?", 1)[0]
+        key = f"{self.command} {path}"
+        with cls.lock:
+            cls.connections.add(self.client_address)
+            cls.requests.append(key)
+            cls.active += 1
+            cls.max_active = max(cls.max_active, cls.active)
+            fail = cls.fail_next.get(key, 0)
+            if fail:
+                cls.fail_next[key] = fail - 1
+        try:
+            length = int(self.headers.get("Content-Length") or 0)
+            if length:
+                self.rfile.read(length)
+            if fail:
+                self._reply(503, {"detail": "busy"})
+            elif path.startswith("/api/projects/") and path.endswith("/slow"):
+                time.sleep(0.05)
+                self._reply(200, {"ok": True})
+            elif path == "/api/projects/":
+                self._reply(200, {"results": [{"id": 1, "title": "demo"}]})
+            else:
+                self._reply(404, {"detail": "not found"})
+        finally:
+            with cls.lock:
+                cls.active -= 1
+
+    do_GET = _handle
+    do_POST = _handle
+
+
+async def run_checks(base_url: str) -> list:
+    from app.services import http_client, project_cache
+    from app.services.labelstudio_service import LabelStudioService
+
+    errors = []
+    # 每次都请求LabelStudio（项目列表缓存见 test_labelstudio_projects.py）
+    project_cache._cache = project_cache.ProjectListCache(ttl=0)
+    client = await http_client.start_http_client()
+    client._transport.backoff = 0.01
+
+    service = LabelStudioService()
+    service.api_url = f"{base_url}/api"
+
+    # 1. GET在503后重试成功
+    projects = await service.get_projects()
+    if projects != [{"id": 1, "title": "demo"}]:
+        errors.append(f"get_projects 结果不正确: {projects}")
+    if StubLabelStudio.requests.count("GET /api/projects/") != 2:
+        errors.append(f"GET应重试一次: {StubLabelStudio.requests}")
+
+    # 2. POST不重试，直接返回错误
+    response = await client.post(f"{base_url}/api/projects/", json={})
+    if response.status_code != 503:
+        errors.append(f"POST应直接返回503，实际 {response.status_code}")
+    if StubLabelStudio.requests.count("POST /api/projects/") != 1:
+        errors.append(f"POST不应重试: {StubLabelStudio.requests}")
+
+    # 3. 连接复用：多次顺序请求只建立一个连接
+    StubLabelStudio.connections.clear()
+    for _ in range(5):
+        await service.get_projects()
+    if len(StubLabelStudio.connections) != 1:
+        errors.append(f"应复用keep-alive连接，实际建立 {len(StubLabelStudio.connections)} 个连接")
+
+    # 4. 按主机并发限制
+    client._transport.max_per_host = 3
+    client._transport._host_limits.clear()
+    StubLabelStudio.max_active = 0
+    await asyncio.gather(*(client.get(f"{base_url}/api/projects/{i}/slow") for i in range(12)))
+    if StubLabelStudio.max_active > 3:
+        errors.append(f"每个主机最多3个并发请求，实际 {StubLabelStudio.max_active}")
+
+    await http_client.close_http_client()
+
+    # 5. 注入transport（不需要网络）
+    def _mock(request: httpx.Request) -> httpx.Response:
+        return httpx.Response(200, json={"results": [{"id": 7}]})
+
+    await http_client.start_http_client(transport=httpx.MockTransport(_mock))
+    if await service.get_projects() != [{"id": 7}]:
+        errors.append("注入的transport未生效")
+    await http_client.close_http_client()
+    return errors
+
+
+def main():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubLabelStudio)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+    try:
+        errors = asyncio.run(run_checks(base_url))
+    finally:
+        server.shutdown()
+
+    if errors:
+        for error in errors:
+            print(f"❌ {error}")
+        sys.exit(1)
+    print("✅ 共享HTTP客户端测试通过")
+
+
+if __name__ == "__main__":
+    main()
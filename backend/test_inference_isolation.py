@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+"""
+测试推理请求之间互不影响（不需要模型，使用注册表中的假模型）
+检查：合并成一个微批的请求中有无法解码的图片时，只有该请求失败，其他请求正常返回结果，
+无法解码的图片不会传给模型；多个线程同时用不同的置信度阈值调用同一个模型时，每个请求都用自己的阈值；
+请求被取消后，推理执行器的名额直到推理真正结束才释放；进程池模式下内存图片可以传给子进程
+用法: python test_inference_isolation.py
+"""
+import asyncio
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+import numpy as np
+import torch
+
+
+class _Boxes:
+    def __init__(self, xyxy, conf, cls):
+        self.xyxy, self.conf, self.cls = xyxy, conf, cls
+
+    def __len__(self):
+        return len(self.conf)
+
+
+class FakeModel:
+    """与ultralytics模型调用方式一致的假模型：每张图片返回一个置信度为conf的检测框
+
+    与ultralytics一样先把参数保存在模型上（不加锁），推理时再读取
+    """
+
+    names = {0: "defect"}
+
+    def __init__(self):
+        self.calls = []
+        self.args = {}
+        self._lock = threading.Lock()
+
+    def __call__(self, inputs, conf=0.25, batch=1, verbose=False):
+        inputs = inputs if isinstance(inputs, list) else [inputs]
+        with self._lock:
+            self.calls.append(len(inputs))
+        self.args = {"conf": conf}
+        time.sleep(0.005)
+        conf = self.args["conf"]
+        results = []
+        for image in inputs:
+            if not isinstance(image, np.ndarray):
+                raise ValueError(f"模型收到了无效输入: {image!r}")
+            boxes = _Boxes(torch.tensor([[10.0, 10.0, 50.0, 50.0]]), torch.tensor([float(conf)]), torch.zeros(1))
+            results.append(SimpleNamespace(boxes=boxes, masks=None, orig_shape=image.shape[:2]))
+        return results
+
+
+def install_fake_model(task: str, model_path: str) -> FakeModel:
+    """把假模型放进全局模型注册表"""
+    from app.services.model_registry import LoadedModel, get_model_registry
+    model = FakeModel()
+    registry = get_model_registry()
+    with registry._lock:
+        registry._models[(task, model_path)] = LoadedModel(task, model_path, model, 0, 0.0)
+    return model
+
+
+def run_checks() -> list:
+    from app.services.batching_service import MicroBatcher
+    from app.services.image_input import InMemoryImage
+    from app.services.yolo_service import YoloService
+
+    errors = []
+    model_path = "fake-detect.pt"
+    model = install_fake_model("detect", model_path)
+    batcher = MicroBatcher(
+        "detect-test",
+        lambda key, paths: YoloService._run_detect(paths, key),
+        max_batch_size=8,
+        max_wait_ms=200,
+    )
+    try:
+        good = InMemoryImage(array=np.zeros((64, 64, 3), dtype=np.uint8), name="good.jpg")
+        bad = InMemoryImage(data=b"not an image", name="bad.jpg")
+        other = InMemoryImage(array=np.zeros((32, 32, 3), dtype=np.uint8), name="other.jpg")
+        futures = [batcher.submit_async(image, key=model_path) for image in (good, bad, other)]
+
+        for name, future in (("good.jpg", futures[0]), ("other.jpg", futures[2])):
+            try:
+                result = future.result(timeout=10).build()
+                if result.image_path != name or len(result.defects) != 1:
+                    errors.append(f"{name} 的结果错误: {result}")
+            except Exception as e:
+                errors.append(f"同一批中其他图片无法解码时 {name} 不应失败: {e!r}")
+        try:
+            futures[1].result(timeout=10)
+            errors.append("无法解码的图片应返回错误")
+        except ValueError:
+            pass
+        except Exception as e:
+            errors.append(f"无法解码的图片应返回解码错误: {e!r}")
+        if model.calls != [2]:
+            errors.append(f"应只把解码成功的2张图片合并成一批推理: {model.calls}")
+
+        # 整批都无法解码时不调用模型
+        model.calls.clear()
+        try:
+            batcher.submit(InMemoryImage(data=b"", name="empty.jpg"), key=model_path, timeout=10)
+            errors.append("空图片应返回错误")
+        except ValueError:
+            pass
+        if model.calls:
+            errors.append(f"整批都无法解码时不应调用模型: {model.calls}")
+    finally:
+        batcher.close()
+
+    # 多个线程同时用不同的置信度阈值调用同一个分割模型
+    seg_path = "fake-segment.pt"
+    install_fake_model("segment", seg_path)
+    image = InMemoryImage(array=np.zeros((64, 64, 3), dtype=np.uint8), name="seg.jpg")
+    thresholds = [0.1, 0.3, 0.5, 0.7] * 10
+
+    def _segment(conf: float) -> float:
+        result = YoloService._run_segment([image], seg_path, conf_threshold=conf)[0]
+        return float(result.arrays["conf"][0])
+
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        used = list(pool.map(_segment, thresholds))
+    mixed = [(want, got) for want, got in zip(thresholds, used) if abs(want - got) > 1e-6]
+    if mixed:
+        errors.append(f"并发调用时用到了其他请求的置信度阈值: {mixed[:5]}")
+
+    errors.extend(asyncio.run(check_cancelled_slot()))
+    errors.extend(asyncio.run(check_process_executor()))
+    return errors
+
+
+async def check_process_executor() -> list:
+    """进程池模式（INFERENCE_EXECUTOR_TYPE=process）下把内存图片传给子进程解码"""
+    import cv2
+    from app.services.image_input import InMemoryImage, read_image
+    from app.services.inference_executor import InferenceExecutor
+
+    errors = []
+    array = np.zeros((24, 32, 3), dtype=np.uint8)
+    _, encoded = cv2.imencode(".png", array)
+    image = InMemoryImage(data=encoded.tobytes(), name="upload.png")
+    executor = InferenceExecutor("process", max_workers=1, max_queue=0)
+    try:
+        shape = (await executor.run(read_image, image)).shape
+        if shape != array.shape:
+            errors.append(f"子进程解码的图片尺寸错误: {shape}")
+    except Exception as e:
+        errors.append(f"进程池模式下内存图片应能传给子进程: {e!r}")
+    finally:
+        executor.shutdown()
+    if image.array.shape != array.shape:
+        errors.append("pickle后原图片对象应仍可解码")
+    return errors
+
+
+async def check_cancelled_slot() -> list:
+    """取消等待推理的请求后，正在执行的推理仍占用名额，新请求被拒绝"""
+    from app.services.inference_executor import InferenceExecutor, InferenceQueueFullError
+
+    errors = []
+    executor = InferenceExecutor("thread", max_workers=1, max_queue=0)
+    started, release = threading.Event(), threading.Event()
+
+    def _blocking():
+        started.set()
+        release.wait(10)
+        return "done"
+
+    task = asyncio.create_task(executor.run(_blocking))
+    await asyncio.to_thread(started.wait, 10)
+    task.cancel()
+    try:
+        await task
+    except asyncio.CancelledError:
+        pass
+    if executor.get_stats()["in_flight"] != 1:
+        errors.append(f"请求取消后推理仍在执行，名额不应释放: {executor.get_stats()}")
+    try:
+        await executor.run(lambda: None)
+        errors.append("推理仍在执行时新请求应被拒绝")
+    except InferenceQueueFullError:
+        pass
+    release.set()
+    for _ in range(100):
+        if executor.get_stats()["in_flight"] == 0:
+            break
+        await asyncio.sleep(0.02)
+    if executor.get_stats()["in_flight"] != 0:
+        errors.append(f"推理结束后名额应释放: {executor.get_stats()}")
+    if await executor.run(lambda: "ok") != "ok":
+        errors.append("名额释放后应能继续推理")
+    executor.shutdown()
+    return errors
+
+
+def main():
+    errors = run_checks()
+    if errors:
+        for error in errors:
+            print(f"❌ {error}")
+        sys.exit(1)
+    print("✅ 推理请求隔离测试通过")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+测试LabelStudio导出的流式转发与磁盘缓存
+用假的LabelStudio（httpx.MockTransport）检查：导出完整转发、再次下载直接从磁盘发送、Range/If-Range、
+项目变化后重新导出并替换旧文件、LabelStudio出错时不缓存、删除项目后清除导出
+用法: python test_labelstudio_export.py
+"""
+import sys
+import tempfile
+from pathlib import Path
+import httpx
+
+
+class FakeLabelStudio:
+    def __init__(self):
+        self.project = {"id": 1, "title": "demo", "task_number": 10, "total_annotations_number": 5}
+        self.export_calls = 0
+        self.fail_export = False
+
+    def archive(self) -> bytes:
+        return bytes(range(256)) * 4096 + str(self.project["task_number"]).encode()
+
+    def handle(self, request: httpx.Request) -> httpx.Response:
+        path = request.url.path
+        if path == "/api/projects/1/export":
+            self.export_calls += 1
+            if self.fail_export:
+                return httpx.Response(500, json={"detail": "boom"})
+            return httpx.Response(200, content=self.archive(), headers={"Content-Type": "application/zip"})
+        if path == "/api/projects/1/" and request.method == "GET":
+            return httpx.Response(200, json=self.project)
+        if path == "/api/projects/1/" and request.method == "DELETE":
+            return httpx.Response(204)
+        return httpx.Response(404, json={"detail": "not found"})
+
+
+def run_checks(cache_dir: Path) -> list:
+    from fastapi import FastAPI
+    from fastapi.testclient import TestClient
+    from app.api import labelstudio
+    from app.services import export_cache, http_client
+
+    errors = []
+    fake = FakeLabelStudio()
+    cache = export_cache.ExportCache(cache_dir, max_bytes=64 * 1024 * 1024)
+    export_cache._cache = cache
+    app = FastAPI()
+    app.include_router(labelstudio.router)
+    url = "/projects/1/export"
+
+    with TestClient(app) as client:
+        client.portal.call(http_client.start_http_client, httpx.MockTransport(fake.handle))
+        archive = fake.archive()
+
+        # 1. 第一次下载从LabelStudio转发，完整后写入缓存
+        response = client.get(url)
+        if response.status_code != 200 or response.content != archive:
+            errors.append(f"导出内容不正确: {response.status_code} {len(response.content)}")
+        if len(list(cache_dir.glob("*/*/*.zip"))) != 1:
+            errors.append("完整下载后应写入缓存")
+
+        # 2. 再次下载直接从磁盘发送
+        response = client.get(url)
+        if fake.export_calls != 1 or response.content != archive or response.headers.get("accept-ranges") != "bytes":
+            errors.append(f"再次下载应命中磁盘缓存: 导出 {fake.export_calls} 次")
+
+        # 3. Range / 后缀Range / 超出范围 / If-Range不匹配
+        etag = response.headers.get("etag")
+        response = client.get(url, headers={"Range": "bytes=100-199"})
+        if response.status_code != 206 or response.content != archive[100:200] \
+                or response.headers.get("content-range") != f"bytes 100-199/{len(archive)}":
+            errors.append(f"Range请求不正确: {response.status_code} {response.headers.get('content-range')}")
+        response = client.get(url, headers={"Range": "bytes=-10"})
+        if response.status_code != 206 or response.content != archive[-10:]:
+            errors.append(f"后缀Range请求不正确: {response.status_code}")
+        response = client.get(url, headers={"Range": f"bytes={len(archive)}-"})
+        if response.status_code != 416:
+            errors.append(f"超出范围应返回416: {response.status_code}")
+        response = client.get(url, headers={"Range": "bytes=0-9", "If-Range": '"stale"'})
+        if response.status_code != 200 or len(response.content) != len(archive):
+            errors.append(f"If-Range不匹配时应返回整个文件: {response.status_code}")
+        response = client.get(url, headers={"Range": "bytes=0-9", "If-Range": etag})
+        if response.status_code != 206:
+            errors.append(f"If-Range匹配时应返回部分内容: {response.status_code}")
+
+        # 4. 项目变化后重新导出，旧文件被替换
+        fake.project["task_number"] = 11
+        response = client.get(url)
+        if fake.export_calls != 2 or response.content != fake.archive():
+            errors.append(f"项目变化后应重新导出: 导出 {fake.export_calls} 次")
+        if len(list(cache_dir.glob("*/*/*.zip"))) != 1:
+            errors.append("同一项目同一格式应只保留最新的导出")
+
+        # 5. LabelStudio出错时返回500且不缓存
+        fake.project["task_number"] = 12
+        fake.fail_export = True
+        response = client.get(url)
+        if response.status_code != 500:
+            errors.append(f"导出失败应返回500: {response.status_code}")
+        fake.fail_export = False
+
+        # 6. 删除项目后清除导出
+        client.delete("/projects/1")
+        if list(cache_dir.glob("*/*/*.zip")) or list(cache_dir.glob("*/*/*.tmp")):
+            errors.append("删除项目后应清除导出缓存")
+
+        client.portal.call(http_client.close_http_client)
+    export_cache._cache = None
+    return errors
+
+
+def main():
+    with tempfile.TemporaryDirectory() as tmp:
+        errors = run_checks(Path(tmp))
+    if errors:
+        for error in errors:
+            print(f"❌ {error}")
+        sys.exit(1)
+    print("✅ LabelStudio导出流式转发与缓存测试通过")
+
+
+if __name__ == "__main__":
+    main()
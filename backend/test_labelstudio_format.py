@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+测试LabelStudio预测格式转换
+检查：画笔RLE可以被LabelStudio的解码算法（label-studio-converter decode_rle）还原为原mask、
+局部区域编码与整幅编码一致、多边形换算为0-100的百分比坐标
+用法: python test_labelstudio_format.py
+"""
+import sys
+from datetime import datetime
+import numpy as np
+
+
+def decode_rle(rle) -> np.ndarray:
+    """LabelStudio的RLE解码（与 label-studio-converter 的 decode_rle 相同的算法）"""
+    bits = "".join(f"{byte:08b}" for byte in rle)
+    position = 0
+
+    def read(size: int) -> int:
+        nonlocal position
+        value = int(bits[position:position + size], 2)
+        position += size
+        return value
+
+    num = read(32)
+    word_size = read(5) + 1
+    rle_sizes = [read(4) + 1 for _ in range(4)]
+    out = np.zeros(num, dtype=np.uint8)
+    i = 0
+    while i < num:
+        repeat = read(1)
+        j = i + 1 + read(rle_sizes[read(2)])
+        if repeat:
+            out[i:j] = read(word_size)
+            i = j
+        else:
+            while i < j:
+                out[i] = read(word_size)
+                i += 1
+    return out
+
+
+def check_rle(errors: list):
+    from app.services.brush_rle import mask_to_rle, roi_mask_to_rle
+
+    rng = np.random.default_rng(0)
+    for trial in range(20):
+        height, width = rng.integers(1, 200, 2).tolist()
+        x0, y0 = int(rng.integers(0, width)), int(rng.integers(0, height))
+        x1, y1 = int(rng.integers(x0, width + 1)), int(rng.integers(y0, height + 1))
+        if trial % 4 == 0:
+            # 局部区域横跨整行（相邻行的游程需要合并）
+            x0, x1 = 0, width
+        roi = rng.random((y1 - y0, x1 - x0)) > rng.random()
+        mask = np.zeros((height, width), dtype=bool)
+        mask[y0:y1, x0:x1] = roi
+        expected = np.repeat(mask.ravel().astype(np.uint8) * 255, 4)
+
+        if not np.array_equal(decode_rle(mask_to_rle(mask)), expected):
+            errors.append(f"整幅mask编码解码不一致 (尺寸 {width}x{height})")
+            return
+        if roi_mask_to_rle(roi, x0, y0, width, height) != mask_to_rle(mask):
+            errors.append(f"局部区域编码与整幅编码不一致 (尺寸 {width}x{height})")
+            return
+
+    # 超过最大游程长度（65536个值）时拆分为多条记录
+    big = np.zeros((300, 400), dtype=bool)
+    big[100:250] = True
+    if not np.array_equal(decode_rle(mask_to_rle(big)), np.repeat(big.ravel().astype(np.uint8) * 255, 4)):
+        errors.append("长游程拆分后解码不一致")
+
+
+def check_prediction(errors: list):
+    from app.models.schemas import SegmentResult
+    from app.services.labelstudio_predictions import segment_result_to_prediction
+
+    def mask(polygon, rle=None):
+        return {
+            "polygon": [{"x": x, "y": y} for x, y in polygon],
+            "bbox": {"x1": 0, "y1": 0, "x2": 1, "y2": 1, "confidence": 0.8, "class_name": "scratch"},
+            "confidence": 0.8,
+            "class_name": "scratch",
+            "rle": rle,
+        }
+
+    result = SegmentResult(
+        image_path="memory", timestamp=datetime.now(), image_width=200, image_height=100,
+        masks=[mask([(0, 0), (200, 0), (100, 50)]), mask([(10, 10), (20, 20)])],
+    )
+    prediction = segment_result_to_prediction(result, 1, "polygonlabels")
+    if len(prediction["result"]) != 1:
+        errors.append(f"少于3个点的多边形应被跳过: {prediction['result']}")
+        return
+    item = prediction["result"][0]
+    if item["value"]["points"] != [[0.0, 0.0], [100.0, 0.0], [50.0, 50.0]]:
+        errors.append(f"多边形百分比坐标错误: {item['value']['points']}")
+    if (item["original_width"], item["original_height"]) != (200, 100):
+        errors.append("缺少原图尺寸")
+
+    brush = SegmentResult(
+        image_path="memory", timestamp=datetime.now(), image_width=200, image_height=100,
+        masks=[mask([], rle=[1, 2, 3])],
+    )
+    prediction = segment_result_to_prediction(brush, 1, "brushlabels")
+    value = prediction["result"][0]["value"] if prediction["result"] else {}
+    if value != {"format": "rle", "rle": [1, 2, 3], "brushlabels": ["scratch"]}:
+        errors.append(f"画笔标注格式错误: {value}")
+
+
+def main():
+    errors = []
+    check_rle(errors)
+    check_prediction(errors)
+    if errors:
+        for error in errors:
+            print(f"❌ {error}")
+        sys.exit(1)
+    print("✅ LabelStudio预测格式测试通过")
+
+
+if __name__ == "__main__":
+    main()
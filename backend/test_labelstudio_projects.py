@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+测试LabelStudio项目列表的分页与缓存
+用假的LabelStudio（httpx.MockTransport）检查：所有分页都被获取、TTL内不重复请求、
+过期后先返回旧列表并后台刷新、创建/删除项目后失效、带ETag的分页发送条件请求并复用304
+用法: python test_labelstudio_projects.py
+"""
+import asyncio
+import hashlib
+import json
+import sys
+import httpx
+
+
+class FakeLabelStudio:
+    """分页的 /api/projects/，响应带ETag，If-None-Match匹配时返回304"""
+
+    def __init__(self, num_projects: int):
+        self.projects = [{"id": i, "title": f"project {i}"} for i in range(1, num_projects + 1)]
+        self.next_id = num_projects + 1
+        self.requests = []
+        self.not_modified = 0
+
+    def handle(self, request: httpx.Request) -> httpx.Response:
+        path = request.url.path
+        if request.method == "GET" and path == "/api/projects/":
+            page = int(request.url.params.get("page", 1))
+            page_size = int(request.url.params.get("page_size", 100))
+            self.requests.append(page)
+            start = (page - 1) * page_size
+            if start >= len(self.projects) and page > 1:
+                return httpx.Response(404, json={"detail": "Invalid page."})
+            body = {
+                "count": len(self.projects),
+                "next": None if start + page_size >= len(self.projects) else f"?page={page + 1}",
+                "results": self.projects[start:start + page_size],
+            }
+            etag = '"' + hashlib.md5(json.dumps(body).encode()).hexdigest() + '"'
+            if request.headers.get("if-none-match") == etag:
+                self.not_modified += 1
+                return httpx.Response(304, headers={"ETag": etag})
+            return httpx.Response(200, json=body, headers={"ETag": etag})
+        if request.method == "POST" and path == "/api/projects/":
+            project = {"id": self.next_id, "title": json.loads(request.content)["title"]}
+            self.next_id += 1
+            self.projects.append(project)
+            return httpx.Response(201, json=project)
+        if request.method == "DELETE" and path.startswith("/api/projects/"):
+            project_id = int(path.rstrip("/").split("/")[-1])
+            self.projects = [p for p in self.projects if p["id"] != project_id]
+            return httpx.Response(204)
+        return httpx.Response(404, json={"detail": "not found"})
+
+
+async def run_checks() -> list:
+    from app.models.schemas import LabelStudioTaskCreate
+    from app.services import http_client, project_cache
+    from app.services.labelstudio_service import LabelStudioService
+
+    errors = []
+    fake = FakeLabelStudio(num_projects=250)
+    await http_client.start_http_client(transport=httpx.MockTransport(fake.handle))
+    cache = project_cache.ProjectListCache(ttl=0.3, stale_seconds=5)
+    project_cache._cache = cache
+    service = LabelStudioService()
+
+    # 1. 3页全部获取
+    projects = await service.get_projects()
+    if [p["id"] for p in projects] != list(range(1, 251)):
+        errors.append(f"应获取全部250个项目: {len(projects)}")
+    if sorted(fake.requests) != [1, 2, 3]:
+        errors.append(f"应请求3个分页: {fake.requests}")
+
+    # 2. TTL内使用缓存，并发请求不会重复获取
+    fake.requests.clear()
+    await asyncio.gather(*(service.get_projects() for _ in range(5)))
+    if fake.requests:
+        errors.append(f"TTL内不应请求LabelStudio: {fake.requests}")
+
+    # 3. 过期后立即返回旧列表，后台刷新时发送条件请求，所有分页都是304
+    await asyncio.sleep(0.35)
+    stale = await service.get_projects()
+    if stale is not projects:
+        errors.append("过期后应先返回旧列表")
+    await asyncio.sleep(0.05)
+    if sorted(fake.requests) != [1, 2, 3] or fake.not_modified != 3:
+        errors.append(f"后台刷新应发送3个条件请求并得到304: {fake.requests} 304={fake.not_modified}")
+
+    # 4. 创建和删除项目后失效
+    created = await service.create_project(LabelStudioTaskCreate(title="new"))
+    projects = await service.get_projects()
+    if projects[-1]["id"] != created["id"] or len(projects) != 251:
+        errors.append(f"创建项目后列表应包含新项目: {len(projects)}")
+    await service.delete_project(1)
+    projects = await service.get_projects()
+    if any(p["id"] == 1 for p in projects) or len(projects) != 250:
+        errors.append(f"删除项目后列表不应包含该项目: {len(projects)}")
+
+    stats = cache.get_stats()
+    if stats["hits"] != 5 or stats["stale_hits"] != 1:
+        errors.append(f"缓存统计不正确: {stats}")
+
+    await http_client.close_http_client()
+    project_cache._cache = None
+    return errors
+
+
+def main():
+    errors = asyncio.run(run_checks())
+    if errors:
+        for error in errors:
+            print(f"❌ {error}")
+        sys.exit(1)
+    print("✅ LabelStudio项目列表分页与缓存测试通过")
+
+
+if __name__ == "__main__":
+    main()
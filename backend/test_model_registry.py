@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+测试模型注册表的后台激活（不需要模型，使用假的模型加载函数）
+检查：连续激活两个模型、先请求的模型加载更慢时，最终激活的是后请求的模型，
+先请求的激活状态为superseded且它加载的模型不保留在注册表中；同步激活也会让进行中的后台激活失效
+用法: python test_model_registry.py
+"""
+import sys
+import time
+
+
+def fake_load_model(model_path: str, task: str = "detect"):
+    """假的模型加载函数：路径中包含slow的模型加载较慢"""
+    time.sleep(0.5 if "slow" in model_path else 0.05)
+    return lambda *args, **kwargs: []
+
+
+def wait_finished(registry, task: str, timeout: float = 10) -> dict:
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        status = registry.get_status()["activations"].get(task, {})
+        if status.get("state") != "loading":
+            return status
+        time.sleep(0.02)
+    return registry.get_status()["activations"].get(task, {})
+
+
+def run_checks() -> list:
+    import app.services.model_registry as model_registry
+    model_registry.load_model = fake_load_model
+    registry = model_registry.ModelRegistry(warmup_runs=0)
+    swaps = []
+    registry.add_swap_listener(lambda task, path: swaps.append(path))
+
+    errors = []
+    # 1. 先请求的模型加载更慢
+    first = registry.activate_in_background("detect", "slow.pt")
+    registry.activate_in_background("detect", "fast.pt")
+    wait_finished(registry, "detect")
+    time.sleep(0.8)
+    if registry.active_path("detect") != "fast.pt":
+        errors.append(f"应激活最后请求的模型: {registry.active_path('detect')}")
+    if swaps != ["fast.pt"]:
+        errors.append(f"过期的激活请求不应触发切换: {swaps}")
+    if first["state"] != "loading":
+        errors.append(f"激活请求返回时应为loading状态: {first}")
+    loaded = [m["model_path"] for m in registry.get_status()["loaded"]]
+    if "slow.pt" in loaded:
+        errors.append(f"过期的激活请求加载的模型不应保留: {loaded}")
+
+    # 2. 后台激活加载期间同步激活其他模型
+    registry.activate_in_background("segment", "slow-seg.pt")
+    registry.activate("segment", "sync-seg.pt")
+    time.sleep(0.8)
+    status = registry.get_status()["activations"]["segment"]
+    if registry.active_path("segment") != "sync-seg.pt" or status["state"] != "superseded":
+        errors.append(f"同步激活后过期的后台激活不应切换: {registry.active_path('segment')} {status}")
+    loaded = [m["model_path"] for m in registry.get_status()["loaded"]]
+    if "slow-seg.pt" in loaded:
+        errors.append(f"过期的后台激活加载的模型不应保留: {loaded}")
+    return errors
+
+
+def main():
+    errors = run_checks()
+    if errors:
+        for error in errors:
+            print(f"❌ {error}")
+        sys.exit(1)
+    print("✅ 模型注册表激活顺序测试通过")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+"""
+测试批量预标注任务（对本地的假LabelStudio，不需要模型和网络）
+检查：逐页处理并批量导入、导入失败后从检查点恢复且不重复导入（也不重复计数）、重启后恢复中断的任务、跳过已有预测的任务、
+每个任务同时只向推理执行器提交一批图片
+用法: python test_preannotation.py
+"""
+import asyncio
+import json
+import sys
+import tempfile
+from datetime import datetime
+from pathlib import Path
+import httpx
+
+
+class FakeLabelStudio:
+    """假LabelStudio：分页任务列表和批量导入预测接口，可以让第N次导入失败"""
+
+    def __init__(self, num_tasks: int, fail_import_calls=()):
+        self.tasks = [{"id": i + 1, "data": {"image": f"http://images/{i + 1}.jpg"}, "total_predictions": 0}
+                      for i in range(num_tasks)]
+        self.predictions = {}
+        self.import_calls = 0
+        self.fail_import_calls = set(fail_import_calls)
+
+    def handle(self, request: httpx.Request) -> httpx.Response:
+        path = request.url.path
+        if request.method == "GET" and path == "/api/tasks":
+            page = int(request.url.params["page"])
+            page_size = int(request.url.params["page_size"])
+            start = (page - 1) * page_size
+            if start >= len(self.tasks) and page > 1:
+                return httpx.Response(404, json={"detail": "Invalid page."})
+            page_tasks = []
+            for task in self.tasks[start:start + page_size]:
+                task = dict(task)
+                task["total_predictions"] = len(self.predictions.get(task["id"], []))
+                page_tasks.append(task)
+            return httpx.Response(200, json={"tasks": page_tasks, "total": len(self.tasks)})
+        if request.method == "POST" and path.endswith("/import/predictions"):
+            self.import_calls += 1
+            if self.import_calls in self.fail_import_calls:
+                return httpx.Response(500, json={"detail": "boom"})
+            for prediction in json.loads(request.content):
+                self.predictions.setdefault(prediction["task"], []).append(prediction)
+            return httpx.Response(201, json={"created": 1})
+        return httpx.Response(404, json={"detail": "not found"})
+
+
+def _result():
+    from datetime import datetime
+    from app.models.schemas import SegmentResult
+
+    mask = {
+        "polygon": [{"x": 0, "y": 0}, {"x": 10, "y": 0}, {"x": 10, "y": 10}],
+        "bbox": {"x1": 0, "y1": 0, "x2": 10, "y2": 10, "confidence": 0.9, "class_name": "scratch"},
+        "confidence": 0.9,
+        "class_name": "scratch",
+    }
+    return SegmentResult(image_path="fake", masks=[mask], timestamp=datetime.now(),
+                         image_width=20, image_height=20)
+
+
+async def fake_fetch(tasks):
+    return [task["data"]["image"] for task in tasks]
+
+
+segment_calls = {"active": 0, "max_active": 0, "max_batch": 0}
+
+
+async def fake_segment(images, conf_threshold, model_id, mask_format="polygon"):
+    segment_calls["active"] += 1
+    segment_calls["max_active"] = max(segment_calls["max_active"], segment_calls["active"])
+    segment_calls["max_batch"] = max(segment_calls["max_batch"], len(images))
+    await asyncio.sleep(0.01)
+    segment_calls["active"] -= 1
+    # 模拟一张图片分割失败
+    return [None if image.endswith("/7.jpg") else _result() for image in images]
+
+
+async def wait_job(service, job_id):
+    task = service.running.get(job_id)
+    if task is not None:
+        await asyncio.gather(task, return_exceptions=True)
+    return service.get_job(job_id)
+
+
+async def run_checks(jobs_file: Path) -> list:
+    from app.services import http_client
+    from app.services.preannotation_service import PreannotationService
+    from app.models.schemas import PreannotationJobCreate, PreannotationStatus
+
+    errors = []
+    fake = FakeLabelStudio(num_tasks=25, fail_import_calls={3})
+    await http_client.start_http_client(transport=httpx.MockTransport(fake.handle))
+
+    def _service():
+        return PreannotationService(jobs_file=jobs_file, fetch_images=fake_fetch,
+                                    segment=fake_segment, import_chunk=4, batch_size=4)
+
+    # 1. 第3次导入失败，任务失败并停在检查点
+    service = _service()
+    job = await service.create_job(1, PreannotationJobCreate(page_size=10))
+    job = await wait_job(service, job.id)
+    if job.status != PreannotationStatus.FAILED or job.next_page != 1:
+        errors.append(f"第3次导入失败时应停在第1页: {job.status} next_page={job.next_page}")
+
+    # 2. 恢复后完成，每个任务只有一个预测
+    job = await service.resume_job(job.id)
+    job = await wait_job(service, job.id)
+    if job.status != PreannotationStatus.COMPLETED:
+        errors.append(f"恢复后应完成: {job.status} {job.error}")
+    duplicated = [task_id for task_id, items in fake.predictions.items() if len(items) != 1]
+    if duplicated:
+        errors.append(f"任务被重复导入: {duplicated}")
+    if len(fake.predictions) != 24 or job.failed_tasks != 1:
+        errors.append(f"应导入24个预测(1个失败): {len(fake.predictions)} failed={job.failed_tasks}")
+    # 失败的那一页已导入的预测没有计数，恢复后这些任务计为跳过，不会重复计数
+    if job.predictions_imported + job.skipped_tasks != len(fake.predictions):
+        errors.append(f"预测计数不正确: imported={job.predictions_imported} skipped={job.skipped_tasks}")
+    if job.total_tasks != 25 or job.next_page != 4 or job.throughput <= 0:
+        errors.append(f"进度不正确: total={job.total_tasks} next_page={job.next_page} throughput={job.throughput}")
+    if segment_calls["max_active"] != 1 or segment_calls["max_batch"] != 4:
+        errors.append(f"每页应按批依次提交推理: {segment_calls}")
+
+    # 3. 模拟服务崩溃：任务文件中状态为running，新实例启动时从检查点恢复
+    fake.tasks.extend({"id": i, "data": {"image": f"http://images/{i}.jpg"}} for i in range(26, 31))
+    data = json.loads(jobs_file.read_text(encoding="utf-8"))
+    data[0].update(status="running", next_page=3, completed_at=None)
+    jobs_file.write_text(json.dumps(data), encoding="utf-8")
+    imports_before = fake.import_calls
+
+    service = _service()
+    resumed = await service.resume_interrupted()
+    job = await wait_job(service, resumed[0]) if resumed else None
+    if job is None or job.status != PreannotationStatus.COMPLETED:
+        errors.append(f"重启后应恢复并完成中断的任务: {job and job.status}")
+    elif len(fake.predictions) != 29 or any(len(items) != 1 for items in fake.predictions.values()):
+        errors.append(f"恢复后应只为新任务导入预测: {len(fake.predictions)}")
+    elif fake.import_calls - imports_before != 2:
+        errors.append(f"只应导入第3页中新增的任务: {fake.import_calls - imports_before} 次导入")
+
+    await http_client.close_http_client()
+    return errors
+
+
+def main():
+    with tempfile.TemporaryDirectory() as tmp:
+        errors = asyncio.run(run_checks(Path(tmp) / "jobs.json"))
+    if errors:
+        for error in errors:
+            print(f"❌ {error}")
+        sys.exit(1)
+    print("✅ 批量预标注任务测试通过")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+测试分割结果转紧凑数组（不需要模型）
+检查：有检测框但没有mask时（polygon/rle两种格式）不报错、多边形和RLE为空、build_segment_result跳过这些框；
+有mask时多边形换算回原图坐标；由数组直接生成的compact/msgpack列与由pydantic结果生成的一致（包括RLE）
+用法: python test_segment_arrays.py
+"""
+import sys
+from types import SimpleNamespace
+import numpy as np
+import torch
+
+
+class _Boxes:
+    def __init__(self, xyxy, conf, cls):
+        self.xyxy, self.conf, self.cls = xyxy, conf, cls
+
+    def __len__(self):
+        return len(self.conf)
+
+
+def make_result(num_boxes: int, with_masks: bool, orig_shape=(480, 640)):
+    """构造与ultralytics Results接口一致的假结果：检测框、可选的mask（推理输入尺寸640x640，上下各80像素填充）"""
+    xyxy = torch.tensor([[100.0 + 50 * i, 100.0, 200.0 + 50 * i, 200.0] for i in range(num_boxes)]).reshape(-1, 4)
+    boxes = _Boxes(xyxy, torch.full((num_boxes,), 0.9), torch.zeros(num_boxes))
+    masks = None
+    if with_masks:
+        data = torch.zeros((num_boxes, 640, 640))
+        for i in range(num_boxes):
+            x1, y1, x2, y2 = xyxy[i].int().tolist()
+            data[i, y1 + 80:y2 + 80, x1:x2] = 1
+        masks = SimpleNamespace(data=data)
+    return SimpleNamespace(boxes=boxes, masks=masks, orig_shape=orig_shape)
+
+
+def run_checks() -> list:
+    from app.services.yolo_service import YoloService
+
+    errors = []
+    names = {0: "defect"}
+
+    # 1. 有检测框但没有mask
+    for mask_format in ("polygon", "rle"):
+        try:
+            arrays = YoloService.extract_segmentation_arrays(make_result(2, False), mask_format=mask_format)
+        except Exception as e:
+            errors.append(f"没有mask时不应报错（{mask_format}）: {e!r}")
+            continue
+        if arrays["poly_xy"].shape != (0, 2) or arrays["poly_offsets"].tolist() != [0, 0, 0]:
+            errors.append(f"没有mask时多边形应为空（{mask_format}）: {arrays['poly_offsets']}")
+        if mask_format == "rle" and (arrays["rle_offsets"].tolist() != [0, 0, 0] or len(arrays["rle_bytes"])):
+            errors.append(f"没有mask时RLE应为空: {arrays['rle_offsets']}")
+        result = YoloService.build_segment_result("a.jpg", arrays, names)
+        if result.masks:
+            errors.append(f"没有mask的检测框不应输出（{mask_format}）: {len(result.masks)}")
+
+    # 2. 没有检测框
+    arrays = YoloService.extract_segmentation_arrays(make_result(0, False))
+    if arrays["poly_xy"].shape != (0, 2) or arrays["poly_offsets"].tolist() != [0]:
+        errors.append(f"没有检测框时结果应为空: {arrays}")
+
+    # 3. 有mask：多边形换算回原图坐标（去掉上下80像素的填充）
+    arrays = YoloService.extract_segmentation_arrays(make_result(2, True))
+    if arrays["poly_offsets"][-1] == 0:
+        errors.append("有mask时应提取多边形")
+    else:
+        first = arrays["poly_xy"][arrays["poly_offsets"][0]:arrays["poly_offsets"][1]]
+        lo, hi = first.min(axis=0), first.max(axis=0)
+        if not (np.allclose(lo, [100, 100], atol=2) and np.allclose(hi, [200, 200], atol=2)):
+            errors.append(f"多边形坐标换算错误: {lo} {hi}")
+
+    # 4. 数组直接生成的列与pydantic结果生成的列一致；RLE格式保留mask，没有mask的框被跳过
+    from app.services.result_encoding import arrays_to_columns, segment_to_columns, detection_to_columns
+    from app.services.yolo_service import ArrayResult
+    for mask_format in ("polygon", "rle"):
+        arrays = YoloService.extract_segmentation_arrays(make_result(3, True), mask_format=mask_format)
+        # 第2个框的mask为空（polygon格式去掉多边形，rle格式去掉RLE）
+        key, offsets_key = ("rle_bytes", "rle_offsets") if mask_format == "rle" else ("poly_xy", "poly_offsets")
+        offsets = arrays[offsets_key]
+        arrays[key] = np.concatenate([arrays[key][:offsets[1]], arrays[key][offsets[2]:]])
+        arrays[offsets_key] = np.concatenate([offsets[:2], offsets[2:] - (offsets[2] - offsets[1])])
+        result = ArrayResult("segment", "a.jpg", arrays, names)
+        for binary in (False, True):
+            columns = arrays_to_columns(result, binary)
+            expected = segment_to_columns(result.build(), binary)
+            columns.pop("timestamp"), expected.pop("timestamp")
+            if columns != expected:
+                diff = [k for k in set(columns) | set(expected) if columns.get(k) != expected.get(k)]
+                errors.append(f"数组生成的列与pydantic结果不一致（{mask_format}, binary={binary}）: {diff}")
+            if columns["count"] != 2 or (mask_format == "rle" and not columns.get("rle")):
+                errors.append(f"应输出2个mask（{mask_format}）: {columns['count']} {list(columns)}")
+    arrays = YoloService.extract_detection_arrays(make_result(3, False))
+    arrays["xyxy"][1, 0] = np.nan
+    result = ArrayResult("detect", "a.jpg", arrays, names)
+    columns, expected = arrays_to_columns(result), detection_to_columns(result.build())
+    columns.pop("timestamp"), expected.pop("timestamp")
+    if columns != expected or columns["count"] != 2:
+        errors.append(f"检测结果的列不一致: {columns} {expected}")
+    return errors
+
+
+def main():
+    errors = run_checks()
+    if errors:
+        for error in errors:
+            print(f"❌ {error}")
+        sys.exit(1)
+    print("✅ 分割结果转紧凑数组测试通过")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""
+测试LabelStudio批量导入任务（对本地的假LabelStudio，不需要网络）
+检查：按数量和大小分块、503自动重试、不可重试的错误停止任务、恢复时只发送未完成的分块、
+服务重启后恢复中断的任务，所有任务恰好导入一次
+用法: python test_task_import.py
+"""
+import asyncio
+import json
+import sys
+import tempfile
+from collections import Counter
+from pathlib import Path
+import httpx
+
+
+class FakeLabelStudio:
+    """假LabelStudio的任务导入接口：可以让某个分块失败一次（503）或一直失败（400），可以模拟慢请求"""
+
+    def __init__(self, fail_once=(), fail_always=(), delay: float = 0.0):
+        self.imported = Counter()
+        self.requests = []
+        self.fail_once = set(fail_once)
+        self.fail_always = set(fail_always)
+        self.delay = delay
+
+    async def handle(self, request: httpx.Request) -> httpx.Response:
+        if request.method == "POST" and request.url.path == "/api/projects/1/import":
+            tasks = json.loads(request.content)
+            first = tasks[0]["data"]["n"]
+            self.requests.append(first)
+            if self.delay:
+                await asyncio.sleep(self.delay)
+            if first in self.fail_once:
+                self.fail_once.discard(first)
+                return httpx.Response(503, json={"detail": "busy"})
+            if first in self.fail_always:
+                return httpx.Response(400, json={"detail": "bad task"})
+            for task in tasks:
+                self.imported[task["data"]["n"]] += 1
+            return httpx.Response(201, json={"task_count": len(tasks)})
+        return httpx.Response(404, json={"detail": "not found"})
+
+
+def make_tasks(count: int) -> list:
+    return [{"data": {"image": f"http://images/{n}.jpg", "n": n}} for n in range(count)]
+
+
+async def wait_job(service, job_id: str):
+    task = service.running.get(job_id)
+    if task is not None:
+        await task
+    return service.get_job(job_id)
+
+
+async def run_checks(tmp: Path) -> list:
+    from app.models.schemas import TaskImportJobCreate, TaskImportStatus
+    from app.services import http_client
+    from app.services.task_import_service import TaskImportService, split_chunks
+
+    errors = []
+
+    # 1. 分块：任务数和请求体大小两个限制
+    chunks = split_chunks(make_tasks(25), 10, 10 ** 6)
+    if chunks != [[0, 10], [10, 20], [20, 25]]:
+        errors.append(f"按数量分块错误: {chunks}")
+    big = [{"data": {"image": "x" * 400, "n": n}} for n in range(10)]
+    chunks = split_chunks(big, 100, 1000)
+    if len(chunks) != 5 or any(end - start != 2 for start, end in chunks):
+        errors.append(f"按大小分块错误: {chunks}")
+
+    def new_service():
+        return TaskImportService(jobs_file=tmp / "jobs.json", tasks_dir=tmp / "tasks", retry_backoff=0.01)
+
+    # 2. 第30个任务所在的分块503一次（自动重试），第60个所在的分块400（任务失败）
+    fake = FakeLabelStudio(fail_once={30}, fail_always={60})
+    await http_client.start_http_client(transport=httpx.MockTransport(fake.handle))
+    service = new_service()
+    job = await service.create_job(1, TaskImportJobCreate(tasks=make_tasks(95), chunk_size=10, concurrency=3))
+    job = await wait_job(service, job.id)
+    if job.status != TaskImportStatus.FAILED or job.failed_chunks != [6] or job.retries != 1:
+        errors.append(f"不可重试的错误应使任务失败: {job.status} failed={job.failed_chunks} retries={job.retries}")
+    if any(count != 1 for count in fake.imported.values()) or job.imported_tasks != len(fake.imported):
+        errors.append(f"已导入的数量不一致: {job.imported_tasks} {len(fake.imported)}")
+
+    # 3. 修复后恢复：只发送未完成的分块，全部任务恰好导入一次
+    fake.fail_always.clear()
+    sent_before = len(fake.requests)
+    done_before = len(job.completed_chunks)
+    job = await service.resume_job(job.id)
+    job = await wait_job(service, job.id)
+    if job.status != TaskImportStatus.COMPLETED or job.imported_tasks != 95:
+        errors.append(f"恢复后应完成: {job.status} {job.imported_tasks} {job.error}")
+    if len(fake.requests) - sent_before != 10 - done_before:
+        errors.append(f"恢复时应只发送未完成的分块: {fake.requests[sent_before:]}")
+    if sorted(fake.imported) != list(range(95)) or set(fake.imported.values()) != {1}:
+        errors.append("每个任务应恰好导入一次")
+    if (tmp / "tasks" / f"{job.id}.json").exists():
+        errors.append("完成后应删除保存的任务内容")
+
+    # 4. 服务关闭时中断，重新加载后恢复
+    await http_client.close_http_client()
+    fake = FakeLabelStudio(delay=0.02)
+    await http_client.start_http_client(transport=httpx.MockTransport(fake.handle))
+    service = new_service()
+    job = await service.create_job(1, TaskImportJobCreate(tasks=make_tasks(100), chunk_size=5, concurrency=2))
+    await asyncio.sleep(0.1)
+    await service.shutdown()
+    interrupted = service.get_job(job.id)
+    if interrupted.status != TaskImportStatus.RUNNING or not 0 < len(interrupted.completed_chunks) < 20:
+        errors.append(f"关闭时应保留检查点: {interrupted.status} {len(interrupted.completed_chunks)}")
+
+    restarted = new_service()
+    resumed = await restarted.resume_interrupted()
+    job = await wait_job(restarted, job.id)
+    if resumed != [job.id] or job.status != TaskImportStatus.COMPLETED or job.imported_tasks != 100:
+        errors.append(f"重启后应恢复并完成: {resumed} {job.status} {job.imported_tasks}")
+    if sorted(fake.imported) != list(range(100)) or set(fake.imported.values()) != {1}:
+        errors.append(f"重启恢复后每个任务应恰好导入一次: {Counter(fake.imported.values())}")
+
+    await http_client.close_http_client()
+    return errors
+
+
+def main():
+    with tempfile.TemporaryDirectory() as tmp:
+        errors = asyncio.run(run_checks(Path(tmp)))
+    if errors:
+        for error in errors:
+            print(f"❌ {error}")
+        sys.exit(1)
+    print("✅ LabelStudio批量导入任务测试通过")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+测试流式上传和数据集分块上传
+检查：图片/数据集/模型上传返回正确的大小和SHA-256、超出上限返回413且不留下文件（包括直接推理的上传接口）、
+SHA-256不一致时拒绝、分块上传的起始位置不一致时返回409和已接收字节数、断点续传后校验并完成、无效的上传ID返回404
+用法: python test_uploads.py
+"""
+import hashlib
+import io
+import sys
+import tempfile
+import zipfile
+from pathlib import Path
+
+
+def make_zip(size: int) -> bytes:
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_STORED) as zf:
+        zf.writestr("images/a.bin", bytes(range(256)) * (size // 256))
+    return buffer.getvalue()
+
+
+def run_checks(tmp: Path) -> list:
+    from fastapi.testclient import TestClient
+    from app.main import app
+    from app.api import model as model_api, training as training_api
+    from app.services import chunked_upload_service, file_service
+    from app.services.chunked_upload_service import ChunkedUploadService
+
+    errors = []
+    for name in ("uploads", "datasets", "models", "chunks"):
+        (tmp / name).mkdir()
+    file_service.UPLOAD_DIR = tmp / "uploads"
+    file_service.UPLOAD_CHUNK_SIZE_KB = 4
+    file_service.MAX_IMAGE_UPLOAD_MB = 0.01
+    training_api.TRAINING_DATA_DIR = tmp / "datasets"
+    model_api.service.model_dir = tmp / "models"
+    model_api.service.metadata_file = tmp / "models.json"
+    chunked_upload_service._service = ChunkedUploadService(tmp / "chunks", tmp / "datasets", max_bytes=10 ** 6)
+    client = TestClient(app)
+
+    # 1. 图片上传：返回大小和SHA-256；超出上限返回413，不留下文件
+    image = b"\x89PNG\r\n\x1a\n" + b"x" * 5000
+    response = client.post("/api/v1/upload", files={"file": ("a.png", image)})
+    body = response.json()
+    if response.status_code != 200 or body["size"] != len(image) or body["sha256"] != hashlib.sha256(image).hexdigest():
+        errors.append(f"图片上传结果错误: {response.status_code} {body}")
+    response = client.post("/api/v1/upload", files={"file": ("b.png", b"x" * 20000)})
+    if response.status_code != 413 or len(list((tmp / "uploads").iterdir())) != 1:
+        errors.append(f"超出上限应返回413且不保存: {response.status_code} {list((tmp / 'uploads').iterdir())}")
+
+    # 1b. 直接推理的上传接口同样受图片大小上限限制（在推理之前返回413）
+    for url in ("/api/v1/detect/upload", "/api/v1/segment/upload"):
+        response = client.post(url, files={"file": ("big.png", b"x" * 20000)})
+        if response.status_code != 413:
+            errors.append(f"{url} 超出上限应返回413: {response.status_code} {response.text[:200]}")
+
+    # 2. 数据集上传：SHA-256一致时保存，不一致时返回400且不留下文件
+    dataset = make_zip(50000)
+    digest = hashlib.sha256(dataset).hexdigest()
+    response = client.post(f"/api/v1/datasets/upload?sha256={digest}", files={"file": ("d.zip", dataset)})
+    if response.status_code != 200 or Path(response.json()["path"]).read_bytes() != dataset:
+        errors.append(f"数据集上传失败: {response.status_code} {response.text}")
+    response = client.post(f"/api/v1/datasets/upload?sha256={'0' * 64}", files={"file": ("e.zip", dataset)})
+    if response.status_code != 400 or len(list((tmp / "datasets").iterdir())) != 1:
+        errors.append(f"SHA-256不一致应返回400且不保存: {response.status_code}")
+
+    # 3. 模型上传：元数据中记录SHA-256
+    weights = b"model-weights" * 1000
+    response = client.post("/api/v1/models/upload?name=m", files={"file": ("m.pt", weights)})
+    model = response.json().get("model") or {}
+    if response.status_code != 200 or model.get("sha256") != hashlib.sha256(weights).hexdigest():
+        errors.append(f"模型上传结果错误: {response.status_code} {response.text}")
+
+    # 4. 分块上传：第二块起始位置错误时返回409和已接收的字节数，从该位置续传后完成
+    dataset = make_zip(100000)
+    digest = hashlib.sha256(dataset).hexdigest()
+    response = client.post("/api/v1/datasets/uploads", json={"filename": "big.zip", "size": len(dataset), "sha256": digest})
+    upload_id = response.json()["upload"]["id"]
+    client.put(f"/api/v1/datasets/uploads/{upload_id}?offset=0", content=dataset[:30000])
+    response = client.put(f"/api/v1/datasets/uploads/{upload_id}?offset=40000", content=dataset[40000:])
+    if response.status_code != 409 or response.json()["detail"]["offset"] != 30000:
+        errors.append(f"起始位置错误应返回409: {response.status_code} {response.text}")
+    offset = client.get(f"/api/v1/datasets/uploads/{upload_id}").json()["upload"]["offset"]
+    response = client.put(f"/api/v1/datasets/uploads/{upload_id}?offset={offset}", content=dataset[offset:])
+    upload = response.json().get("upload") or {}
+    if not upload.get("completed") or upload.get("sha256") != digest or Path(upload["path"]).read_bytes() != dataset:
+        errors.append(f"续传后应完成: {response.status_code} {response.text}")
+    if list((tmp / "chunks").glob("*.part")):
+        errors.append("完成后不应留下 .part 文件")
+
+    # 5. 分块上传超出声明大小返回413；内容不是ZIP时完成失败
+    response = client.post("/api/v1/datasets/uploads", json={"filename": "bad.zip", "size": 100})
+    upload_id = response.json()["upload"]["id"]
+    response = client.put(f"/api/v1/datasets/uploads/{upload_id}?offset=0", content=b"x" * 150)
+    if response.status_code != 413:
+        errors.append(f"超出声明大小应返回413: {response.status_code}")
+    response = client.put(f"/api/v1/datasets/uploads/{upload_id}?offset=0", content=b"x" * 100)
+    if response.status_code != 400 or client.get(f"/api/v1/datasets/uploads/{upload_id}").status_code != 404:
+        errors.append(f"不是ZIP时应拒绝并删除: {response.status_code} {response.text}")
+    # 无效或不存在的上传ID返回404，不会留下锁
+    service = chunked_upload_service.get_chunked_upload_service()
+    locks_before = len(service._locks)
+    for upload_id in ("not-a-uuid", "..%2Fx", "00000000-0000-0000-0000-000000000000"):
+        response = client.put(f"/api/v1/datasets/uploads/{upload_id}?offset=0", content=b"x")
+        if response.status_code != 404:
+            errors.append(f"无效的上传ID应返回404: {upload_id} {response.status_code}")
+    if len(service._locks) != locks_before:
+        errors.append(f"无效的上传ID不应创建锁: {len(service._locks)} {locks_before}")
+    response = client.post("/api/v1/datasets/uploads", json={"filename": "huge.zip", "size": 10 ** 7})
+    if response.status_code != 413:
+        errors.append(f"声明大小超出上限应返回413: {response.status_code}")
+
+    chunked_upload_service._service = None
+    return errors
+
+
+def main():
+    with tempfile.TemporaryDirectory() as tmp:
+        errors = run_checks(Path(tmp))
+    if errors:
+        for error in errors:
+            print(f"❌ {error}")
+        sys.exit(1)
+    print("✅ 流式上传与分块上传测试通过")
+
+
+if __name__ == "__main__":
+    main()